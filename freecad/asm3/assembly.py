@@ -1,5 +1,5 @@
-import os, traceback
-from collections import namedtuple,defaultdict
+import os, traceback, hashlib
+from collections import namedtuple,defaultdict,OrderedDict
 import FreeCAD, FreeCADGui, Part
 from PySide import QtCore, QtGui
 from . import utils, gui
@@ -219,7 +219,24 @@ def resolveAssembly(obj):
 Selection = namedtuple('AsmSelection',('Object','SubElementNames'))
 
 _IgnoredProperties = set(['VisibilityList','Visibility',
-    'Label','_LinkTouched'])
+    'Label','_LinkTouched','_SolverFingerprint'])
+
+def _fingerprintValue(v):
+    'Convert a value to a string that is stable across sessions'
+    if isinstance(v,float):
+        return '{:.9g}'.format(v)
+    if isinstance(v,FreeCAD.Placement):
+        return _fingerprintValue(tuple(v.Base)+v.Rotation.Q)
+    if isinstance(v,FreeCAD.Rotation):
+        return _fingerprintValue(v.Q)
+    if isinstance(v,FreeCAD.Vector):
+        return _fingerprintValue(tuple(v))
+    if isinstance(v,(list,tuple)):
+        return ','.join([_fingerprintValue(x) for x in v])
+    value = getattr(v,'Value',None)
+    if isinstance(value,float):
+        return _fingerprintValue(value)
+    return str(v)
 
 class AsmBase(object):
     def __init__(self):
@@ -1672,6 +1689,78 @@ class ViewProviderAsmElementSketch(ViewProviderAsmElement):
 ElementInfo = namedtuple('AsmElementInfo', ('Parent','SubnameRef','Part',
     'PartName','Placement','Object','Subname','Shape'))
 
+# (document name, object name, subname) -> (stamp, shape), in LRU order
+_ElementShapeCache = OrderedDict()
+_ElementShapeCacheSize = 1024
+
+def _getElementShapeStamp(obj,subname):
+    # The stamp identifies the owner object of the element, its accumulated
+    # transformation relative to 'obj' (without obj's own placement), and the
+    # revision of the owner's shape. It is much cheaper to obtain than the
+    # element shape itself.
+    sobj,mat = obj.getSubObject(subname,1,FreeCAD.Matrix(),False)
+    if not sobj:
+        return
+    linked = sobj.getLinkedObject(True)
+    shape = getattr(linked,'Shape',None)
+    return (sobj.Document.Name, sobj.Name, linked.Document.Name, linked.Name,
+            tuple(mat.A), shape.hashCode() if shape else None)
+
+def getCachedElementShape(obj,subname):
+    '''Return a copy of the element shape of obj.subname
+
+    Same as utils.getElementShape((obj,subname)), but with the result cached
+    document wide. The cache entry is validated by a stamp of the element owner
+    object, and is invalidated by checkElementShapeChange() on object change.
+    '''
+    try:
+        key = (obj.Document.Name,obj.Name,subname)
+        stamp = _getElementShapeStamp(obj,subname)
+    except Exception:
+        stamp = None
+    if stamp is None:
+        return utils.getElementShape((obj,subname))
+
+    entry = _ElementShapeCache.pop(key,None)
+    if entry and entry[0] == stamp:
+        _ElementShapeCache[key] = entry
+        return entry[1].copy(False)
+
+    shape = utils.getElementShape((obj,subname))
+    if not shape:
+        return shape
+    _ElementShapeCache[key] = (stamp,shape)
+    while len(_ElementShapeCache) > _ElementShapeCacheSize:
+        _ElementShapeCache.popitem(False)
+    return shape.copy(False)
+
+def clearElementShapeCache(doc=None):
+    '''Clear the cached element shapes of the given document, or all if None'''
+    if not doc:
+        _ElementShapeCache.clear()
+        return
+    name = doc if isinstance(doc,str) else doc.Name
+    for key in [ key for key in _ElementShapeCache if key[0]==name ]:
+        del _ElementShapeCache[key]
+
+def checkElementShapeChange(obj,prop):
+    '''Invalidate the element shape cache on object change
+
+    Placement changes are ignored here since the element shape is obtained
+    relative to its part, and any nested placement change is caught by the
+    cache stamp. So are changes to our own objects, which do not affect the
+    geometry of the parts.
+    '''
+    if not _ElementShapeCache \
+            or prop in _IgnoredProperties \
+            or prop in ('Placement','PlacementList') \
+            or isinstance(getattr(obj,'Proxy',None),AsmBase):
+        return
+    try:
+        clearElementShapeCache(obj.Document)
+    except Exception:
+        clearElementShapeCache()
+
 def getElementInfo(parent,subname,
         checkPlacement=False,shape=None,recursive=False):
     '''Return a named tuple containing the part object element information
@@ -1777,7 +1866,7 @@ def getElementInfo(parent,subname,
             # There are two states of an link array.
             if getLinkProperty(part[0],'ElementList'):
                 if not shape:
-                    shape=utils.getElementShape((part[1],subname))
+                    shape=getCachedElementShape(part[1],subname)
 
                 # a) The elements are expanded as individual objects, i.e
                 # when ElementList has members, then the moveable Placement
@@ -1791,7 +1880,7 @@ def getElementInfo(parent,subname,
                 plaList = getLinkProperty(part[0],'PlacementList',None,True)
                 if plaList:
                     if not shape:
-                        shape=utils.getElementShape((part[1],subname))
+                        shape=getCachedElementShape(part[1],subname)
                     # b) The elements are collapsed. Then the moveable Placement
                     # is stored inside link object's PlacementList property.
                     obj = part[1]
@@ -1822,7 +1911,7 @@ def getElementInfo(parent,subname,
             raise RuntimeError('part has no placement')
         subname = '.'.join(names[1:])
         if not shape:
-            shape = utils.getElementShape((part,subname))
+            shape = getCachedElementShape(part,subname)
         if not shape:
             raise RuntimeError('Failed to get geometry element from '
                 '{}.{}'.format(objName(part),subname))
@@ -2309,6 +2398,37 @@ def setPlacement(part,pla,purgeTouched=False):
         obj.purgeTouched()
 
 
+def setPlacements(items):
+    '''Batched setPlacement()
+
+    items: list of (part,placement)
+
+    The placements of the elements of the same link array are set with a
+    single property change.
+    '''
+    arrays = OrderedDict()
+    for part,pla in items:
+        if isinstance(part,tuple) and part[3]:
+            arrays.setdefault(part[0],{})[part[1]] = \
+                    part[0].Placement.inverse().multiply(pla)
+        else:
+            setPlacement(part,pla)
+    for obj,plas in arrays.items():
+        setLinkProperty(obj,'PlacementList',plas)
+
+def getPlacement(part):
+    ''' counterpart of setPlacement(), return the current placement of a part
+
+        part: obtained by AsmConstraint.getInfo().Part
+    '''
+    if not isinstance(part,tuple):
+        return part.Placement
+    if part[3]:
+        pla = getLinkProperty(part[0],'PlacementList',None,True)[part[1]]
+    else:
+        pla = part[2].Placement
+    return part[0].Placement.multiply(pla)
+
 def showPart(partGroup,part,show=True,purgeTouched=True):
     if not isinstance(part,tuple):
         parent = partGroup
@@ -2323,6 +2443,105 @@ def showPart(partGroup,part,show=True,purgeTouched=True):
         parent.purgeTouched()
 
 
+# Bucket size of the plane keys. It is much coarser than the tolerance of
+# isCoplanar(), and neighbor buckets are probed as well, so that coplanar
+# shapes never end up in unrelated buckets. The buckets only pre-filter the
+# shapes, which are always confirmed by isCoplanar().
+_PlaneKeyTolerance = 1e-3
+
+def _getPlaneKey(shape):
+    '''Return a hashable key of the quantized plane of a shape
+
+    The key consists of the quantized normal and offset of the plane. Returns
+    None if the shape does not have a unique plane.
+    '''
+    try:
+        pln = shape.findPlane()
+    except Exception:
+        pln = None
+    if not pln:
+        return
+    normal = FreeCAD.Vector(pln.Axis).normalize()
+    tol = _PlaneKeyTolerance
+    return tuple(int(round(v/tol)) for v in normal) + \
+            (int(round(normal.dot(pln.Position)/tol)),)
+
+_PlaneKeyOffsets = [ (a,b,c,d) for a in (-1,0,1) for b in (-1,0,1)
+                        for c in (-1,0,1) for d in (-1,0,1) ]
+
+def _getPlaneKeyNeighbors(key):
+    '''Return the keys of the buckets that may hold a plane coplanar with
+    the given key, including the ones of the reversed normal'''
+    ret = []
+    for k in (key, tuple(-v for v in key)):
+        ret += [ tuple(v+o for v,o in zip(k,offset))
+                    for offset in _PlaneKeyOffsets ]
+    return ret
+
+def _mergeCoplanarShapes(shapes):
+    '''Find coplanar shapes
+
+    Return a list with the index of the first shape coplanar with each shape
+    (or the shape's own index), the same as comparing each shape with all
+    the ones in front of it, but only calling isCoplanar() on the shapes
+    in the same or neighbor plane buckets.
+    '''
+    owners = list(range(len(shapes)))
+    buckets = defaultdict(list)
+    others = []
+    for i,shape in enumerate(shapes):
+        if not shape:
+            continue
+        key = _getPlaneKey(shape)
+        # shapes without a unique plane (e.g. a line) are checked against all
+        # the others
+        if key is None:
+            candidates = others + [j for b in buckets.values() for j in b]
+        else:
+            candidates = list(others)
+            for k in _getPlaneKeyNeighbors(key):
+                candidates += buckets.get(k,())
+        owner = None
+        for j in sorted(set(candidates)):
+            if shapes[j].isCoplanar(shape):
+                owner = j
+                break
+        if owner is not None:
+            owners[i] = owner
+        elif key is None:
+            others.append(i)
+        else:
+            buckets[key].append(i)
+    return owners
+
+class _PointGrid(object):
+    '''Grid hash of points for finding the coincident ones'''
+
+    def __init__(self,points,tol=1e-6):
+        self.tol = tol
+        self.points = points
+        self.cells = defaultdict(list)
+        for i,p in enumerate(points):
+            self.cells[self._cell(p)].append(i)
+
+    def _cell(self,p):
+        return (int(p.x//self.tol),int(p.y//self.tol),int(p.z//self.tol))
+
+    def find(self,p,exclude=None):
+        '''Return the smallest index of the point within tolerance of p'''
+        x,y,z = self._cell(p)
+        res = None
+        for dx in (-1,0,1):
+            for dy in (-1,0,1):
+                for dz in (-1,0,1):
+                    for i in self.cells.get((x+dx,y+dy,z+dz),()):
+                        if (res is None or i < res) and \
+                                (not exclude or not exclude[i]) and \
+                                p.distanceToPoint(self.points[i]) < self.tol:
+                            res = i
+        return res
+
+
 class ViewProviderAsmElementLink(ViewProviderAsmOnTop):
     def __init__(self,vobj):
         vobj.OverrideMaterial = True
@@ -2510,18 +2729,17 @@ class AsmConstraint(AsmGroup):
         poses = []
         infos = []
         elements = []
+        owners = _mergeCoplanarShapes(shapes)
+        for i,e in enumerate(children[1:]):
+            owner = owners[i]
+            if owner != i:
+                e2 = children[owner+1]
+                e2.Proxy.infos += e.Proxy.infos
+                e.Proxy.infos = []
         for i,e in enumerate(children[1:]):
             e.Proxy._refPla = None
-            shape = shapes[i]
-            if not shape:
+            if not shapes[i]:
                 continue
-            for j,e2 in enumerate(children[i+2:]):
-                shape2 = shapes[i+j+1]
-                if not shape2:
-                    continue
-                if shape.isCoplanar(shape2):
-                    e.Proxy.infos += e2.Proxy.infos
-                    e2.Proxy.infos = []
             for info in e.Proxy.infos:
                 elements.append(e.Proxy)
                 infos.append(info)
@@ -2596,54 +2814,48 @@ class AsmConstraint(AsmGroup):
         order = [None]*count
         prev = getattr(self,'prevOrder',[])
         distances = [10]*count
-        distMap = []
         finished = 0
         refPla = None
+        grid = _PointGrid(poses)
+        pos0s = []
 
         for i,info0 in enumerate(infos0):
             pos0 = info0.Placement.multVec(
                     utils.getElementPos(info0.Shape)-offset)
+            pos0s.append(pos0)
+            j = None
             if i<len(prev) and prev[i]<count:
                 j = prev[i]
-                if used[i]<0 and not order[j] and \
-                   pos0.distanceToPoint(poses[j]) < 1e-6:
-                    distances[i] = 0
-                    if not elements[i]._refPla:
-                        pla = infos[j].Placement.multiply(
-                                utils.getElementPlacement(infos[j].Shape))
-                        pla = pla.inverse().multiply(info.Placement)
-                        elements[i]._refPla = pla
-                        if not refPla:
-                            refPla = pla
-                    used[i] = j
-                    order[j] = info0
-                    finished += 1
-                    continue
-            for j,pos in enumerate(poses):
-                if order[j]:
-                    continue
-                d = pos0.distanceToPoint(pos)
-                if used[i]<0 and d < 1e-6:
-                    distances[i] = 0
-                    if not elements[i]._refPla:
-                        pla = infos[j].Placement.multiply(
-                                utils.getElementPlacement(infos[j].Shape))
-                        pla = pla.inverse().multiply(info.Placement)
-                        elements[i]._refPla = pla
-                        if not refPla:
-                            refPla = pla
-                    used[i] = j
-                    order[j] = info0
-                    finished += 1
-                    break
-                distMap.append((d,i,j))
+                if order[j] or pos0.distanceToPoint(poses[j]) >= 1e-6:
+                    j = None
+            if j is None:
+                j = grid.find(pos0,order)
+            if j is None:
+                continue
+            distances[i] = 0
+            if not elements[i]._refPla:
+                pla = infos[j].Placement.multiply(
+                        utils.getElementPlacement(infos[j].Shape))
+                pla = pla.inverse().multiply(info.Placement)
+                elements[i]._refPla = pla
+                if not refPla:
+                    refPla = pla
+            used[i] = j
+            order[j] = info0
+            finished += 1
 
         count -= finished
         if count:
+            # Pair the remaining instances with the closest free elements.
+            # Only the unmatched ones are considered here, which are normally
+            # a few instances that are out of place.
+            distMap = []
+            free = [j for j in range(len(poses)) if not order[j]]
+            for i,pos0 in enumerate(pos0s):
+                if used[i]<0:
+                    for j in free:
+                        distMap.append((pos0.distanceToPoint(poses[j]),i,j))
             distMap.sort()
-            #  logger.debug('distance map: {}',len(distMap))
-            #  for d in distMap:
-            #      logger.debug(d)
             for d,i,j in distMap:
                 if used[i]>=0 or order[j]:
                     continue
@@ -3905,6 +4117,34 @@ BuildShapeCommon = 'Common'
 BuildShapeNames = (BuildShapeNone,BuildShapeCompound,
         BuildShapeFuse,BuildShapeCut,BuildShapeCommon)
 
+class _FingerprintObserver(object):
+    '''Document observer storing the solver fingerprint of the assemblies
+    solved since the last save
+
+    The fingerprint is skipped if the document has any touched object, as
+    the assembly may then have been changed after solving.
+    '''
+    _instance = None
+
+    @classmethod
+    def attach(cls):
+        if not cls._instance:
+            cls._instance = cls()
+            FreeCAD.addDocumentObserver(cls._instance)
+
+    def slotStartSaveDocument(self,doc,_label):
+        touched = None
+        for obj in doc.Objects:
+            if not isTypeOf(obj,Assembly) or \
+               not getattr(obj.Proxy,'fingerprintPending',False):
+                continue
+            if touched is None:
+                touched = any('Touched' in o.State for o in doc.Objects)
+            if touched:
+                obj.Proxy.fingerprintPending = False
+            else:
+                obj.Proxy.storeFingerprint()
+
 class Assembly(AsmGroup):
     _Busy = False
     _PartMap = {} # maps part to assembly
@@ -3912,6 +4152,8 @@ class Assembly(AsmGroup):
     _ScheduleTimer = QtCore.QTimer()
     _PendingReload = defaultdict(set)
     _PendingSolve = False
+    _DirtyAssemblies = set() # None means solving all assemblies
+    _ShapeSerial = 0
 
     def __init__(self):
         self.parts = set()
@@ -3919,6 +4161,7 @@ class Assembly(AsmGroup):
         self.constraints = None
         self.frozen = False
         self.deleting = False
+        self.restored = False
         super(Assembly,self).__init__()
 
     def getSubObjects(self,obj,reason):
@@ -3952,10 +4195,13 @@ class Assembly(AsmGroup):
         self.constraints = None
 
         self.buildShape()
-        System.touch(obj)
+        if not self.checkRestored():
+            System.touch(obj)
+            self.fingerprintPending = False
         obj.ViewObject.Proxy.onExecute()
 
         # collect the part objects of this assembly
+        shapes = []
         for cstr in self.getConstraints():
             for element in cstr.Proxy.getElements():
                 info = element.Proxy.getInfo()
@@ -3964,6 +4210,11 @@ class Assembly(AsmGroup):
                     parts.add(info.Part[0])
                 else:
                     parts.add(info.Part)
+                for info in element.Proxy.getInfo(expand=True):
+                    shapes.append(info.Shape)
+
+        # classify the element shapes up front for the solver
+        utils.prefetchElementFeatures(shapes)
 
         # Update the global part object list for auto solving
         #
@@ -3980,6 +4231,71 @@ class Assembly(AsmGroup):
 
         return False # return False to call LinkBaseExtension::execute()
 
+    def getFingerprint(self):
+        '''Return a fingerprint of everything affecting the solving result
+
+        It covers the solver type, the type, element references and property
+        values of all constraints, and the placements of the referenced parts
+        and elements.
+        '''
+        obj = self.Object
+        items = [System.getTypeName(obj)]
+        for cstr in self.getConstraints():
+            items.append(cstr.Name)
+            items.append(Constraint.getTypeName(cstr))
+            items += [_fingerprintValue(v) for v in
+                    Constraint.getType(cstr).getPropertyValues(cstr)]
+            for element in cstr.Proxy.getElements():
+                for info in element.Proxy.getInfo(expand=True):
+                    items.append(info.PartName)
+                    items.append(info.Subname)
+                    items.append(_fingerprintValue(info.Placement))
+                    items.append(_fingerprintValue(
+                        utils.getElementPlacement(info.Shape)))
+        return hashlib.sha1(repr(items).encode('utf8')).hexdigest()
+
+    def markSolved(self):
+        '''Mark the assembly as solved
+
+        The fingerprint is only computed when the document is saved, see
+        _FingerprintObserver.
+        '''
+        self.fingerprintPending = True
+        _FingerprintObserver.attach()
+
+    def storeFingerprint(self):
+        '''Store the fingerprint of the solved assembly with the document'''
+        self.fingerprintPending = False
+        obj = self.Object
+        try:
+            fingerprint = self.getFingerprint()
+        except Exception as e:
+            logger.debug('failed to get fingerprint of {}: {}',objName(obj),e)
+            fingerprint = ''
+        if obj._SolverFingerprint != fingerprint:
+            obj._SolverFingerprint = fingerprint
+
+    def checkRestored(self):
+        '''Check if a restored assembly is unchanged since it was last solved
+
+        Only the first call after restore does the check.
+        '''
+        if not self.restored:
+            return False
+        self.restored = False
+        fingerprint = getattr(self.Object,'_SolverFingerprint','')
+        if not fingerprint:
+            return False
+        try:
+            if fingerprint != self.getFingerprint():
+                return False
+        except Exception as e:
+            logger.debug('failed to check fingerprint of {}: {}',
+                    objName(self.Object),e)
+            return False
+        logger.debug('skip solving unchanged assembly {}',objName(self.Object))
+        return True
+
     @classmethod
     def canAutoSolve(cls):
         from . import solver
@@ -4018,16 +4334,26 @@ class Assembly(AsmGroup):
             except Exception:
                 del partMap[obj]
             else:
-                cls.autoSolve(obj,prop,True)
+                cls.autoSolve(obj,prop,True,assembly.Object)
 
     @classmethod
-    def autoSolve(cls,obj,prop,force=False):
+    def autoSolve(cls,obj,prop,force=False,assembly=None):
+        '''Schedule auto solving
+
+        assembly: the assembly object affected by the change. If not given,
+                  all assemblies of the active document will be solved.
+        '''
         if obj.Document and getattr(obj.Document,'Transacting',False):
             cls.cancelAutoSolve()
             return
-        if not force and cls._PendingSolve:
-            return
         if force or cls.canAutoSolve():
+            if cls._DirtyAssemblies is not None:
+                if assembly is None:
+                    cls._DirtyAssemblies = None
+                else:
+                    cls._DirtyAssemblies.add(assembly)
+            if not force and cls._PendingSolve:
+                return
             logger.debug('auto solve scheduled on change of {}.{}',
                 objName(obj),prop,frame=1)
             cls._PendingSolve = True
@@ -4036,6 +4362,33 @@ class Assembly(AsmGroup):
     def cancelAutoSolve(cls):
         logger.debug('cancel auto solve',frame=1)
         cls._PendingSolve = False
+        cls._DirtyAssemblies = set()
+
+    @classmethod
+    def getDirtyAssemblies(cls):
+        '''Return the assemblies scheduled for auto solving, including the
+        ones depending on them, sorted in dependency order
+
+        Return None if all assemblies need to be solved.
+        '''
+        if cls._DirtyAssemblies is None:
+            return
+        dependents = {}
+        for obj in cls._DirtyAssemblies:
+            try:
+                objs = [obj] + obj.InListRecursive
+            except Exception:
+                # deleted object
+                continue
+            for o in objs:
+                if o not in dependents and isTypeOf(o,Assembly):
+                    dependents[o] = set(o.InListRecursive)
+        # An assembly depending on another one has strictly fewer dependents
+        # in the set, so sorting by count gives a topological order.
+        assemblies = list(dependents)
+        assemblies.sort(key=lambda o: -len(dependents[o].intersection(
+                                                dependents)))
+        return assemblies
 
     @classmethod
     def doAutoSolve(cls):
@@ -4046,12 +4399,17 @@ class Assembly(AsmGroup):
             cls._PendingSolve = canSolve
             return
 
+        assemblies = cls.getDirtyAssemblies()
         cls.cancelAutoSolve()
 
         from . import solver
         logger.debug('start solving...')
-        logger.catch('solver exception when auto recompute',
-                solver.solve, FreeCAD.ActiveDocument.Objects, True)
+        if assemblies is None:
+            logger.catch('solver exception when auto recompute',
+                    solver.solve, FreeCAD.ActiveDocument.Objects, True)
+        elif assemblies:
+            logger.catch('solver exception when auto recompute',
+                    solver.solve, assemblies, False)
         logger.debug('done solving')
 
     @classmethod
@@ -4182,7 +4540,7 @@ class Assembly(AsmGroup):
             solids = Part.getShape(group[0]).Solids
             if solids:
                 if len(solids)>1 and obj.BuildShape!=BuildShapeFuse:
-                    shapes.append(solids[0].fuse(solids[1:]))
+                    shapes.append(solids)
                 else:
                     shapes += solids
                 group = group[1:]
@@ -4195,20 +4553,65 @@ class Assembly(AsmGroup):
                         shapes += shape.Solids
                     else:
                         shapes += shape
-        if not shapes:
+
+        if obj.BuildShape not in (BuildShapeFuse,BuildShapeCut,
+                BuildShapeCommon) or not getattr(obj,'IncrementalShape',False):
+            self.shapeIds = {}
+            self.shapeCache = {}
+            shapes = [ s[0].fuse(s[1:]) if isinstance(s,list) else s
+                        for s in shapes ]
+            if not shapes:
+                raise RuntimeError('No shape found in parts')
+            if len(shapes) == 1:
+                # hide shape placement, and get element mapping
+                shape = Part.makeCompound(shapes)
+            elif obj.BuildShape == BuildShapeFuse:
+                shape = shapes[0].fuse(shapes[1:])
+            elif obj.BuildShape == BuildShapeCut:
+                shape = shapes[0].cut(shapes[1:])
+            elif obj.BuildShape == BuildShapeCommon:
+                shape = shapes[0].common(shapes[1:])
+            else:
+                shape = Part.makeCompound(shapes)
+            self._setBuiltShape(shape)
+            return
+
+        ids = {}
+        cache = {}
+        items = []
+        for shape in shapes:
+            if isinstance(shape,list):
+                item = self._fuseShapes(
+                        [self._getShapeItem(s,ids) for s in shape],cache)
+            else:
+                item = self._getShapeItem(shape,ids)
+            items.append(item)
+
+        if not items:
             raise RuntimeError('No shape found in parts')
-        if len(shapes) == 1:
-            # hide shape placement, and get element mapping
-            shape = Part.makeCompound(shapes)
+        if len(items) == 1:
+            shape = Part.makeCompound([items[0][1]])
         elif obj.BuildShape == BuildShapeFuse:
-            shape = shapes[0].fuse(shapes[1:])
-        elif obj.BuildShape == BuildShapeCut:
-            shape = shapes[0].cut(shapes[1:])
-        elif obj.BuildShape == BuildShapeCommon:
-            shape = shapes[0].common(shapes[1:])
+            shape = self._fuseShapes(items,cache)[1]
         else:
-            shape = Part.makeCompound(shapes)
+            tool = self._fuseShapes(items[1:],cache)
+            key = (obj.BuildShape,items[0][0],tool[0])
+            shape = self.shapeCache.get(key,None)
+            if shape is None:
+                if obj.BuildShape == BuildShapeCut:
+                    shape = items[0][1].cut(tool[1])
+                else:
+                    shape = items[0][1].common(tool[1])
+            cache[key] = shape
+
+        # only keep the shapes of this build for the next one
+        self.shapeIds = ids
+        self.shapeCache = cache
+        self._setBuiltShape(shape)
 
+    def _setBuiltShape(self,shape):
+        obj = self.Object
+        partGroup = self.getPartGroup()
         try:
             partGroup.setPropertyStatus('Shape', 'Output')
             if obj.Freeze or obj.BuildShape!=BuildShapeCompound:
@@ -4224,6 +4627,48 @@ class Assembly(AsmGroup):
         shape.Placement = obj.Placement
         obj.Shape = shape
 
+    def _getShapeItem(self,shape,ids):
+        '''Return (id,shape) with an id identifying the shape geometry
+
+        The id is reused as long as the shape of a part has not changed, i.e.
+        same hash code and equal to the cached shape.
+        '''
+        key = (shape.hashCode(),shape.Orientation)
+        item = ids.get(key,None) or self.shapeIds.get(key,None)
+        if not item or not item[1].isEqual(shape):
+            Assembly._ShapeSerial += 1
+            item = (Assembly._ShapeSerial,shape)
+        ids[key] = item
+        return item
+
+    _FuseChunkSize = 8
+
+    def _fuseShapes(self,items,cache):
+        '''Fuse a list of (id,shape) using a cached balanced fuse tree
+
+        Each tree node is cached by the ids of its leaves, so that only the
+        branches containing a changed part shape are fused again. The leaves
+        are chunks of up to _FuseChunkSize shapes fused by a single general
+        fuse.
+
+        Return (key,shape) of the fused shape.
+        '''
+        if len(items) == 1:
+            return items[0]
+        key = tuple([item[0] for item in items])
+        shape = cache.get(key,None)
+        if shape is None:
+            shape = self.shapeCache.get(key,None)
+        if shape is None and len(items) <= self._FuseChunkSize:
+            shape = items[0][1].fuse([item[1] for item in items[1:]])
+        elif shape is None:
+            mid = len(items)//2
+            left = self._fuseShapes(items[:mid],cache)[1]
+            right = self._fuseShapes(items[mid:],cache)[1]
+            shape = left.fuse(right)
+        cache[key] = shape
+        return key,shape
+
     def attach(self, obj):
         obj.addProperty("App::PropertyEnumeration","BuildShape","Base",'')
         obj.addProperty("App::PropertyInteger","_Version","Base",'')
@@ -4232,9 +4677,16 @@ class Assembly(AsmGroup):
         obj.BuildShape = BuildShapeNames
         super(Assembly,self).attach(obj)
 
+    def onDocumentRestored(self,obj):
+        self.restored = True
+        super(Assembly,self).onDocumentRestored(obj)
+
     def linkSetup(self,obj):
         self.parts = set()
         self.partArrays = set()
+        self.shapeIds = {}
+        self.shapeCache = {}
+        self.fingerprintPending = False
         obj.configLinkProperty('Placement')
         if not hasProperty(obj,'ColoredElements'):
             obj.addProperty("App::PropertyLinkSubHidden",
@@ -4244,6 +4696,17 @@ class Assembly(AsmGroup):
         if not hasProperty(obj,'Freeze'):
             obj.addProperty('App::PropertyBool','Freeze','Base','')
         obj.setPropertyStatus('Freeze','PartialTrigger')
+        if not hasProperty(obj,'IncrementalShape'):
+            obj.addProperty('App::PropertyBool','IncrementalShape','Base',
+                'Build the Fuse/Cut/Common shape with a cached fuse tree, and\n'
+                'only redo the branches of the changed parts. The resulting\n'
+                'topology and element names differ from a single general\n'
+                'boolean operation, so element references to the assembly\n'
+                'shape may break when this is toggled.')
+        if not hasProperty(obj,'_SolverFingerprint'):
+            obj.addProperty('App::PropertyString',
+                    '_SolverFingerprint','Base','')
+        obj.setPropertyStatus('_SolverFingerprint',('Hidden','Output'))
         super(Assembly,self).linkSetup(obj)
         obj.setPropertyStatus('Group','-Output')
         System.attach(obj)
@@ -0,0 +1,342 @@
+'''
+Headless solver benchmark
+
+Build synthetic assemblies of parametric sizes, solve them with the available
+solver backends, and record the time spent in each solving phase. Run it with
+FreeCADCmd, e.g.
+
+    FreeCADCmd -c "from freecad.asm3 import benchmark; benchmark.main()"
+
+or with arguments,
+
+    FreeCADCmd -c "from freecad.asm3 import benchmark; \\
+        benchmark.main(['--sizes','8,32,128','--output','bench.json'])"
+
+The results are written as a JSON list of records, one for each
+(generator, size, backend, run) combination, with the following fields,
+
+    generator: name of the assembly generator
+    size: the requested size of the assembly, i.e. number of parts
+    backend: solver backend name
+    run: repeat index
+    parts: number of parts in the assembly
+    constraints: number of constraints in the assembly
+    phases: phase name -> seconds
+    calls: phase name -> number of calls
+    counters: solver counters, see solver.SolverProfile
+    error: error message if the solving failed, or None
+
+The recorded phases are
+
+    build: creation of the assembly document objects
+    recompute: document recompute before and after solving
+    getFixedParts: fixed part detection and rigid constraint propagation
+    clusters: splitting of independent constraint clusters
+    prepare.<type>: Constraint.prepare() of each constraint type
+    solve: numerical solving in the backend
+    update: placement write-back
+    total: the whole solver call
+'''
+
+import sys, time, json, math, random, platform, argparse
+from collections import defaultdict, OrderedDict
+import FreeCAD, FreeCADGui, Part
+from .FCADLogger import FCADLogger
+from .utils import rootlogger
+logger = FCADLogger('asm3.bench',parent=rootlogger)
+
+_timer = getattr(time,'perf_counter',time.time)
+
+def setup():
+    '''Prepare FreeCAD for running without the main window'''
+    if not FreeCAD.GuiUp:
+        # View providers are required by our document objects
+        FreeCADGui.setupWithoutGUI()
+    for name in ('sys_slvs','sys_numpy','sys_sympy'):
+        try:
+            __import__('freecad.asm3.'+name)
+        except ImportError as e:
+            logger.warn('failed to import {}: {}',name,e)
+
+def getBackends():
+    from .system import System
+    return [ name for name in System.getInfo().TypeNames if name!='None' ]
+
+class PhaseTimer(object):
+    '''Accumulate the time and number of calls of named phases'''
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    def add(self,name,t):
+        self.times[name] += t
+        self.calls[name] += 1
+
+    def merge(self,profile):
+        '''Merge a solver.SolverProfile'''
+        for name,(t,calls) in profile.phases.items():
+            self.times[name] += t
+            self.calls[name] += calls
+        for name,n in profile.counters.items():
+            self.counters[name] += n
+
+    def call(self,name,func,*args,**kargs):
+        t = _timer()
+        try:
+            return func(*args,**kargs)
+        finally:
+            self.add(name,_timer()-t)
+
+def _addPart(partGroup,obj):
+    partGroup.setLink({-1:obj})
+    return obj
+
+def _addBox(partGroup,name='Box',size=10.0):
+    obj = partGroup.Document.addObject('Part::Box',name)
+    obj.Length = obj.Width = obj.Height = size
+    return _addPart(partGroup,obj)
+
+def _addConstraint(assembly,typeName,elements,**props):
+    from .assembly import AsmConstraint
+    from .constraint import Constraint
+    partGroup = assembly.Proxy.getPartGroup()
+    sel = AsmConstraint.Selection(SelObject=None,
+                                  SelSubname=None,
+                                  Assembly=assembly,
+                                  Constraint=None,
+                                  Elements=[(partGroup,'{}.{}'.format(
+                                      obj.Name,sub)) for obj,sub in elements])
+    cstr = AsmConstraint.make(Constraint.getType(typeName)._id,sel,undo=False)
+    for key,value in props.items():
+        setattr(cstr,key,value)
+    return cstr
+
+def _lock(assembly,obj,sub='Face5'):
+    return _addConstraint(assembly,'Locked',[(obj,sub)])
+
+def _perturb(parts,rng,scale):
+    for obj in parts:
+        pla = obj.Placement
+        pla.Base += FreeCAD.Vector(rng.uniform(-scale,scale),
+                                   rng.uniform(-scale,scale),
+                                   rng.uniform(-scale,scale))
+        pla.Rotation = pla.Rotation.multiply(FreeCAD.Rotation(
+            rng.uniform(-10,10),rng.uniform(-10,10),rng.uniform(-10,10)))
+        obj.Placement = pla
+
+def makeChain(assembly,size,rng):
+    '''A chain of boxes stacked by individual PlaneCoincident constraints'''
+    partGroup = assembly.Proxy.getPartGroup()
+    boxes = [_addBox(partGroup) for _ in range(size)]
+    _lock(assembly,boxes[0])
+    for prev,box in zip(boxes,boxes[1:]):
+        _addConstraint(assembly,'PlaneCoincident',
+                [(prev,'Face6'),(box,'Face5')])
+    _perturb(boxes[1:],rng,5.0)
+
+def makeTree(assembly,size,rng):
+    '''A binary tree of boxes, with the children attached to either the X or
+    Y side of their parents'''
+    partGroup = assembly.Proxy.getPartGroup()
+    boxes = [_addBox(partGroup) for _ in range(size)]
+    _lock(assembly,boxes[0])
+    for i,box in enumerate(boxes[1:],1):
+        parent = boxes[(i-1)//2]
+        if i%2:
+            elements = [(parent,'Face2'),(box,'Face1')]
+        else:
+            elements = [(parent,'Face4'),(box,'Face3')]
+        _addConstraint(assembly,'PlaneCoincident',elements)
+    _perturb(boxes[1:],rng,5.0)
+
+def makeGrid(assembly,size,rng):
+    '''A square grid of boxes, each constrained to its left and lower
+    neighbour, which forms closed loops'''
+    partGroup = assembly.Proxy.getPartGroup()
+    cols = int(math.ceil(math.sqrt(size)))
+    boxes = [_addBox(partGroup) for _ in range(size)]
+    _lock(assembly,boxes[0])
+    for i,box in enumerate(boxes):
+        if i%cols:
+            _addConstraint(assembly,'PlaneCoincident',
+                    [(boxes[i-1],'Face2'),(box,'Face1')])
+        if i>=cols:
+            _addConstraint(assembly,'PlaneCoincident',
+                    [(boxes[i-cols],'Face4'),(box,'Face3')])
+    _perturb(boxes[1:],rng,5.0)
+
+def _findCircularEdge(shape,radius,z):
+    for i,edge in enumerate(shape.Edges):
+        curve = getattr(edge,'Curve',None)
+        if isinstance(curve,Part.Circle) \
+                and abs(curve.Radius-radius)<1e-7 \
+                and abs(curve.Center.z-z)<1e-7:
+            return 'Edge{}'.format(i+1)
+    raise RuntimeError('circular edge not found')
+
+def makeArray(assembly,size,rng):
+    '''A plate with a row of holes, and a collapsed link array of pins placed
+    on the holes with a multiplied PlaneCoincident constraint'''
+    from .assembly import setLinkProperty
+    doc = assembly.Document
+    partGroup = assembly.Proxy.getPartGroup()
+    radius = 2.0
+    pitch = 10.0
+    thickness = 5.0
+
+    shape = Part.makeBox(pitch*size,pitch,thickness)
+    for i in range(size):
+        shape = shape.cut(Part.makeCylinder(radius,thickness,
+            FreeCAD.Vector(pitch*(i+0.5),pitch*0.5,0)))
+    plate = doc.addObject('Part::Feature','Plate')
+    plate.Shape = shape
+    _addPart(partGroup,plate)
+
+    pin = doc.addObject('Part::Cylinder','Pin')
+    pin.Radius = radius
+    pin.Height = pitch
+    pin.recompute()
+    pin.Visibility = False
+    pins = doc.addObject('App::Link','Pins')
+    pins.setLink(pin)
+    setLinkProperty(pins,'ShowElement',False)
+    setLinkProperty(pins,'ElementCount',1)
+    _addPart(partGroup,pins)
+
+    _lock(assembly,plate)
+    cstr = _addConstraint(assembly,'PlaneCoincident',
+            [(pins,'0.'+_findCircularEdge(pin.Shape,radius,0)),
+             (plate,_findCircularEdge(plate.Shape,radius,thickness))])
+    cstr.recompute(True)
+    for element in cstr.Proxy.getElements()[1:]:
+        element.Proxy.setLink(partGroup,
+                element.Proxy.getElementSubname(True),multiply=True)
+    cstr.Multiply = True
+    setLinkProperty(pins,'ElementCount',size)
+
+    plaList = [ FreeCAD.Placement(FreeCAD.Vector(rng.uniform(-5,5),
+                                                 rng.uniform(-5,5),
+                                                 rng.uniform(-5,5)),
+                                  FreeCAD.Rotation())
+                for _ in range(size) ]
+    setLinkProperty(pins,'PlacementList',plaList)
+
+def makeCascade(assembly,size,rng):
+    '''A stack of boxes using a single cascading PlaneCoincident constraint'''
+    partGroup = assembly.Proxy.getPartGroup()
+    boxes = [_addBox(partGroup) for _ in range(size)]
+    _lock(assembly,boxes[0])
+    elements = [(boxes[0],'Face6')]
+    for box in boxes[1:]:
+        elements += [(box,'Face5'),(box,'Face6')]
+    _addConstraint(assembly,'PlaneCoincident',elements[:-1],Cascade=True)
+    _perturb(boxes[1:],rng,5.0)
+
+Generators = OrderedDict((
+    ('chain',makeChain),
+    ('tree',makeTree),
+    ('grid',makeGrid),
+    ('array',makeArray),
+    ('cascade',makeCascade),
+))
+
+def run(generator,size,backend,seed=0,run=0):
+    '''Build and solve one synthetic assembly, and return the result record'''
+    from .assembly import Assembly, flattenGroup
+    from .system import System
+    from . import solver
+
+    timer = PhaseTimer()
+    record = OrderedDict((
+        ('generator',generator),
+        ('size',size),
+        ('backend',backend),
+        ('run',run),
+        ('parts',0),
+        ('constraints',0),
+        ('phases',timer.times),
+        ('calls',timer.calls),
+        ('counters',timer.counters),
+        ('error',None),
+    ))
+    doc = FreeCAD.newDocument('Asm3Bench')
+    try:
+        t = _timer()
+        assembly = Assembly.make(doc,undo=False)
+        System.setTypeName(assembly,backend)
+        Generators[generator](assembly,size,random.Random(seed+run))
+        timer.add('build',_timer()-t)
+
+        record['parts'] = len(flattenGroup(assembly.Proxy.getPartGroup()))
+        record['constraints'] = len(assembly.Proxy.getConstraints())
+
+        timer.call('recompute',doc.recompute)
+        timer.call('total',solver.solve,assembly,
+                recompute=False,profile=True)
+        for profile in solver._LastProfiles:
+            timer.merge(profile)
+        timer.call('recompute',assembly.recompute,True)
+    except Exception as e:
+        logger.error('{} {} {}: {}',generator,size,backend,e)
+        record['error'] = str(e)
+    finally:
+        FreeCAD.closeDocument(doc.Name)
+    return record
+
+def benchmark(generators=None,sizes=(4,16,64),backends=None,repeat=1,seed=0):
+    '''Run the benchmark and return a list of result records'''
+    setup()
+    if not generators:
+        generators = list(Generators)
+    if not backends:
+        backends = getBackends()
+    results = []
+    for generator in generators:
+        for size in sizes:
+            for backend in backends:
+                for i in range(repeat):
+                    record = run(generator,size,backend,seed,i)
+                    logger.info('{} {} {}: {:.3f}s',generator,size,backend,
+                            record['phases'].get('total',0.0))
+                    results.append(record)
+    return results
+
+def main(argv=None):
+    from . import __version__
+    parser = argparse.ArgumentParser(prog='asm3-benchmark',
+                description='Assembly3 headless solver benchmark')
+    parser.add_argument('--generators',default=','.join(Generators),
+            help='comma separated generator names (default: %(default)s)')
+    parser.add_argument('--sizes',default='4,16,64',
+            help='comma separated assembly sizes (default: %(default)s)')
+    parser.add_argument('--backends',default='',
+            help='comma separated solver backend names (default: all)')
+    parser.add_argument('--repeat',type=int,default=1)
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--output',default='',
+            help='output JSON file (default: stdout)')
+    args = parser.parse_args(argv if argv is not None else sys.argv[1:])
+
+    results = benchmark(
+            generators=[ g for g in args.generators.split(',') if g ],
+            sizes=[ int(s) for s in args.sizes.split(',') if s ],
+            backends=[ b for b in args.backends.split(',') if b ],
+            repeat=args.repeat,
+            seed=args.seed)
+
+    output = OrderedDict((
+        ('version',__version__),
+        ('freecad','.'.join(FreeCAD.Version()[:3])),
+        ('python',platform.python_version()),
+        ('platform',platform.platform()),
+        ('results',results),
+    ))
+    if args.output:
+        with open(args.output,'w') as f:
+            json.dump(output,f,indent=1)
+    else:
+        json.dump(output,sys.stdout,indent=1)
+        sys.stdout.write('\n')
+    return results
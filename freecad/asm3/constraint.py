@@ -48,6 +48,11 @@ def _prepareDraftCircle(solver,partInfo,requireArc=False):
     func = _a if requireArc else _c
     return func(solver,partInfo,'Edge1',shape,retAll=True)
 
+def _getEntity(solver,partInfo,key):
+    h = partInfo.EntityMap.get(key,None)
+    solver.profile.count('entityCacheHit' if h else 'entityCacheMiss')
+    return h
+
 def _p(solver,partInfo,subname,shape,retAll=False):
     'return a handle of a transformed point derived from "shape"'
     if not solver:
@@ -61,7 +66,7 @@ def _p(solver,partInfo,subname,shape,retAll=False):
 
     part = partInfo.Part
     key = subname+'.p'
-    h = partInfo.EntityMap.get(key,None)
+    h = _getEntity(solver,partInfo,key)
     system = solver.system
     if h:
         system.log('cache {}: {}',key,h)
@@ -95,7 +100,7 @@ def _p(solver,partInfo,subname,shape,retAll=False):
             h = PointInfo(entity=e.p0,params=partInfo.Params,vector=v)
         elif subname=='Edge1':
             # center point
-            h = partInfo.Workplane.origin
+            h = solver.getPartWorkplane(partInfo).origin
         else:
             raise RuntimeError('Invalid draft circle subname {} of '
                     '{}'.format(subname,partInfo.PartName))
@@ -125,7 +130,7 @@ def _n(solver,partInfo,subname,shape,retAll=False):
         return
 
     key = subname+'.n'
-    h = partInfo.EntityMap.get(key,None)
+    h = _getEntity(solver,partInfo,key)
     system = solver.system
     if h:
         system.log('cache {}: {}',key,h)
@@ -186,7 +191,7 @@ def _l(solver,partInfo,subname,shape,retAll=False):
 
     part = partInfo.Part
     key = subname+'.l'
-    h = partInfo.EntityMap.get(key,None)
+    h = _getEntity(solver,partInfo,key)
     system = solver.system
     if h:
         system.log('cache {}: {}',key,h)
@@ -273,7 +278,7 @@ def _w(solver,partInfo,subname,shape,retAll=False,noCheck=False):
         return 'an edge/face with a planar surface'
 
     key = subname+'.w'
-    h = partInfo.EntityMap.get(key,None)
+    h = _getEntity(solver,partInfo,key)
     system = solver.system
     if h:
         system.log('cache {}: {}',key,h)
@@ -307,7 +312,7 @@ def _c(solver,partInfo,subname,shape,requireArc=False,retAll=False):
         key = subname+'.a'
     else:
         key = subname+'.c'
-    h = partInfo.EntityMap.get(key,None)
+    h = _getEntity(solver,partInfo,key)
     system = solver.system
     if h:
         system.log('cache {}: {}',key,h)
@@ -318,7 +323,7 @@ def _c(solver,partInfo,subname,shape,requireArc=False,retAll=False):
 
     if utils.isDraftCircle(partInfo.Part):
         part = partInfo.Part
-        pln = partInfo.Workplane
+        pln = solver.getPartWorkplane(partInfo)
 
         if system.sketchPlane and not solver.isFixedElement(part,subname):
             system.NameTag = nameTag + '.o'
@@ -550,12 +555,12 @@ class Constraint(ProxyType):
                 logger.debug('fix workplane {}',objName(obj))
         found = len(ret)
 
-        attachments = []
+        rigids = []
         for obj in cstrs:
             cstr = mcs.getProxy(obj)
 
-            if isinstance(cstr, Attachment):
-                attachments.append(obj)
+            if cstr.isRigid(obj):
+                rigids.append(obj)
 
             if solver:
                 # Build array constraint map for constraint multiplication
@@ -602,106 +607,133 @@ class Constraint(ProxyType):
         if not ret:
             return ret
 
-        # Early solving for Attachment constraint, which requires only simple
-        # matrix calculation. We only solve those directly or indirectly
-        # attached to some fixed part, and treat the rest as PlaneCoincident
-        # with locked angle.
+        # Early solving for constraints that completely fix the relative
+        # placement of two parts (i.e. Attachment, and PlaneCoincident with
+        # locked angle), which requires only simple matrix calculation. We
+        # propagate from the fixed parts through chains of such constraints of
+        # any depth until no more part can be fixed, and treat the rest as
+        # normal constraints.
 
         from .assembly import setPlacement
         handled = set()
-        while True:
+        # part -> placement of the parts moved by the propagation
+        placements = {}
+        while rigids:
             nxt = []
-            for obj in attachments:
-                cstr = obj.Proxy
-
-                firstInfo = []
-                infos = []
-
-                if obj.Cascade:
-                    # for cascading attachment, we should handle it if there is
-                    # any fixed part inside. We also need to sort the element
-                    # pairs properly so that they can be recognized as fixed one
-                    # after another
-                    prev = None
-                    fixed = None
-                    for e in cstr.getElements():
-                        info = e.Proxy.getInfo()
-                        if prev and prev.Part!=info.Part:
-                            firstInfo.append(prev)
-                            infos.append(info)
-                            if fixed is None \
-                                    and (prev.Part in ret or info.Part in ret):
-                                fixed = len(firstInfo)
-                        prev = info
-
-                    if fixed is None:
-                        continue
-
-                    if fixed:
-                        # reorder the element pairs to put the pair with the
-                        # fixed part first, and then reversed the ones that are
-                        # before it.
-                        firstInfo = firstInfo[fixed:] +\
-                                list(reversed(firstInfo[:fixed]))
-                        infos = infos[fixed:] + list(reversed(infos[:fixed]))
-                else:
-                    if not mcs.canMultiply(obj):
-                        infos = cstr.getElementsInfo()
-                        firstInfo = [infos[0]]*(len(infos)-1)
-                        infos = infos[1:]
-                    else:
-                        elements = cstr.getElements()
-                        firstInfo = elements[0].Proxy.getInfo(expand=True)
-                        infos = []
-                        for element in elements[1:]:
-                            infos += element.Proxy.getInfo(expand=True)
-                        count = min(len(infos),len(firstInfo))
-                        firstInfo = firstInfo[:count]
-                        infos = infos[:count]
-
-                    if any([ not (info0.Part in ret or info.Part in ret)
-                            for info0,info in zip(firstInfo,infos)]):
-                        # we only handle if all element pair has at least one
-                        # part that are fixed
-                        continue
+            for obj in rigids:
+                res = mcs.solveRigidPairs(obj,ret,placements)
+                if res is None:
+                    nxt.append(obj)
+                    continue
 
                 if rollback is not False:
                     handled.add(obj)
 
-                for info0,info in zip(firstInfo,infos):
-                    if info.Part in ret:
-                        if info0.Part in ret:
-                            logger.warn(translate('asm3Logger', 'skip fixed part "{}" and "{}" in {}'),
-                                info.PartName,info0.PartName,cstrName(obj))
-                            continue
-                        info0,info = info,info0
-
+                for info,pla in res:
                     ret.add(info.Part)
-
-                    pla0 = info0.Placement.multiply(
-                            utils.getElementPlacement(info0.Shape))
-                    pla = pla0.multiply(
-                            utils.getElementPlacement(info.Shape).inverse())
+                    placements[info.Part] = pla
                     if rollback is not False and \
                             not utils.isSamePlacement(pla,info.Placement):
                         solver.touched = True
-                        solver.system.log('attaching "{}" -> "{}"',
-                                info.PartName, info0.PartName)
+                        solver.system.log('attaching "{}" by {}',
+                                info.PartName, cstrName(obj))
                         if rollback is not None:
                             rollback.append((info.PartName,
                                             info.Part,
                                             info.Placement.copy()))
                         setPlacement(info.Part,pla)
 
-            if len(nxt) == len(attachments):
+            if len(nxt) == len(rigids):
                 break
-            attachments = nxt
+            rigids = nxt
 
         if handled:
             cstrs[:] = [ obj for obj in cstrs if obj not in handled ]
 
         return ret
 
+    @classmethod
+    def getRigidPairs(mcs,obj):
+        '''Return a list of (info1,info2,cascade) of the constrained element
+        pairs of a rigid constraint'''
+        cstr = obj.Proxy
+        if getattr(obj,'Cascade',False):
+            ret = []
+            prev = None
+            for e in cstr.getElements():
+                info = e.Proxy.getInfo()
+                if prev and prev.Part!=info.Part:
+                    ret.append((prev,info,True))
+                prev = info
+            return ret
+
+        if not mcs.canMultiply(obj):
+            infos = cstr.getElementsInfo()
+            return [(infos[0],info,False) for info in infos[1:]]
+
+        elements = cstr.getElements()
+        firstInfo = elements[0].Proxy.getInfo(expand=True)
+        infos = []
+        for element in elements[1:]:
+            infos += element.Proxy.getInfo(expand=True)
+        return [(info0,info,False) for info0,info in zip(firstInfo,infos)]
+
+    @classmethod
+    def solveRigidPairs(mcs,obj,fixed,placements):
+        '''Solve the part placements of a rigid constraint
+
+        Each element pair (info1,info2) satisfies
+
+            info1.Placement * E1 = info2.Placement * E2 * offset
+
+        where E1 and E2 are the element placements. For cascading constraint,
+        the pair is swapped unless the second part is fixed, the same as
+        BaseCascade.prepare().
+
+        fixed: set of the currently fixed parts
+        placements: part -> placement map of the already moved parts
+
+        Return a list of (info,placement) of the newly fixed parts, or None if
+        the constraint cannot be completely solved with the current fixed parts.
+        '''
+        offset = mcs.getProxy(obj).getRigidOffset(obj)
+        pairs = mcs.getRigidPairs(obj)
+        fixed = set(fixed)
+        placements = dict(placements)
+        ret = []
+        while pairs:
+            remain = []
+            for info1,info2,cascade in pairs:
+                if cascade and info2.Part not in fixed:
+                    info1,info2 = info2,info1
+                if info1.Part in fixed:
+                    if info2.Part in fixed:
+                        logger.warn(translate('asm3Logger',
+                            'skip fixed part "{}" and "{}" in {}'),
+                            info1.PartName,info2.PartName,cstrName(obj))
+                        continue
+                    pla = placements.get(info1.Part,info1.Placement).multiply(
+                            utils.getElementPlacement(info1.Shape)).multiply(
+                                offset.inverse())
+                    info = info2
+                elif info2.Part in fixed:
+                    pla = placements.get(info2.Part,info2.Placement).multiply(
+                            utils.getElementPlacement(info2.Shape)).multiply(
+                                offset)
+                    info = info1
+                else:
+                    remain.append((info1,info2,cascade))
+                    continue
+                pla = pla.multiply(
+                        utils.getElementPlacement(info.Shape).inverse())
+                fixed.add(info.Part)
+                placements[info.Part] = pla
+                ret.append((info,pla))
+            if len(remain) == len(pairs):
+                return
+            pairs = remain
+        return ret
+
     @classmethod
     def getFixedTransform(mcs,cstrs):
         firstPart = None
@@ -936,6 +968,16 @@ class Base(with_metaclass(Constraint, object)):
     def hasFixedPart(cls,_obj):
         return False
 
+    @classmethod
+    def isRigid(cls,_obj):
+        '''Whether the constraint completely fixes the relative placement of
+        the constrained parts'''
+        return False
+
+    @classmethod
+    def getRigidOffset(cls,_obj):
+        return FreeCAD.Placement()
+
     @classmethod
     def getMenuText(cls):
         if cls._measure:
@@ -1346,6 +1388,16 @@ class PlaneCoincident(BaseCascade):
       'Add a "{}" constraint to coincide planar faces of two or more parts.\n'\
       'The faces are coincided at their centers with an optional distance.')
 
+    @classmethod
+    def isRigid(cls,obj):
+        return obj.LockAngle
+
+    @classmethod
+    def getRigidOffset(cls,obj):
+        d,dx,dy,_,yaw,pitch,roll = cls.getPropertyValues(obj)
+        return FreeCAD.Placement(FreeCAD.Vector(dx,dy,d),
+                                 FreeCAD.Rotation(yaw,pitch,roll))
+
 
 class Attachment(BaseCascade):
     _id = 45
@@ -1359,6 +1411,10 @@ class Attachment(BaseCascade):
     _entityDef = (_wa_no_check,)
     _toolbarName = None
 
+    @classmethod
+    def isRigid(cls,_obj):
+        return True
+
 
 class AttachmentOffset(Attachment):
     _id = 46
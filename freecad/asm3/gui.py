@@ -709,6 +709,19 @@ class AsmCmdAutoFixElement(AsmCmdCheckable):
     def IsActive(cls):
         return True
 
+class AsmCmdSolverProfile(AsmCmdCheckable):
+    _id = 33
+    _menuText  = QT_TRANSLATE_NOOP("asm3", "Solver profiling")
+    _tooltip   = QT_TRANSLATE_NOOP("asm3",
+            "Toggle printing the timing of each solving phase to the report view")
+    _toolbarName = None
+    _contextMenuName = None
+    _saveParam = True
+
+    @classmethod
+    def IsActive(cls):
+        return True
+
 class AsmCmdAutoElementVis(AsmCmdCheckable):
     _id = 9
     _menuText = QT_TRANSLATE_NOOP("asm3", "Auto element visibility")
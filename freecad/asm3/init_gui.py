@@ -11,6 +11,14 @@ try:
     from . import sys_slvs
 except ImportError as e:
     logger.debug('failed to import slvs: {}'.format(e))
+
+try:
+    from . import sys_numpy
+except ImportError as e:
+    logger.debug('failed to import numpy: {}'.format(e))
+
+if not 'freecad.asm3.sys_slvs' in sys.modules and \
+   not 'freecad.asm3.sys_numpy' in sys.modules:
     logger.warn(translate('asm3Logger', 'no solver backend found'))
 
 # Disable sympy/scipy solver for now, as the development is stalled
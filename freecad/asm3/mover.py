@@ -4,7 +4,8 @@ import FreeCAD, FreeCADGui
 from PySide import QtCore, QtGui
 from . import utils, gui
 from .assembly import isTypeOf, Assembly, ViewProviderAssembly, \
-    resolveAssembly, getElementInfo, setPlacement
+    resolveAssembly, getElementInfo, setPlacement, \
+    checkElementShapeChange, clearElementShapeCache
 from .utils import moverlogger as logger, objName
 from .constraint import Constraint
 
@@ -28,6 +29,12 @@ class AsmMovingPart(object):
         self.tracePoint = None
         self.moveElement = moveElement
         self.sels = []
+        # keep the prepared solvers alive during dragging
+        self.session = {}
+        # whether there is a drag motion waiting to be processed
+        self._pendingMove = False
+        # whether the last solve is an interactive one that needs refinement
+        self._interactiveSolved = False
         navi = FreeCAD.ParamGet('User parameter:BaseApp/Preferences/View').GetString('NavigationStyle')
         self.allowShortcut = navi != 'Gui::InventorNavigationStyle'
 
@@ -118,6 +125,7 @@ class AsmMovingPart(object):
         if vobj and isTypeOf(vobj,ViewProviderAssembly):
             movingPart = getattr(vobj.Proxy,'_movingPart',None)
             if movingPart:
+                movingPart.session.clear()
                 vobj.Object.recompute(True)
                 movingPart.tracePoint = movingPart.TracePosition
 
@@ -125,6 +133,8 @@ class AsmMovingPart(object):
         self.tracePoint = self.TracePosition
 
     def end(self):
+        self._pendingMove = False
+        self.session.clear()
         for obj,sub in self.sels:
             self.view.removeObjectOnTop(obj,sub)
 
@@ -157,6 +167,22 @@ class AsmMovingPart(object):
         return mat.multiply(self.draggerPlacement.Base)
 
     def dragEnd(self):
+        if self._pendingMove:
+            # solve the last drag position at full accuracy
+            self._pendingMove = False
+            logger.catch('exception when moving part',self._move,False)
+        elif self._interactiveSolved:
+            # refine the last interactive solve, which is warm started by the
+            # reused solver
+            self._interactiveSolved = False
+            from . import solver
+            logger.catch('solver exception when moving part',
+                    solver.solve, self.objs, dragPart=self.info.Part,
+                    session=self.session)
+
+        # the document may be changed between two drags, so only reuse the
+        # solver within one drag
+        self.session.clear()
         if self.moveElement and gui.AsmCmdManager.AutoRecompute:
             from . import solver
             if not logger.catch('solver exception when moving element',
@@ -166,6 +192,22 @@ class AsmMovingPart(object):
                 return self.update()
 
     def move(self):
+        # Coalesce the drag motion events. The actual moving is done in the
+        # next event loop iteration using the newest dragging placement, so
+        # that the motion events queued up while solving are skipped.
+        if self._pendingMove:
+            return
+        self._pendingMove = True
+        QtCore.QTimer.singleShot(0,self._onMoveTimer)
+
+    def _onMoveTimer(self):
+        if not self._pendingMove:
+            return
+        self._pendingMove = False
+        logger.catch('exception when moving part',self._move)
+
+    def _move(self,interactive=True):
+        self._interactiveSolved = False
         info = self.info
         part = info.Part
         obj = self.assembly.Object
@@ -257,8 +299,11 @@ class AsmMovingPart(object):
         # to logger only.
         from . import solver
         if not logger.catch('solver exception when moving part',
-               solver.solve, self.objs, dragPart=info.Part, rollback=rollback):
+               solver.solve, self.objs, dragPart=info.Part, rollback=rollback,
+               session=self.session, interactive=interactive):
             obj.recompute(True)
+        else:
+            self._interactiveSolved = interactive
 
         if gui.AsmCmdManager.Trace:
             pos = self.TracePosition
@@ -469,11 +514,15 @@ class AsmDocumentObserver:
     def slotCreatedDocument(self,_doc):
         self.closeMover()
 
-    def slotDeletedDocument(self,_doc):
+    def slotDeletedDocument(self,doc):
         self.closeMover()
+        clearElementShapeCache(doc)
+        utils.clearElementFeatureCache()
 
     def slotUndo(self):
         self.closeMover()
+        clearElementShapeCache()
+        utils.clearElementFeatureCache()
         AsmMovingPart.onRollback()
         Assembly.cancelAutoSolve()
         gui.AsmCmdAutoElementVis.setup()
@@ -490,6 +539,7 @@ class AsmDocumentObserver:
             self.slotUndo()
 
     def slotChangedObject(self,obj,prop):
+        checkElementShapeChange(obj,prop)
         Assembly.checkPartChange(obj,prop)
 
     def slotRecomputedDocument(self,_doc):
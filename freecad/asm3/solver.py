@@ -1,12 +1,14 @@
-import random, math
-from collections import namedtuple,defaultdict
+import random, math, time, json
+from collections import namedtuple,defaultdict,OrderedDict
+from contextlib import contextmanager
 import FreeCAD, FreeCADGui
-from .assembly import Assembly, isTypeOf, setPlacement
-from . import utils
+from .assembly import Assembly, isTypeOf, setPlacement, setPlacements, \
+    getPlacement
+from . import utils, gui
 from .utils import syslogger as logger, objName, isSamePlacement
 from .constraint import Constraint, cstrName, \
                         NormalInfo, PlaneInfo, PointInfo
-from .system import System
+from .system import System, DragOptions
 
 from FreeCAD import Qt
 translate = Qt.translate
@@ -16,10 +18,9 @@ QT_TRANSLATE_NOOP = Qt.QT_TRANSLATE_NOOP
 # PartName: text name of the part
 # Placement: the original placement of the part
 # Params: 7 parameters that defines the transformation of this part
-# Workplane: a tuple of four entity handles, that is the workplane, the origin
-#            point, and the normal, and x pointing normal. The workplane,
-#            defined by the origin and norml, is essentially the XY reference
-#            plane of the part.
+# EntityGroup: group handle of the entities of the part placement, i.e. the
+#              normal and the ones of the part workplane returned by
+#              Solver.getPartWorkplane()
 # EntityMap: string -> entity handle map, for caching
 # Group: transforming entity group handle
 # Update: in case the constraint uses the `Multiplication` feature, only the
@@ -27,21 +28,175 @@ QT_TRANSLATE_NOOP = Qt.QT_TRANSLATE_NOOP
 #         The rest ElementInfo will be stored here for later update by matrix
 #         transformation.
 PartInfo = namedtuple('SolverPartInfo', ('Part','PartName','Placement',
-    'Params','Workplane','EntityMap','Group','Update'))
+    'Params','EntityGroup','EntityMap','Group','Update'))
+
+_timer = getattr(time,'perf_counter',time.time)
+
+class SolverProfile(object):
+    '''Phase level timing and counters of solving an assembly
+
+    Phases are timed by wall clock and recorded as name -> (seconds, calls).
+    Constraint type specific phases and counters are named as
+    '<name>.<ConstraintType>'.
+    '''
+    def __init__(self,assembly):
+        self.assembly = objName(assembly)
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+
+    def __bool__(self):
+        return True
+
+    __nonzero__ = __bool__
+
+    @contextmanager
+    def phase(self,name):
+        t = _timer()
+        try:
+            yield
+        finally:
+            t = _timer() - t
+            total,calls = self.phases.get(name,(0.0,0))
+            self.phases[name] = (total+t,calls+1)
+
+    def count(self,name,n=1):
+        self.counters[name] = self.counters.get(name,0) + n
+
+    def toDict(self):
+        return OrderedDict((
+            ('assembly',self.assembly),
+            ('phases',OrderedDict((name,{'time':t,'calls':calls})
+                for name,(t,calls) in self.phases.items())),
+            ('counters',OrderedDict(self.counters)),
+        ))
+
+    def summary(self):
+        lines = ['solver profile of {}:'.format(self.assembly)]
+        for name,(t,calls) in self.phases.items():
+            lines.append('  {:<32}{:>10.3f} ms{:>8} calls'.format(
+                name,t*1000.0,calls))
+        for name,n in self.counters.items():
+            lines.append('  {:<32}{:>13}'.format(name,n))
+        return '\n'.join(lines)
+
+class _NullPhase(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self,*_args):
+        pass
+
+class _NullProfile(object):
+    '''Do nothing profile used when profiling is disabled'''
+    _phase = _NullPhase()
+
+    def __bool__(self):
+        return False
+
+    __nonzero__ = __bool__
+
+    def phase(self,_name):
+        return self._phase
+
+    def count(self,_name,_n=1):
+        pass
+
+_NoProfile = _NullProfile()
+
+# profiles of the last solve, one for each solved assembly
+_LastProfiles = []
+
+def getLastProfile(toJson=False):
+    '''Return the profiles of the last solve with profiling enabled
+
+    The result is a list of dictionaries, one for each solved assembly, or
+    a JSON string if toJson is True.
+    '''
+    ret = [ profile.toDict() for profile in _LastProfiles ]
+    return json.dumps(ret,indent=1) if toJson else ret
+
+# Dof: remaining degree of freedom of the assembly
+# PartDof: part name -> remaining degree of freedom of the part
+# Redundant: list of tuples of the names of constraints that are redundant with
+#            each other
+# FreeMotions: list of independent under constrained directions, each as a
+#              dictionary of part name -> change of the 7 part parameters
+#              (x,y,z,qw,qx,qy,qz)
+SolverDiagnostics = namedtuple('SolverDiagnostics',
+        ('Dof','PartDof','Redundant','FreeMotions'))
+
+def _analyzeJacobian(J,tol):
+    '''Rank analysis of a Jacobian matrix
+
+    The rows are orthogonalized in order, so that a row that is a linear
+    combination of the previous rows is found together with the rows it
+    depends on.
+
+    Return a tuple (rank,dependencies,nullspace), where dependencies is a list
+    of (row,rows) of each linearly dependent row and the rows it depends on,
+    and nullspace is an array whose rows are an orthonormal basis of the null
+    space of J.
+    '''
+    import numpy as np
+    m,n = J.shape
+    basis = []
+    coefs = []
+    deps = []
+    for i in range(m):
+        v = np.array(J[i],dtype=float)
+        c = np.zeros(m)
+        c[i] = 1.0
+        norm0 = np.linalg.norm(v)
+        # orthogonalize twice for numerical stability
+        for _ in range(2):
+            for b,bc in zip(basis,coefs):
+                a = b.dot(v)
+                v -= a*b
+                c -= a*bc
+        norm = np.linalg.norm(v)
+        if norm > tol*max(norm0,1.0):
+            basis.append(v/norm)
+            coefs.append(c/norm)
+            continue
+        c[i] = 0.0
+        cmax = np.abs(c).max() if m else 0.0
+        deps.append((i,[ j for j in range(i) if abs(c[j]) > tol*max(cmax,1.0)]))
+    if basis:
+        _,_,vt = np.linalg.svd(np.array(basis))
+        null = vt[len(basis):]
+    else:
+        null = np.eye(n)
+    return len(basis),deps,null
 
 class Solver(object):
-    def __init__(self,assembly,reportFailed,dragPart,recompute,rollback):
-        failedType = 'redundant'
+    def __init__(self,assembly,reportFailed,dragPart,recompute,rollback,
+            deferred=False,profile=None,interactive=None):
+        self.assembly = assembly
+        # name and failure list for use by solveSystem() in worker threads
+        self._name = objName(assembly)
+        self._failed = []
         self.system = System.getSystem(assembly)
+        self.profile = profile if profile else _NoProfile
+        self._interactive = interactive
+        self._prepared = False
         cstrs = assembly.Proxy.getConstraints()
         if not cstrs:
             logger.debug('skip assembly {} with no constraint',
                 objName(assembly))
             return
 
+        # the original constraint list, for checking whether this solver can
+        # be reused, because getFixedParts() below may remove some constraints
+        # that are solved directly
+        self._cstrObjs = list(cstrs)
+        self._cstrs = cstrs
+
         self._fixedGroup = 2
         self.group = 1 # the solving group
         self._partMap = {}
+        self._partGroups = {}
+        self._cstrGroups = {}
+        self._groups = [self.group]
         self._cstrMap = {}
         self._cstrArrayMap = defaultdict(int)
         self._fixedParts = set()
@@ -66,25 +221,43 @@ class Solver(object):
         roty = FreeCAD.Rotation(FreeCAD.Vector(1,0,0),90)
         self.ny = self.system.addNormal3dV(*utils.getNormal(roty))
 
+        profile = self.profile
+        profile.count('constraints',len(cstrs))
+
         partGroup = assembly.Proxy.getPartGroup()
-        self._fixedParts = Constraint.getFixedParts(
-                                self,cstrs,partGroup,rollback)
+        with profile.phase('getFixedParts'):
+            self._fixedParts = Constraint.getFixedParts(
+                                    self,cstrs,partGroup,rollback)
         for part in self._fixedParts:
             self._fixedElements.add((part,None))
 
         if self.touched:
-            if not assembly.recompute(True):
-                raise RuntimeError(
-                    'Failed to recompute {}'.format(objName(assembly)))
+            with profile.phase('recompute'):
+                if not assembly.recompute(True):
+                    raise RuntimeError(
+                        'Failed to recompute {}'.format(objName(assembly)))
 
         if not cstrs:
             self.system.log('no constraints')
             return
 
+        with profile.phase('clusters'):
+            self._buildClusters(cstrs)
+        profile.count('groups',len(self._groups))
+
+        stats = self.system.getStatistics() if profile else None
         for cstr in cstrs:
             self.system.log('preparing {}',cstrName(cstr))
             self.system.GroupHandle += 1
-            ret = Constraint.prepare(cstr,self)
+            self.group = self._cstrGroups.get(cstr,self._groups[0])
+            tp = Constraint.getTypeName(cstr)
+            with profile.phase('prepare.'+str(tp)):
+                ret = Constraint.prepare(cstr,self)
+            if stats:
+                prev,stats = stats,self.system.getStatistics()
+                for name,a,b in zip(('params','entities','equations'),
+                                    prev,stats):
+                    profile.count('{}.{}'.format(name,tp),b-a)
             if ret:
                 if isinstance(ret,(list,tuple)):
                     for h in ret:
@@ -93,49 +266,331 @@ class Solver(object):
                 else:
                     self._cstrMap[ret] = cstr
 
-        if dragPart:
-            # TODO: this is ugly, need a better way to expose dragging interface
-            addDragPoint = getattr(self.system,'addWhereDragged',None)
-            if addDragPoint:
-                info = self._partMap.get(dragPart,None)
-                if info and info.Workplane:
-                    # add dragging point
-                    self.system.log('add drag point {}',info.Workplane[1])
-                    # TODO: slvs addWhereDragged doesn't work as expected, need
-                    # to investigate more
-                    # addDragPoint(info.Workplane[1],group=self.group)
-
-        self.system.log('solving {}',objName(assembly))
+        self.group = self._groups[0]
+        profile.count('parts',len(self._partMap))
+        self._prepared = True
+        if not deferred:
+            self.solve(reportFailed,recompute,rollback)
+
+    def _buildClusters(self,cstrs):
+        '''Split the constraints into independent clusters
+
+        Parts connected directly or indirectly through some constraint are put
+        into the same cluster, with the fixed parts removed from the
+        connectivity graph. Each cluster is assigned its own solving group, so
+        that it can be solved separately as a smaller system.
+        '''
+        roots = {}
+        def findRoot(part):
+            root = roots.setdefault(part,part)
+            while root != roots[root]:
+                roots[root] = roots[roots[root]]
+                root = roots[root]
+            return root
+
+        cstrParts = []
+        for cstr in cstrs:
+            parts = []
+            for element in cstr.Proxy.getElements():
+                for info in element.Proxy.getInfo(expand=True):
+                    if not self.isFixedPart(info.Part):
+                        parts.append(info.Part)
+            if not parts:
+                continue
+            cstrParts.append((cstr,parts))
+            root = findRoot(parts[0])
+            for part in parts[1:]:
+                other = findRoot(part)
+                if other != root:
+                    roots[other] = root
+
+        clusters = {}
+        for cstr,parts in cstrParts:
+            root = findRoot(parts[0])
+            group = clusters.get(root,None)
+            if group is None:
+                if not clusters:
+                    group = self.group
+                else:
+                    # skip the group handles reserved for the constraints
+                    group = self._fixedGroup + len(cstrs) + len(clusters)
+                    self._groups.append(group)
+                clusters[root] = group
+            self._cstrGroups[cstr] = group
+            for part in parts:
+                self._partGroups[part] = group
+
+        if len(self._groups) > 1:
+            self.system.log('{} clusters',len(self._groups))
+
+    def canReuse(self,dragPart):
+        '''Check if the prepared system can be solved again
+
+        The system can be reused if the constraints are not changed, the fixed
+        parts stay in place, and the moving part is not some draft object whose
+        shape (rather than placement) is being changed.
+
+        The system is only reused for the same dragged part, and only by the
+        innermost assembly owning that part. The element geometry of a parent
+        assembly changes when its sub-assembly is moved internally, which is
+        not reflected by the constant entities of the prepared system.
+        '''
+        if not self._prepared:
+            return False
+        if not dragPart or dragPart != self._dragPart \
+                or dragPart not in self._partMap:
+            return False
+        if self.touched:
+            # some parts were directly placed by getFixedParts(), which may
+            # need to be redone
+            return False
+        if dragPart and utils.isDraftObject(dragPart):
+            return False
+        if self._cstrObjs != self.assembly.Proxy.getConstraints():
+            return False
+        for part in self._fixedParts:
+            partInfo = self._partMap.get(part,None)
+            if partInfo and partInfo.Params and \
+                    not isSamePlacement(partInfo.Placement,getPlacement(part)):
+                return False
+        return True
+
+    def resolve(self,reportFailed,dragPart,recompute,rollback,profile=None,
+            interactive=None):
+        '''Re-solve the prepared system with the current part placements
+
+        Only the parameters of the moved parts are patched, and the rest of
+        the parameters are warm started with the previous solution.
+        '''
+        self._dragPart = dragPart
+        self._interactive = interactive
+        self.profile = profile if profile else _NoProfile
+        for part,partInfo in self._partMap.items():
+            if not partInfo.Params or part in self._fixedParts:
+                continue
+            pla = getPlacement(part)
+            if isSamePlacement(partInfo.Placement,pla):
+                continue
+            self.system.log('patching {} {}',partInfo.PartName,pla)
+            self.profile.count('patched')
+            q = pla.Rotation.Q
+            for h,v in zip(partInfo.Params,(pla.Base.x,pla.Base.y,pla.Base.z,
+                                            q[3],q[0],q[1],q[2])):
+                self.system.setParamValue(h,v)
+            partInfo.Placement.Base = pla.Base
+            partInfo.Placement.Rotation = pla.Rotation
+        self.solve(reportFailed,recompute,rollback)
+
+    def isPrepared(self):
+        return self._prepared
+
+    def patchConstraint(self,cstr,values):
+        '''Update the system in place after changing constraint properties
+
+        values: the property values of the constraint when it was prepared
+
+        Return True if the system is patched, or False if the system must be
+        rebuilt.
+        '''
+        if not self._prepared or cstr not in self._cstrs:
+            return False
+        handles = [ h for h,c in self._cstrMap.items() if c == cstr ]
+        if not handles:
+            return False
+        newValues = Constraint.getType(cstr).getPropertyValues(cstr)
+        for h in handles:
+            if not self.system.patchConstraint(h,values,newValues):
+                return False
+        self.system.log('patched {}',cstrName(cstr))
+        return True
+
+    def getMovingParts(self):
+        '''Return the list of PartInfo of the parts moved by the solver'''
+        return [ info for part,info in self._partMap.items()
+                    if info.Params and part not in self._fixedParts ]
+
+    def diagnose(self,tol=1e-8):
+        '''Analyze the degree of freedom and redundancy of the prepared system
+
+        The Jacobian matrix of each solving group is evaluated at the current
+        part placements without solving, and its rank is used to find the
+        remaining degree of freedom, the redundant constraints and the under
+        constrained directions.
+
+        tol: relative tolerance for deciding linear dependency
+
+        Return a SolverDiagnostics
+        '''
+        import numpy as np
+        paramMap = {}
+        for partInfo in self._partMap.values():
+            if partInfo.Params and partInfo.Part not in self._fixedParts:
+                for i,h in enumerate(partInfo.Params):
+                    paramMap[h] = (partInfo.PartName,i)
+
+        dof = 0
+        partDof = OrderedDict()
+        redundant = []
+        motions = []
+        for group in self._groups:
+            J,params,handles = self.system.getJacobian(group)
+            rank,deps,null = _analyzeJacobian(J,tol)
+            dof += len(params) - rank
+
+            columns = OrderedDict()
+            for i,h in enumerate(params):
+                key = paramMap.get(h,None)
+                if key:
+                    columns.setdefault(key[0],[None]*7)[key[1]] = i
+            for name,idx in columns.items():
+                if None in idx:
+                    continue
+                sub = null[:,idx]
+                partDof[name] = np.linalg.matrix_rank(sub,tol) \
+                                    if len(sub) else 0
+
+            for v in null:
+                motion = OrderedDict()
+                for name,idx in columns.items():
+                    if None in idx:
+                        continue
+                    d = v[idx]
+                    if np.abs(d).max() > tol:
+                        motion[name] = tuple(float(x) for x in d)
+                if motion:
+                    motions.append(motion)
+
+            names = [self._getConstraintName(h) for h in handles]
+            for row,rows in deps:
+                if not names[row]:
+                    continue
+                cstrs = set([names[row]])
+                cstrs.update(names[i] for i in rows if names[i])
+                cstrs = tuple(sorted(cstrs))
+                if cstrs not in redundant:
+                    redundant.append(cstrs)
+
+        return SolverDiagnostics(Dof=dof,PartDof=partDof,
+                Redundant=redundant,FreeMotions=motions)
+
+    def _getConstraintName(self,h):
+        '''Return the name of the constraint owning a system handle, or None if
+        the handle is not a constraint'''
+        cstr = self._cstrMap.get(h,None)
+        if cstr:
+            return cstrName(cstr)
         try:
-            self.system.solve(group=self.group,reportFailed=reportFailed)
-        except RuntimeError as e:
-            failedType = 'failed'
-            raise RuntimeError(translate('asm3', 'Failed to solve {}: {}').format(
-                objName(assembly),str(e)))
+            self.system.getConstraint(h)
+        except Exception:
+            return
+        return str(h)
+
+    def solve(self,reportFailed,recompute,rollback):
+        try:
+            self.solveSystem(reportFailed)
+        finally:
+            self.reportFailed()
+        self.update(recompute,rollback)
+
+    def solveSystem(self,reportFailed):
+        '''Run the numerical solver on the prepared system
+
+        This function does not access any document object, and can therefore
+        be called outside of the main thread.
+        '''
+        dragPart = self._dragPart
+        interactive = self._interactive
+        if interactive:
+            # Interactive dragging. Weight the dragged part parameters to stay
+            # close to the dragging position, and limit the solving effort, as
+            # it will be refined by the next frame or the final solve.
+            params = None
+            info = self._partMap.get(dragPart,None)
+            if info and info.Params and not self.isFixedPart(dragPart):
+                params = info.Params
+            self.system.log('interactive solving {}',interactive)
+            self.system.setDragging(DragOptions(params,*interactive))
+
+        try:
+            self._solveGroups(reportFailed)
         finally:
-            if reportFailed and self.system.Failed:
-                msg = 'List of {} constraint:'.format(failedType)
-                for h in self.system.Failed:
-                    cstr = self._cstrMap.get(h,None)
-                    if not cstr:
-                        try:
-                            c = self.system.getConstraint(h)
-                        except Exception as e2:
-                            logger.error('cannot find constraint {}: {}',h,e2)
-                            continue
-                        if c.group <= self._fixedGroup or \
-                           c.group-self._fixedGroup >= len(cstrs):
-                            logger.error('failed constraint in unexpected group'
-                                    ' {}',c.group)
-                            continue
-                        cstr = cstrs[c.group-self._fixedGroup]
-                    msg += '\n{}, handle: {}'.format(cstrName(cstr),h)
-                logger.warn(msg)
+            if interactive:
+                self.system.setDragging()
 
         self.system.log('done solving')
 
+    def _solveGroups(self,reportFailed):
+        failedType = 'redundant'
+        for group in self._groups:
+            self.system.log('solving {}, group {}',self._name,group)
+            try:
+                with self.profile.phase('solve'):
+                    self.system.solve(group=group,reportFailed=reportFailed)
+                iterations = getattr(self.system,'Iterations',None)
+                if iterations:
+                    self.profile.count('iterations',iterations)
+            except RuntimeError as e:
+                failedType = 'failed'
+                raise RuntimeError(translate('asm3', 'Failed to solve {}: {}').format(
+                    self._name,str(e)))
+            finally:
+                if reportFailed and self.system.Failed:
+                    # reported later by reportFailed() in the main thread
+                    self._failed.append((failedType,list(self.system.Failed)))
+
+    def reportFailed(self):
+        '''Log the failed constraints recorded by the last solveSystem()
+
+        Must be called in the main thread, as it reads the constraint objects.
+        '''
+        failed = self._failed
+        self._failed = []
+        for failedType,handles in failed:
+            cstrs = self._cstrs
+            msg = 'List of {} constraint:'.format(failedType)
+            for h in handles:
+                cstr = self._cstrMap.get(h,None)
+                if not cstr:
+                    try:
+                        c = self.system.getConstraint(h)
+                    except Exception as e2:
+                        logger.error('cannot find constraint {}: {}',h,e2)
+                        continue
+                    if c.group <= self._fixedGroup or \
+                       c.group-self._fixedGroup >= len(cstrs):
+                        logger.error('failed constraint in unexpected group'
+                                ' {}',c.group)
+                        continue
+                    cstr = cstrs[c.group-self._fixedGroup]
+                msg += '\n{}, handle: {}'.format(cstrName(cstr),h)
+            logger.warn(msg)
+
+    def update(self,recompute,rollback):
+        '''Write back the solved placements to the parts'''
+        self.reportFailed()
+        with self.profile.phase('update'):
+            touched = self._writeBack(rollback)
+
+        if recompute and touched:
+            with self.profile.phase('recompute'):
+                if not self.assembly.recompute(True):
+                    raise RuntimeError('Failed to recompute {}'.format(
+                        objName(self.assembly)))
+
+    def _writeBack(self,rollback):
         touched = False
         updates = []
+        moves = []
+
+        # Read back the placement parameters of all movable parts in one go
+        handles = []
+        offsets = {}
+        for part,partInfo in self._partMap.items():
+            if partInfo.Params and part not in self._fixedParts:
+                offsets[part] = len(handles)
+                handles += partInfo.Params
+        values = self.system.getParamValues(handles) if handles else []
+
         for part,partInfo in self._partMap.items():
             if partInfo.Update:
                 updates.append(partInfo)
@@ -149,8 +604,7 @@ class Solver(object):
                        not key.endswith('.p') or\
                        not key.startswith('Vertex'):
                         continue
-                    v = [ self.system.getParam(p).val for p in h.params ]
-                    v = FreeCAD.Vector(*v)
+                    v = FreeCAD.Vector(*self.system.getParamValues(h.params))
                     v = partInfo.Placement.inverse().multVec(v)
                     idx = utils.draftWireVertex2PointIndex(part,key[:-2])
                     if utils.isSamePos(points[idx],v):
@@ -168,8 +622,10 @@ class Solver(object):
                 if changed:
                     touched = True
                     part.Points = points
+                    self.profile.count('moved')
             else:
-                params = [self.system.getParam(h).val for h in partInfo.Params]
+                i = offsets[part]
+                params = [ float(v) for v in values[i:i+7] ]
                 p = params[:3]
                 q = (params[4],params[5],params[6],params[3])
                 pla = FreeCAD.Placement(FreeCAD.Vector(*p),FreeCAD.Rotation(*q))
@@ -185,7 +641,8 @@ class Solver(object):
                                         partInfo.Placement.copy()))
                     partInfo.Placement.Base = pla.Base
                     partInfo.Placement.Rotation = pla.Rotation
-                    setPlacement(part,pla)
+                    moves.append((part,pla))
+                    self.profile.count('moved')
 
                 if utils.isDraftCircle(part):
                     changed = False
@@ -198,7 +655,7 @@ class Solver(object):
                     if part.FirstAngle == part.LastAngle:
                         v = (self.system.getParam(h.radius).val,v0[1],v0[2])
                     else:
-                        params = [self.system.getParam(p).val for p in h.params]
+                        params = self.system.getParamValues(h.params)
                         p0 = FreeCAD.Vector(1,0,0)
                         p1 = FreeCAD.Vector(params[0],params[1],0)
                         p2 = FreeCAD.Vector(params[2],params[3],0)
@@ -218,6 +675,7 @@ class Solver(object):
                         part.Radius = v[0]
                         part.FirstAngle = v[1]
                         part.LastAngle = v[2]
+                        self.profile.count('moved')
 
         # Update parts with constraint multiplication, which auto expands
         # coplanar circular edges of the same radius. For performance sake, only
@@ -240,12 +698,12 @@ class Solver(object):
                             rollback.append((info0.PartName,
                                             info0.Part,
                                             info0.Placement.copy()))
-                        setPlacement(info0.Part,pla)
+                        moves.append((info0.Part,pla))
+                        self.profile.count('moved')
 
-        if recompute and touched:
-            if not assembly.recompute(True):
-                raise RuntimeError(
-                    'Failed to recompute {}'.format(objName(assembly)))
+        if moves:
+            setPlacements(moves)
+        return touched
 
 
     def isFixedPart(self,part):
@@ -277,54 +735,211 @@ class Solver(object):
         if fixed or info.Part in self._fixedParts:
             g = self._fixedGroup
         else:
-            g = self.group
+            g = self._partGroups.get(info.Part,self.group)
 
         if utils.isDraftWire(info):
             # Special treatment for draft wire. We do not change its placement,
             # but individual point position, instead.
             params = None
-            h = None
         else:
             self.system.NameTag = info.PartName
             params = self.system.addPlacement(info.Placement,group=g)
 
-            self.system.NameTag = info.PartName + '.p'
-            p = self.system.addPoint3d(*params[:3],group=g)
-            self.system.NameTag = info.PartName + '.n'
-            n = self.system.addNormal3d(*params[3:],group=g)
-            self.system.NameTag = info.PartName + '.np0'
-            p0 = self.system.addPoint3d(self.v0,self.v0,self.v0,group=g)
-            self.system.NameTag = info.PartName + '.np1'
-            p1 = self.system.addPoint3d(self.v0,self.v0,self.v1,group=g)
-            self.system.NameTag = info.PartName + '.l'
-            ln = self.system.addLineSegment(p0,p1,group=g)
-            self.system.NameTag = info.PartName + '.npx'
-            px = self.system.addPoint3d(self.v1,self.v0,self.v0,group=g)
-            self.system.NameTag = info.PartName + '.w'
-            w = self.system.addWorkplane(p,n,group=g)
-            h = PlaneInfo(entity=w,
-                    origin=PointInfo(entity=p, params=None,
-                                     vector=FreeCAD.Vector()),
-                    normal=NormalInfo(entity=n,rot=FreeCAD.Rotation(),
-                                     params=params,p0=p0,ln=ln,p1=p1,px=px,
-                                     vx=FreeCAD.Vector(1), pla=info.Placement))
-
         partInfo = PartInfo(Part = info.Part,
                             PartName = info.PartName,
                             Placement = info.Placement.copy(),
                             Params = params,
-                            Workplane = h,
+                            EntityGroup = g,
                             EntityMap = {},
                             Group = group if group else g,
                             Update = [])
 
+        if params:
+            # The normal is always added, because it is the entity that keeps
+            # the rotation quaternion at unit length
+            self.system.NameTag = info.PartName + '.n'
+            partInfo.EntityMap['Normal'] = self.system.addNormal3d(
+                    *params[3:],group=g)
+
         self.system.log('{}, {}',partInfo,g)
 
         self._partMap[info.Part] = partInfo
         return partInfo
 
+    def getPartWorkplane(self,partInfo):
+        '''Return the XY reference plane of the part as a PlaneInfo
+
+        The entities, except the normal added by getPartInfo(), are only
+        created on first request, because most parts are constrained through
+        entities of their elements instead.
+        '''
+        h = partInfo.EntityMap.get('Workplane',None)
+        if h or not partInfo.Params:
+            return h
+        params = partInfo.Params
+        name = partInfo.PartName
+        g = partInfo.EntityGroup
+        self.system.NameTag = name + '.p'
+        p = self.system.addPoint3d(*params[:3],group=g)
+        n = partInfo.EntityMap['Normal']
+        self.system.NameTag = name + '.np0'
+        p0 = self.system.addPoint3d(self.v0,self.v0,self.v0,group=g)
+        self.system.NameTag = name + '.np1'
+        p1 = self.system.addPoint3d(self.v0,self.v0,self.v1,group=g)
+        self.system.NameTag = name + '.l'
+        ln = self.system.addLineSegment(p0,p1,group=g)
+        self.system.NameTag = name + '.npx'
+        px = self.system.addPoint3d(self.v1,self.v0,self.v0,group=g)
+        self.system.NameTag = name + '.w'
+        w = self.system.addWorkplane(p,n,group=g)
+        h = PlaneInfo(entity=w,
+                origin=PointInfo(entity=p, params=None,
+                                 vector=FreeCAD.Vector()),
+                normal=NormalInfo(entity=n,rot=FreeCAD.Rotation(),
+                                 params=params,p0=p0,ln=ln,p1=p1,px=px,
+                                 vx=FreeCAD.Vector(1), pla=partInfo.Placement))
+        self.system.log('{}: add workplane {},{}',name,h,g)
+        partInfo.EntityMap['Workplane'] = h
+        return h
+
+def _getParamGroup():
+    return FreeCAD.ParamGet('User parameter:BaseApp/Preferences/Mod/Assembly3')
+
+def _getThreadCount():
+    return _getParamGroup().GetInt('SolverThreads',0)
+
+def _getDragOptions():
+    '''Return (weight,maxIterations,tolerance) for interactive dragging'''
+    param = _getParamGroup()
+    return (param.GetFloat('DragWeight',1e-2),
+            param.GetInt('DragMaxIterations',20),
+            param.GetFloat('DragTolerance',1e-6))
+
+def _getAssemblyLevels(assemblies):
+    '''Group a topologically sorted assembly list into levels
+
+    Assemblies of the same level do not depend on each other, and only
+    depend on assemblies of the previous levels.
+    '''
+    levels = []
+    levelMap = {}
+    for assembly in assemblies:
+        level = 0
+        for dep in assembly.OutListRecursive:
+            l = levelMap.get(dep,None)
+            if l is not None and l >= level:
+                level = l+1
+        levelMap[assembly] = level
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(assembly)
+    return levels
+
+def _solveSystem(args):
+    solver,reportFailed = args
+    try:
+        solver.solveSystem(reportFailed)
+    except Exception as e:
+        return e
+
+def _solveParallel(assemblies,threads,reportFailed,recompute,rollback,
+        profiles=None):
+    '''Solve independent assemblies concurrently
+
+    Recompute, system preparation and placement write-back are done in the
+    calling thread level by level, and only the numerical solving of the
+    assemblies of the same level runs in the thread pool. The solver backend
+    must not read any document object while solving.
+
+    Only the backends that release the GIL (see SystemBase.ParallelSolve)
+    are solved in the pool. The others, e.g. the SolveSpace binding, hold
+    the GIL during solve() and are solved in the calling thread instead, at
+    the same time as the pool.
+    '''
+    from multiprocessing.pool import ThreadPool
+    pool = None
+    try:
+        for level in _getAssemblyLevels(assemblies):
+            solvers = []
+            for assembly in level:
+                profile = _NoProfile
+                if profiles is not None:
+                    profile = SolverProfile(assembly)
+                    profiles.append(profile)
+                if recompute:
+                    logger.debug('recompute {}',objName(assembly))
+                    with profile.phase('recompute'):
+                        if not assembly.recompute(True):
+                            raise RuntimeError('Failed to recompute {}'.format(
+                                objName(assembly)))
+                if not System.isTouched(assembly):
+                    logger.debug('skip untouched assembly {}',objName(assembly))
+                    continue
+                solver = Solver(assembly,reportFailed,None,
+                                recompute,rollback,True,profile)
+                if solver.isPrepared():
+                    solvers.append(solver)
+                else:
+                    System.touch(assembly,False)
+
+            parallel = [solver for solver in solvers
+                            if System.isParallelSolve(solver.assembly)]
+            results = None
+            if len(parallel) > 1:
+                if not pool:
+                    pool = ThreadPool(threads)
+                logger.debug('solving {} assemblies in parallel',len(parallel))
+                results = pool.map_async(_solveSystem,
+                                  [(solver,reportFailed) for solver in parallel])
+            else:
+                parallel = []
+            errors = {}
+            for solver in solvers:
+                if solver not in parallel:
+                    errors[solver] = _solveSystem((solver,reportFailed))
+            if results:
+                errors.update(zip(parallel,results.get()))
+
+            for solver in solvers:
+                solver.reportFailed()
+            for solver in solvers:
+                e = errors[solver]
+                if e:
+                    raise e
+                solver.update(recompute,rollback)
+                System.touch(solver.assembly,False)
+                solver.assembly.Proxy.markSolved()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
 def _solve(objs=None,recursive=None,reportFailed=False,
-        recompute=True,dragPart=None,rollback=None):
+        recompute=True,dragPart=None,rollback=None,session=None,threads=None,
+        profile=None,interactive=False):
+    '''
+    session: optional dictionary for keeping the prepared solver of each
+             assembly alive across calls (e.g. during part dragging), so
+             that an assembly with unchanged constraints is re-solved by
+             patching the moved part parameters without rebuilding the
+             whole system.
+
+    threads: number of threads for solving independent assemblies in
+             parallel. If None, use parameter 'SolverThreads'. Parallel
+             solving is disabled for dragging and when threads < 2, and
+             only gives real speedup with the backends that release the
+             GIL, i.e. not with SolveSpace.
+
+    profile: whether to record the timing and counters of each solving
+             phase, which can be obtained by getLastProfile() afterwards.
+             If None, use the 'Solver profiling' command setting, which in
+             addition prints a summary to the report view.
+
+    interactive: whether this is an intermediate solve during dragging,
+                 which trades accuracy for speed. See _getDragOptions().
+                 The caller is expected to do a normal solve at the end of
+                 dragging.
+    '''
     if not objs:
         objs = Assembly.getSelection()
         if not objs:
@@ -369,19 +984,56 @@ def _solve(objs=None,recursive=None,reportFailed=False,
         if not assemblies:
             raise RuntimeError('no assembly need to be solved')
 
+    if threads is None:
+        threads = _getThreadCount()
+
+    interactive = _getDragOptions() if interactive and dragPart else None
+
+    report = False
+    if profile is None:
+        profile = report = getattr(gui.AsmCmdManager,'SolverProfile',False)
+    profiles = [] if profile else None
+    if profiles is not None:
+        global _LastProfiles
+        _LastProfiles = profiles
+
     try:
-        for assembly in assemblies:
-            if recompute:
-                logger.debug('recompute {}',objName(assembly))
-                if not assembly.recompute(True):
-                    raise RuntimeError(
-                            'Failed to recompute {}'.format(objName(assembly)))
-            if not System.isTouched(assembly):
-                logger.debug('skip untouched assembly {}',objName(assembly))
-                continue
-            Solver(assembly,reportFailed,dragPart,recompute,rollback)
-            System.touch(assembly,False)
+        if threads > 1 and len(assemblies) > 1 \
+                and session is None and not dragPart:
+            _solveParallel(assemblies,threads,reportFailed,recompute,rollback,
+                    profiles)
+        else:
+            for assembly in assemblies:
+                profile = _NoProfile
+                if profiles is not None:
+                    profile = SolverProfile(assembly)
+                    profiles.append(profile)
+                if recompute:
+                    logger.debug('recompute {}',objName(assembly))
+                    with profile.phase('recompute'):
+                        if not assembly.recompute(True):
+                            raise RuntimeError('Failed to recompute {}'.format(
+                                objName(assembly)))
+                if not System.isTouched(assembly):
+                    logger.debug('skip untouched assembly {}',objName(assembly))
+                    continue
+                solver = session.get(assembly,None) if session is not None \
+                            else None
+                if solver and solver.canReuse(dragPart):
+                    logger.debug('reuse solver of {}',objName(assembly))
+                    solver.resolve(reportFailed,dragPart,recompute,rollback,
+                            profile,interactive)
+                else:
+                    solver = Solver(assembly,reportFailed,dragPart,recompute,
+                            rollback,profile=profile,interactive=interactive)
+                    if session is not None:
+                        session[assembly] = solver
+                System.touch(assembly,False)
+                if not interactive:
+                    assembly.Proxy.markSolved()
     except Exception:
+        if session is not None:
+            session.clear()
         if rollback is not None:
             for name,part,v in reversed(rollback):
                 logger.debug('roll back {} to {}',name,v)
@@ -398,8 +1050,94 @@ def _solve(objs=None,recursive=None,reportFailed=False,
 
         raise
 
+    if report:
+        for p in profiles:
+            logger.msg(p.summary())
     return True
 
+def diagnose(assembly,tol=1e-8):
+    '''Return the SolverDiagnostics of an assembly without solving it
+
+    See Solver.diagnose() for details. The solver backend of the assembly must
+    support Jacobian evaluation.
+    '''
+    if not isTypeOf(assembly,Assembly):
+        raise TypeError('expect an assembly')
+    solver = Solver(assembly,False,None,False,None,True)
+    if not solver.isPrepared():
+        return SolverDiagnostics(0,OrderedDict(),[],[])
+    return solver.diagnose(tol)
+
+def sweep(cstr,prop,values,reportFailed=False):
+    '''Drive a constraint property through a sequence of values
+
+    Each step is solved starting from the result of the previous step. The
+    prepared system is kept and patched in place if supported by the solver
+    backend, or else rebuilt. The constraint is left with the last value.
+
+    cstr: the constraint object
+    prop: name of the constraint property, e.g. 'Angle', 'Distance'
+    values: sequence of the property values
+
+    Return a tuple (names,placements), where names is the list of the names
+    of the moving parts, and placements is a numpy array of shape
+    (len(values),len(names),7), holding the part placement at each step as
+    (x,y,z,qw,qx,qy,qz). The placements of a step failed to solve are NaN.
+    '''
+    import numpy as np
+    from .assembly import resolveAssembly
+    global _SolverBusy
+    if _SolverBusy:
+        raise RuntimeError("Recursive call of sweep() is not allowed")
+    assembly = resolveAssembly(cstr).Object
+    cls = Constraint.getType(cstr)
+    values = list(values)
+    names = None
+    placements = None
+    solver = None
+    try:
+        Assembly.cancelAutoSolve()
+        _SolverBusy = True
+        for i,value in enumerate(values):
+            prev = cls.getPropertyValues(cstr)
+            setattr(cstr,prop,value)
+            try:
+                if solver and solver.patchConstraint(cstr,prev):
+                    solver.resolve(reportFailed,None,False,None)
+                else:
+                    if not assembly.recompute(True):
+                        raise RuntimeError('Failed to recompute {}'.format(
+                            objName(assembly)))
+                    solver = Solver(assembly,reportFailed,None,False,None)
+            except RuntimeError as e:
+                logger.warn('failed to solve {} {}={}: {}',
+                        cstrName(cstr),prop,value,e)
+                solver = None
+                if placements is not None:
+                    placements[i] = np.nan
+                continue
+
+            infos = OrderedDict((info.PartName,info)
+                                    for info in solver.getMovingParts())
+            if names is None:
+                names = list(infos)
+                placements = np.full((len(values),len(names),7),np.nan)
+            for j,name in enumerate(names):
+                info = infos.get(name,None)
+                if info:
+                    pla = info.Placement
+                    q = pla.Rotation.Q
+                    placements[i,j] = (pla.Base.x,pla.Base.y,pla.Base.z,
+                                       q[3],q[0],q[1],q[2])
+        System.touch(assembly,False)
+    finally:
+        _SolverBusy = False
+        Assembly.cancelAutoSolve()
+
+    if names is None:
+        return [],np.full((len(values),0,7),np.nan)
+    return names,placements
+
 _SolverBusy = False
 
 def solve(*args, **kargs):
@@ -0,0 +1,124 @@
+'''
+Headless kinematic sweep
+
+Drive a constraint property of an assembly through a range of values, solve
+each step starting from the previous one, and export the part placements of
+all steps. Run it with FreeCADCmd, e.g.
+
+    FreeCADCmd -c "from freecad.asm3 import sweep; \\
+        sweep.main(['model.FCStd','Assembly','Constraint001','Angle',
+                    '--range','0,360,361','--output','poses.npz'])"
+
+The trajectory is exported according to the output file extension,
+
+    .npz: numpy archive with arrays 'names', 'values' and 'placements'
+    .csv: one row per step and part, with columns
+          step,value,part,x,y,z,qw,qx,qy,qz
+    others: JSON object with keys 'names', 'values' and 'placements'
+
+See solver.sweep() for the layout of the placements array.
+'''
+
+import sys, json, argparse
+from collections import OrderedDict
+import FreeCAD
+from .FCADLogger import FCADLogger
+from .utils import rootlogger
+logger = FCADLogger('asm3.sweep',parent=rootlogger)
+
+def makeRange(start,stop,steps):
+    '''Return a list of evenly spaced values including both ends'''
+    if steps < 2:
+        return [float(start)]
+    d = (stop-start)/float(steps-1)
+    return [ start+i*d for i in range(steps) ]
+
+def exportTrajectory(path,names,values,placements):
+    '''Export the result of solver.sweep() to a file'''
+    values = [ float(getattr(v,'Value',v)) for v in values ]
+    if path.endswith('.npz'):
+        import numpy as np
+        np.savez_compressed(path,names=np.array(names),
+                values=np.array(values),placements=placements)
+    elif path.endswith('.csv'):
+        with open(path,'w') as f:
+            f.write('step,value,part,x,y,z,qw,qx,qy,qz\n')
+            for i,value in enumerate(values):
+                for j,name in enumerate(names):
+                    f.write('{},{!r},{},{}\n'.format(i,value,name,
+                        ','.join([repr(float(v)) for v in placements[i,j]])))
+    else:
+        with open(path,'w') as f:
+            json.dump(OrderedDict((
+                ('names',list(names)),
+                ('values',values),
+                ('placements',placements.tolist()))),f)
+
+def sweep(assembly,constraint,prop,values,output=None):
+    '''Run a sweep on the named assembly and constraint of the active document
+
+    assembly: assembly object or its name
+    constraint: constraint object or its name
+    output: optional file path to export the trajectory
+
+    Return the result of solver.sweep()
+    '''
+    from . import solver
+    doc = FreeCAD.ActiveDocument
+    if isinstance(assembly,str):
+        assembly = doc.getObject(assembly)
+    if isinstance(constraint,str):
+        constraint = doc.getObject(constraint)
+    if not assembly or not constraint:
+        raise ValueError('assembly or constraint not found')
+    from .assembly import Assembly, AsmConstraint, isTypeOf
+    if not isTypeOf(assembly,Assembly):
+        raise ValueError('{} is not an assembly'.format(assembly.Name))
+    if not isTypeOf(constraint,AsmConstraint):
+        raise ValueError('{} is not a constraint'.format(constraint.Name))
+    if constraint.Proxy.getAssembly().Object != assembly:
+        raise ValueError('constraint {} does not belong to assembly {}'.format(
+            constraint.Name,assembly.Name))
+    logger.info('sweeping {}.{} of {} with {} values',constraint.Name,prop,
+            assembly.Name,len(values))
+    names,placements = solver.sweep(constraint,prop,values)
+    if output:
+        exportTrajectory(output,names,values,placements)
+    return names,placements
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='asm3-sweep',
+                description='Assembly3 headless kinematic sweep')
+    parser.add_argument('document',help='FreeCAD document file')
+    parser.add_argument('assembly',help='name of the assembly object')
+    parser.add_argument('constraint',help='name of the constraint object')
+    parser.add_argument('property',help='name of the constraint property')
+    parser.add_argument('--range',default='',
+            help='start,stop,steps of the evenly spaced values')
+    parser.add_argument('--values',default='',
+            help='comma separated values, used if no range is given')
+    parser.add_argument('--output',default='',
+            help='output file, .npz, .csv or .json (default: JSON to stdout)')
+    args = parser.parse_args(argv if argv is not None else sys.argv[1:])
+
+    if args.range:
+        start,stop,steps = args.range.split(',')
+        values = makeRange(float(start),float(stop),int(steps))
+    else:
+        values = [ float(v) for v in args.values.split(',') if v ]
+    if not values:
+        raise ValueError('no values to sweep')
+
+    from .benchmark import setup
+    setup()
+    doc = FreeCAD.openDocument(args.document)
+    try:
+        names,placements = sweep(args.assembly,args.constraint,
+                args.property,values,args.output)
+        if not args.output:
+            json.dump(OrderedDict((
+                ('names',names),
+                ('values',values),
+                ('placements',placements.tolist()))),sys.stdout)
+    finally:
+        FreeCAD.closeDocument(doc.Name)
@@ -0,0 +1,1198 @@
+from collections import namedtuple, OrderedDict
+import math
+try:
+    from six import with_metaclass
+except ImportError:
+    from .deps import with_metaclass
+from .proxy import PropertyInfo
+from .constraint import Constraint
+from .system import System, SystemBase, SystemExtension
+from .utils import syslogger as logger
+import numpy as np
+
+from FreeCAD import Qt
+translate = Qt.translate
+
+# Pure NumPy solver backend
+#
+# Each entity is reduced to a canonical form when it is created. A point is
+# R(q)*c + t, and a normal is the quaternion product a*b, where each component
+# of q, c, t, a and b refers to either a parameter or a constant literal. All
+# points and normals used in a solving group are then evaluated in one batch
+# together with their Jacobian. Constraints of the same type (and the same
+# kind of arguments) are evaluated in batches by hand written residual kernels
+# with analytic Jacobian, and the system is solved with Levenberg-Marquardt.
+
+def _unsupported(what,obj):
+    '''Return the message of an entity not representable in the canonical
+    forms above, which fails the solving like any other solver error'''
+    return translate('asm3','{} of {} is not supported by the NumPy solver, '
+            'please choose another solver backend').format(what,obj)
+
+def _makePropInfo(name,tp,doc='',default=None):
+    return PropertyInfo(System,name,tp,doc,group='Solver',default=default).Key
+
+class SystemNumPy(with_metaclass(System, SystemBase)):
+    _id = 3
+    ParallelSolve = True
+    _props = SystemBase._props + [
+        _makePropInfo('Tolerance','App::PropertyPrecision',
+            'Maximum allowed residual of the equations. Use the default\n'
+            'if zero.'),
+        _makePropInfo('MaxIterations','App::PropertyInteger',
+            'Maximum number of iterations. Use the default if zero.'),
+    ]
+
+    def __init__(self,obj):
+        super(SystemNumPy,self).__init__(obj)
+
+    @classmethod
+    def getName(cls):
+        return 'NumPy'
+
+    def isConstraintSupported(self,cstrName):
+        cls = Constraint.getInfo().TypeNameMap.get(cstrName,None)
+        if getattr(cls,'_measure',False):
+            return True
+        name = getattr(cls,'_cstrFuncName','add'+cstrName)
+        return hasattr(_SystemNumPy,name)
+
+    def getSystem(self,obj):
+        return _SystemNumPy(self,getattr(obj,'Tolerance',0),
+                getattr(obj,'MaxIterations',0))
+
+    def isDisabled(self,_obj):
+        return False
+
+
+class _Param(object):
+    def __init__(self,name,v,g):
+        self.Name = name
+        self.val = v
+        self.group = g
+        self._index = -1
+
+    def __repr__(self):
+        return '_{}:{}'.format(self.Name,self.val)
+
+
+class _MetaType(type):
+    _types = []
+
+    def __init__(cls, name, bases, attrs):
+        super(_MetaType,cls).__init__(name,bases,attrs)
+        if len(cls._args):
+            logger.trace('registing numpy {}', cls.__name__)
+            cls.__class__._types.append(cls)
+
+
+class _Base(with_metaclass(_MetaType, object)):
+    _args = ()
+    # optional arguments as tuple(name, default)
+    _opts = ()
+    # arguments to be converted to new parameters
+    _vargs = ()
+    Kind = None
+    # batched evaluation of the equations, see _Constraint
+    evaluate = None
+
+    def __init__(self,system,args,kargs):
+        cls = self.__class__
+        names = list(cls._args) + [k for k,_ in cls._opts]
+        kargs = dict(kargs)
+        g = kargs.pop('group',0)
+        if len(args) > len(names):
+            if len(args) > len(names)+1:
+                raise ValueError('too many parameters when making '+str(self))
+            g = args[-1]
+            args = args[:-1]
+        values = dict(cls._opts)
+        values.update(zip(names,args))
+        for k,v in kargs.items():
+            if k not in names or k in names[:len(args)]:
+                raise KeyError('unknown or duplicate key "{}" when making '
+                        '{}'.format(k,self))
+            values[k] = v
+        for k in cls._args:
+            if k not in values:
+                raise ValueError('not enough parameters when making '+str(self))
+        self.group = g if g else system.GroupHandle
+        self.Name = system.Tag
+        for k in names:
+            setattr(self,k,values[k])
+        if cls._vargs:
+            nameTagSave = system.NameTag
+            nameTag = nameTagSave + '.' if nameTagSave else ''
+            for k in cls._vargs:
+                system.NameTag = nameTag + k
+                setattr(self,k,system.addParamV(getattr(self,k),self.group))
+            system.NameTag = nameTagSave
+        self.setup(system)
+
+    def setup(self,system):
+        pass
+
+    def getSignature(self):
+        '''Return the kinds of the arguments for grouping the batches'''
+        cls = self.__class__
+        return tuple(getattr(getattr(self,k),'Kind',None)
+                for k in cls._args + tuple(k for k,_ in cls._opts))
+
+    def __repr__(self):
+        return '{}<{}>'.format(getattr(self,'Name','?'),
+                self.__class__.__name__[1:])
+
+
+class _Entity(_Base):
+    pass
+
+class _Point3d(_Entity):
+    _args = ('x','y','z')
+    Kind = 'point'
+
+    def setup(self,system):
+        self.refs = system.Identity + system.Zero + \
+                tuple(system.ref(v) for v in (self.x,self.y,self.z))
+
+class _Point3dV(_Point3d):
+    _vargs = _Point3d._args
+
+class _Point2d(_Entity):
+    _args = ('wrkpln', 'u', 'v')
+    Kind = 'point'
+
+    def setup(self,system):
+        origin = self.wrkpln.origin
+        normal = self.wrkpln.normal
+        if origin.refs[:7] != system.Identity+system.Zero or \
+                normal.refs[:4] != system.Identity:
+            raise RuntimeError(_unsupported('2D point on a transformed '
+                'workplane',self))
+        self.refs = normal.refs[4:] + \
+                (system.ref(self.u),system.ref(self.v),system.Zero[0]) + \
+                origin.refs[7:]
+
+class _Point2dV(_Point2d):
+    _vargs = ('u','v')
+
+class _Normal3d(_Entity):
+    _args = ('qw','qx','qy','qz')
+    Kind = 'normal'
+
+    def setup(self,system):
+        self.refs = system.Identity + \
+                tuple(system.ref(v) for v in (self.qw,self.qx,self.qy,self.qz))
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return ctx.normalRows(items,None)
+
+    @classmethod
+    def evaluate(cls,ctx,rows):
+        # make sure the quaternion is normalized
+        q = ctx.quaternion(rows)
+        return _offset(_dot(q,q),-1.0)
+
+class _Normal3dV(_Normal3d):
+    _vargs = _Normal3d._args
+
+class _Normal2d(_Entity):
+    _args = ('wrkpln',)
+    Kind = 'normal'
+
+    def setup(self,system):
+        self.refs = self.wrkpln.normal.refs
+
+class _Distance(_Entity):
+    _args = ('d',)
+    Kind = 'distance'
+
+    def setup(self,system):
+        self.refs = (system.ref(self.d),)
+
+class _DistanceV(_Distance):
+    _vargs = _Distance._args
+
+class _LineSegment(_Entity):
+    _args = ('p1','p2')
+    Kind = 'line'
+
+class _Workplane(_Entity):
+    _args = ('origin', 'normal')
+    Kind = 'workplane'
+
+class _Circle(_Entity):
+    _args = ('center', 'normal', 'radius')
+    Kind = 'circle'
+
+class _ArcOfCircle(_Entity):
+    _args = ('wrkpln', 'center', 'start', 'end')
+    Kind = 'arc'
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'center'),ctx.pointRows(items,'start'),
+                ctx.pointRows(items,'end'))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        c,s,e = [ctx.point(rows) for rows in data]
+        return _sub(_norm(_sub(c,s)),_norm(_sub(c,e)))
+
+class _Transform(_Entity):
+    _args = ('src', 'dx', 'dy', 'dz', 'qw', 'qx', 'qy', 'qz')
+    _opts = (('asAxisAngle',False),)
+
+    def setup(self,system):
+        if self.asAxisAngle:
+            raise RuntimeError(_unsupported('axis angle transformation',self))
+        src = self.src
+        self.Kind = src.Kind
+        q = tuple(system.ref(v) for v in (self.qw,self.qx,self.qy,self.qz))
+        if src.Kind == 'point':
+            if src.refs[:7] != system.Identity+system.Zero:
+                raise RuntimeError(_unsupported('cascaded transformation',
+                    self))
+            self.refs = q + src.refs[7:] + \
+                    tuple(system.ref(v) for v in (self.dx,self.dy,self.dz))
+        elif src.Kind == 'normal':
+            if src.refs[:4] != system.Identity:
+                raise RuntimeError(_unsupported('cascaded transformation',
+                    self))
+            self.refs = q + src.refs[4:]
+        else:
+            raise ValueError('unsupported transformation {} of {}'.format(
+                self,src))
+
+
+class _Expr(object):
+    '''Batched values with Jacobian
+
+    V: (m,k) array of m rows of k values
+    J: (m,k,s) array of the derivatives against s slots of each row
+    I: (m,s) array of the index of the slots into the evaluation vector
+    '''
+    __slots__ = ('V','J','I')
+
+    def __init__(self,V,J,I):
+        self.V = V
+        self.J = J
+        self.I = I
+
+def _const(V):
+    V = np.asarray(V,dtype=float)
+    m,k = V.shape
+    return _Expr(V,np.zeros((m,k,0)),np.zeros((m,0),dtype=int))
+
+def _add(a,b,sign=1.0):
+    return _Expr(a.V+sign*b.V,np.concatenate((a.J,sign*b.J),axis=2),
+            np.concatenate((a.I,b.I),axis=1))
+
+def _sub(a,b):
+    return _add(a,b,-1.0)
+
+def _offset(a,c):
+    return _Expr(a.V+c,a.J,a.I)
+
+def _scale(a,s):
+    s = np.asarray(s,dtype=float)
+    if s.ndim:
+        return _Expr(a.V*s[:,None],a.J*s[:,None,None],a.I)
+    return _Expr(a.V*s,a.J*s,a.I)
+
+def _dot(a,b):
+    V = np.einsum('mk,mk->m',a.V,b.V)[:,None]
+    J = np.concatenate((np.einsum('mk,mks->ms',b.V,a.J),
+                        np.einsum('mk,mks->ms',a.V,b.J)),axis=1)
+    return _Expr(V,J[:,None,:],np.concatenate((a.I,b.I),axis=1))
+
+def _cross(a,b):
+    V = np.cross(a.V,b.V)
+    Ja = np.cross(a.J,b.V[:,:,None],axisa=1,axisb=1,axisc=1)
+    Jb = np.cross(a.V[:,:,None],b.J,axisa=1,axisb=1,axisc=1)
+    return _Expr(V,np.concatenate((Ja,Jb),axis=2),
+            np.concatenate((a.I,b.I),axis=1))
+
+def _mul(a,b):
+    'multiply with a scalar expression b'
+    return _Expr(a.V*b.V,np.concatenate((a.J*b.V[:,:,None],
+                                         a.V[:,:,None]*b.J),axis=2),
+            np.concatenate((a.I,b.I),axis=1))
+
+def _div(a,b):
+    'divide by a scalar expression b'
+    return _Expr(a.V/b.V,np.concatenate((a.J/b.V[:,:,None],
+                                -(a.V/(b.V*b.V))[:,:,None]*b.J),axis=2),
+            np.concatenate((a.I,b.I),axis=1))
+
+def _norm(a):
+    n = np.sqrt(np.einsum('mk,mk->m',a.V,a.V))
+    u = a.V/np.where(n>0,n,1.0)[:,None]
+    return _Expr(n[:,None],np.einsum('mk,mks->ms',u,a.J)[:,None,:],a.I)
+
+def _take(a,comps):
+    'take the components given by an (m,c) index array from each row'
+    rows = np.arange(len(a.V))[:,None]
+    return _Expr(a.V[rows,comps],a.J[rows,comps],a.I)
+
+def _stack(*exprs):
+    'stack the values of the expressions in each row'
+    m = len(exprs[0].V)
+    k = sum(e.V.shape[1] for e in exprs)
+    s = sum(e.I.shape[1] for e in exprs)
+    J = np.zeros((m,k,s))
+    i = j = 0
+    for e in exprs:
+        ek,es = e.V.shape[1],e.I.shape[1]
+        J[:,i:i+ek,j:j+es] = e.J
+        i += ek
+        j += es
+    return _Expr(np.concatenate([e.V for e in exprs],axis=1),J,
+            np.concatenate([e.I for e in exprs],axis=1))
+
+def _select(cond,a,b):
+    'select rows of a or b, which must have the same slots'
+    return _Expr(np.where(cond[:,None],a.V,b.V),
+            np.where(cond[:,None,None],a.J,b.J),a.I)
+
+def _cross2d(a,b):
+    'cross product of two (m,2) expressions'
+    return _sub(_mul(_take(a,_Cols[0]),_take(b,_Cols[1])),
+                _mul(_take(a,_Cols[1]),_take(b,_Cols[0])))
+
+_Cols = np.array([[0],[1],[2]])
+
+# Components of a cross product used for the parallel equations. Similar to
+# SolveSpace, we skip the component of the largest direction component.
+_ParallelComponents = np.array([[1,2],[2,0],[0,1]])
+
+def _parallelComponents(a,b):
+    na = np.linalg.norm(a.V,axis=1)
+    nb = np.linalg.norm(b.V,axis=1)
+    d = np.abs(a.V)/np.where(na>0,na,1.0)[:,None] + \
+        np.abs(b.V)/np.where(nb>0,nb,1.0)[:,None]
+    return _ParallelComponents[np.argmax(d,axis=1)]
+
+def _makeRotationTensor():
+    # R(q)[i,j] = sum(T[i,j,a,b]*q[a]*q[b]) of quaternion (w,x,y,z)
+    T = np.zeros((3,3,4,4))
+    def _set(i,j,a,b,v):
+        T[i,j,a,b] += v*0.5
+        T[i,j,b,a] += v*0.5
+    for i,signs in enumerate(((1,1,-1,-1),(1,-1,1,-1),(1,-1,-1,1))):
+        for a,v in enumerate(signs):
+            _set(i,i,a,a,v)
+    for i,j,a,b,v in ((0,1,1,2,2),(0,1,0,3,-2),(0,2,1,3,2),(0,2,0,2,2),
+                      (1,0,1,2,2),(1,0,0,3,2),(1,2,2,3,2),(1,2,0,1,-2),
+                      (2,0,1,3,2),(2,0,0,2,-2),(2,1,2,3,2),(2,1,0,1,2)):
+        _set(i,j,a,b,v)
+    return T
+
+def _makeProductTensor():
+    # (a*b)[i] = sum(P[i,j,k]*a[j]*b[k]) of quaternion (w,x,y,z)
+    P = np.zeros((4,4,4))
+    for i,j,k,v in ((0,0,0,1),(0,1,1,-1),(0,2,2,-1),(0,3,3,-1),
+                    (1,0,1,1),(1,1,0,1),(1,2,3,1),(1,3,2,-1),
+                    (2,0,2,1),(2,1,3,-1),(2,2,0,1),(2,3,1,1),
+                    (3,0,3,1),(3,1,2,1),(3,2,1,-1),(3,3,0,1)):
+        P[i,j,k] = v
+    return P
+
+_RotationTensor = _makeRotationTensor()
+_ProductTensor = _makeProductTensor()
+
+def _rotation(q):
+    '''Return the rotation matrices of an (m,4) quaternion array, and their
+    derivatives as an (m,4,3,3) array'''
+    R = np.einsum('ijab,ma,mb->mij',_RotationTensor,q,q)
+    dR = 2.0*np.einsum('ijab,mb->maij',_RotationTensor,q)
+    return R,dR
+
+
+class _Context(object):
+    '''Evaluation context of a solving group'''
+
+    def __init__(self,system,group):
+        self.system = system
+        self.Params = [p for p in system.Params if p.group == group]
+        nvar = len(self.Params)
+        self.nvar = nvar
+        self.pmap = np.arange(len(system.Params)) + nvar
+        for i,p in enumerate(self.Params):
+            self.pmap[p._index] = i
+        self.lbase = nvar + len(system.Params)
+        self.consts = np.array([p.val for p in system.Params] +
+                system.Literals,dtype=float)
+        self.x0 = np.array([p.val for p in self.Params],dtype=float)
+
+        self.points = OrderedDict()
+        self.normals = OrderedDict()
+        batches = OrderedDict()
+        for o in system.Equations:
+            if o.group == group:
+                key = (o.__class__,o.getSignature())
+                batches.setdefault(key,[]).append(o)
+        self.batches = [(cls,items,cls.prepare(self,items))
+                for (cls,_),items in batches.items()]
+
+        self.pointIdx = self.zindex([e.refs for e in self.points],10)
+        self.normalIdx = self.zindex([e.refs for e in self.normals],8)
+        self.dragged = None
+
+    def zindex(self,refs,n=None):
+        'map parameter or literal references to the evaluation vector'
+        refs = np.array(refs,dtype=int)
+        if n is not None:
+            refs = refs.reshape(-1,n)
+        return np.where(refs>=0,self.pmap[np.maximum(refs,0)],
+                        self.lbase-refs-1)
+
+    def setDragging(self,params,weight):
+        idx = [i for i,p in enumerate(self.Params) if p in params]
+        if idx and weight:
+            self.dragged = (np.array(idx,dtype=int),weight)
+
+    def _attr(self,items,attr):
+        if attr is None:
+            return items
+        if '.' in attr:
+            attrs = attr.split('.')
+            ret = items
+            for a in attrs:
+                ret = [getattr(o,a) for o in ret]
+            return ret
+        return [getattr(o,attr) for o in items]
+
+    def _rows(self,table,entities):
+        rows = []
+        for e in entities:
+            row = table.get(e,None)
+            if row is None:
+                row = len(table)
+                table[e] = row
+            rows.append(row)
+        return np.array(rows,dtype=int)
+
+    def pointRows(self,items,attr):
+        return self._rows(self.points,self._attr(items,attr))
+
+    def normalRows(self,items,attr):
+        return self._rows(self.normals,self._attr(items,attr))
+
+    def scalarRows(self,items,attr):
+        return self.zindex([e.refs[0] for e in self._attr(items,attr)])
+
+    def planeRows(self,items,attr):
+        if not getattr(items[0],attr):
+            return
+        planes = self._attr(items,attr)
+        return (self.pointRows(planes,'origin'),
+                self.normalRows(planes,'normal'))
+
+    def dirRows(self,items,attr):
+        'rows of either line segments or normals'
+        entities = self._attr(items,attr)
+        if entities[0].Kind == 'line':
+            return (self.pointRows(entities,'p1'),
+                    self.pointRows(entities,'p2'))
+        return (self.normalRows(entities,None),)
+
+    def radiusRows(self,items,attr):
+        entities = self._attr(items,attr)
+        if entities[0].Kind == 'arc':
+            return (self.pointRows(entities,'center'),
+                    self.pointRows(entities,'start'))
+        return (self.scalarRows(entities,'radius'),)
+
+    def point(self,rows):
+        return _Expr(self.pointV[rows],self.pointJ[rows],self.pointIdx[rows])
+
+    def axis(self,rows,k):
+        return _Expr(self.axisV[k][rows],self.axisJ[k][rows],
+                self.normalIdx[rows])
+
+    def quaternion(self,rows):
+        idx = self.normalIdx[rows][:,4:]
+        J = np.broadcast_to(np.eye(4),(len(rows),4,4))
+        return _Expr(self.z[idx],J,idx)
+
+    def scalar(self,idx):
+        return _Expr(self.z[idx][:,None],np.ones((len(idx),1,1)),idx[:,None])
+
+    def direction(self,rows):
+        if len(rows) == 2:
+            return _sub(self.point(rows[0]),self.point(rows[1]))
+        return self.axis(rows[0],2)
+
+    def radius(self,rows):
+        if len(rows) == 2:
+            return _norm(_sub(self.point(rows[0]),self.point(rows[1])))
+        return self.scalar(rows[0])
+
+    def project(self,v,plane):
+        'project a vector expression to the workplane axes'
+        if not plane:
+            return v
+        n = plane[1]
+        return _stack(_dot(v,self.axis(n,0)),_dot(v,self.axis(n,1)))
+
+    def _evalPoints(self,z):
+        idx = self.pointIdx
+        if not len(idx):
+            return
+        q = z[idx[:,:4]]
+        c = z[idx[:,4:7]]
+        R,dR = _rotation(q)
+        self.pointV = np.einsum('mij,mj->mi',R,c) + z[idx[:,7:]]
+        self.pointJ = np.concatenate((np.einsum('maij,mj->mia',dR,c),R,
+            np.broadcast_to(np.eye(3),(len(idx),3,3))),axis=2)
+
+    def _evalNormals(self,z):
+        idx = self.normalIdx
+        if not len(idx):
+            return
+        a = z[idx[:,:4]]
+        b = z[idx[:,4:]]
+        p = np.einsum('ijk,mj,mk->mi',_ProductTensor,a,b)
+        dpa = np.einsum('ijk,mk->mij',_ProductTensor,b)
+        dpb = np.einsum('ijk,mj->mik',_ProductTensor,a)
+        R,dR = _rotation(p)
+        self.axisV = []
+        self.axisJ = []
+        for k in range(3):
+            dp = np.transpose(dR[:,:,:,k],(0,2,1))
+            self.axisV.append(R[:,:,k])
+            self.axisJ.append(np.concatenate((np.matmul(dp,dpa),
+                np.matmul(dp,dpb)),axis=2))
+
+    def residuals(self,x):
+        'Return the list of batched residual expressions'
+        z = np.concatenate((x,self.consts))
+        self.z = z
+        self._evalPoints(z)
+        self._evalNormals(z)
+        return [cls.evaluate(self,data) for cls,_,data in self.batches]
+
+    def evaluate(self,x):
+        '''Return the residual vector and the Jacobian matrix'''
+        nvar = self.nvar
+        values = []
+        flats = []
+        weights = []
+        n = 0
+        for e in self.residuals(x):
+            m,k = e.V.shape
+            values.append(e.V.ravel())
+            rows = (n + np.arange(m*k)).reshape(m,k,1)
+            cols = np.broadcast_to(e.I[:,None,:],e.J.shape)
+            mask = cols < nvar
+            flats.append((rows*nvar+cols)[mask])
+            weights.append(e.J[mask])
+            n += m*k
+        if self.dragged:
+            idx,weight = self.dragged
+            values.append(weight*(x[idx]-self.x0[idx]))
+            flats.append((n+np.arange(len(idx)))*nvar+idx)
+            weights.append(np.full(len(idx),weight,dtype=float))
+            n += len(idx)
+        r = np.concatenate(values) if values else np.zeros(0)
+        if flats:
+            J = np.bincount(np.concatenate(flats),np.concatenate(weights),
+                    minlength=n*nvar)
+        else:
+            J = np.zeros(n*nvar)
+        return r,J.reshape(n,nvar)
+
+    def getOwners(self):
+        'Return the equation objects of each residual row'
+        ret = []
+        for (_,items,_),e in zip(self.batches,self.residuals(self.x0)):
+            k = e.V.shape[1]
+            for o in items:
+                ret += [o]*k
+        return ret
+
+    def countEquations(self):
+        return sum(e.V.size for e in self.residuals(self.x0))
+
+    def getFailed(self,x,tol):
+        'Return the equation objects that are not satisfied'
+        ret = []
+        for (_,items,_),e in zip(self.batches,self.residuals(x)):
+            failed = np.max(np.abs(e.V),axis=1) > tol
+            ret += [o for o,f in zip(items,failed) if f]
+        return ret
+
+
+_LMResult = namedtuple('NumPyLMResult',('x','success','message','nit','nfev'))
+
+def _levenbergMarquardt(fun,x0,tol,maxIter,minimize=False):
+    '''Solve the equations in the least square sense
+
+    fun: function returning the residual vector and the Jacobian matrix
+    minimize: if True, stop when the sum of square of the residuals stops
+              decreasing instead of requiring all residuals within tol, used
+              for the weighted dragging residuals that never reach zero.
+    '''
+    x = x0.copy()
+    r,J = fun(x)
+    nfev = 1
+    cost = r.dot(r)
+    lam = 1e-3
+    for nit in range(maxIter):
+        if not np.all(np.isfinite(r)):
+            return _LMResult(x,False,'invalid residual',nit,nfev)
+        if not minimize and (not len(r) or np.max(np.abs(r)) <= tol):
+            return _LMResult(x,True,'converged',nit,nfev)
+        A = J.T.dot(J)
+        g = J.T.dot(r)
+        d = np.diag(A)
+        d = np.maximum(d,1e-12*max(1.0,d.max()))
+        while True:
+            try:
+                dx = np.linalg.solve(A+np.diag(lam*d),-g)
+            except np.linalg.LinAlgError:
+                dx = None
+            if dx is not None:
+                xn = x+dx
+                rn,Jn = fun(xn)
+                nfev += 1
+                cn = rn.dot(rn)
+                if np.isfinite(cn) and cn < cost:
+                    break
+            lam *= 10.0
+            if lam > 1e15:
+                if minimize:
+                    return _LMResult(x,True,'converged',nit,nfev)
+                return _LMResult(x,False,
+                        translate('asm3Logger','not converging'),nit,nfev)
+        lam = max(lam*0.1,1e-15)
+        if minimize and cost-cn <= tol*cost:
+            return _LMResult(xn,True,'converged',nit+1,nfev)
+        x,r,J,cost = xn,rn,Jn,cn
+    if minimize or np.max(np.abs(r)) <= tol:
+        return _LMResult(x,True,'converged',maxIter,nfev)
+    return _LMResult(x,False,translate('asm3Logger','too many iterations'),
+            maxIter,nfev)
+
+
+class _Constraint(_Base):
+    '''Base class of constraints
+
+    Constraints of the same class and signature are evaluated in a batch.
+    prepare() is called once per solving with the list of constraints to
+    collect their entity rows, and evaluate() is called with the returned
+    data on each iteration to return an _Expr of the residuals.
+    '''
+    _opts = (('wrkpln',0),)
+
+class _PointsCoincident(_Constraint):
+    _args = ('p1', 'p2')
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'p1'),ctx.pointRows(items,'p2'),
+                ctx.planeRows(items,'wrkpln'))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        p1,p2,w = data
+        return ctx.project(_sub(ctx.point(p1),ctx.point(p2)),w)
+
+class _PointInPlane(_Constraint):
+    _args = ('pt', 'pln')
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'pt'),ctx.planeRows(items,'pln'),
+                np.zeros(len(items)))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        pt,(o,n),d = data
+        e = _dot(_sub(ctx.point(pt),ctx.point(o)),ctx.axis(n,2))
+        return _offset(e,-d[:,None])
+
+class _PointPlaneDistance(_PointInPlane):
+    _args = ('d', 'pt', 'pln')
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'pt'),ctx.planeRows(items,'pln'),
+                np.array([float(o.d) for o in items]))
+
+class _PointOnLine(_Constraint):
+    _args = ('pt', 'line')
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return {'pt':ctx.pointRows(items,'pt'),
+                'line':ctx.dirRows(items,'line'),
+                'wrkpln':ctx.planeRows(items,'wrkpln')}
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        p1,p2 = data['line']
+        a = ctx.point(p1)
+        v = _sub(ctx.point(data['pt']),a)
+        u = _sub(ctx.point(p2),a)
+        w = data['wrkpln']
+        if w:
+            return _cross2d(ctx.project(v,w),ctx.project(u,w))
+        e = _cross(v,u)
+        if 'comps' not in data:
+            data['comps'] = _parallelComponents(u,u)
+        return _take(e,data['comps'])
+
+class _PointLineDistance(_Constraint):
+    _args = ('d', 'pt', 'line')
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'pt'),ctx.dirRows(items,'line'),
+                ctx.planeRows(items,'wrkpln'),
+                np.array([float(o.d) for o in items]))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        pt,(p1,p2),w,d = data
+        a = ctx.point(p1)
+        v = ctx.project(_sub(ctx.point(pt),a),w)
+        u = ctx.project(_sub(ctx.point(p2),a),w)
+        e = _cross2d(v,u) if w else _cross(v,u)
+        return _offset(_div(_norm(e),_norm(u)),-d[:,None])
+
+class _PointsDistance(_Constraint):
+    _args = ('d', 'p1', 'p2')
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'p1'),ctx.pointRows(items,'p2'),
+                ctx.planeRows(items,'wrkpln'),
+                np.array([float(o.d) for o in items]))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        p1,p2,w,d = data
+        v = ctx.project(_sub(ctx.point(p1),ctx.point(p2)),w)
+        return _offset(_norm(v),-d[:,None])
+
+class _PointsProjectDistance(_Constraint):
+    _args = ('d', 'p1', 'p2', 'line')
+    _opts = ()
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'p1'),ctx.pointRows(items,'p2'),
+                ctx.dirRows(items,'line'),
+                np.array([float(o.d) for o in items]))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        p1,p2,line,d = data
+        u = ctx.direction(line)
+        e = _dot(_sub(ctx.point(p1),ctx.point(p2)),u)
+        return _offset(_div(e,_norm(u)),-d[:,None])
+
+class _Parallel(_Constraint):
+    _args = ('l1', 'l2')
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return {'l1':ctx.dirRows(items,'l1'),'l2':ctx.dirRows(items,'l2'),
+                'wrkpln':ctx.planeRows(items,'wrkpln')}
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        a = ctx.direction(data['l1'])
+        b = ctx.direction(data['l2'])
+        w = data['wrkpln']
+        if w:
+            return _dot(_cross(a,b),ctx.axis(w[1],2))
+        if 'comps' not in data:
+            data['comps'] = _parallelComponents(a,b)
+        return _take(_cross(a,b),data['comps'])
+
+class _Angle(_Constraint):
+    _args = ('degree', 'supplement', 'l1', 'l2')
+
+    @classmethod
+    def getCosine(cls,o):
+        return math.cos(math.radians(float(o.degree)))
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.dirRows(items,'l1'),ctx.dirRows(items,'l2'),
+                ctx.planeRows(items,'wrkpln'),
+                np.array([-1.0 if getattr(o,'supplement',False) else 1.0
+                            for o in items]),
+                np.array([cls.getCosine(o) for o in items]))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        l1,l2,w,sign,cos = data
+        a = ctx.project(_scale(ctx.direction(l1),sign),w)
+        b = ctx.project(ctx.direction(l2),w)
+        e = _div(_dot(a,b),_mul(_norm(a),_norm(b)))
+        return _offset(e,-cos[:,None])
+
+class _Perpendicular(_Angle):
+    _args = ('l1', 'l2')
+
+    @classmethod
+    def getCosine(cls,_o):
+        return 0.0
+
+class _SameOrientation(_Constraint):
+    _args = ('n1', 'n2')
+    _opts = ()
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return {'n1':ctx.normalRows(items,'n1'),
+                'n2':ctx.normalRows(items,'n2')}
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        n1,n2 = data['n1'],data['n2']
+        z1,z2 = ctx.axis(n1,2),ctx.axis(n2,2)
+        x1 = ctx.axis(n1,0)
+        d1 = _dot(x1,ctx.axis(n2,1))
+        d2 = _dot(x1,ctx.axis(n2,0))
+        if 'comps' not in data:
+            data['comps'] = _parallelComponents(z1,z2)
+            data['select'] = np.abs(d1.V[:,0]) < np.abs(d2.V[:,0])
+        return _stack(_take(_cross(z1,z2),data['comps']),
+                      _select(data['select'],d1,d2))
+
+class _PointOnCircle(_Constraint):
+    _args = ('pt', 'circle')
+    _opts = ()
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'pt'),
+                ctx.pointRows(items,'circle.center'),
+                ctx.normalRows(items,'circle.normal'),
+                ctx.radiusRows(items,'circle'))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        # to be compatible with slvs, this actually constrains the point to
+        # the cylinder
+        pt,c,n,r = data
+        v = _sub(ctx.point(pt),ctx.point(c))
+        n = ctx.axis(n,2)
+        v = _sub(v,_mul(n,_dot(v,n)))
+        return _sub(_norm(v),ctx.radius(r))
+
+class _EqualRadius(_Constraint):
+    _args = ('c1', 'c2')
+    _opts = ()
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.radiusRows(items,'c1'),ctx.radiusRows(items,'c2'))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        return _sub(ctx.radius(data[0]),ctx.radius(data[1]))
+
+class _Diameter(_Constraint):
+    _args = ('d', 'c')
+    _opts = ()
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.radiusRows(items,'c'),
+                np.array([float(o.d) for o in items]))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        r,d = data
+        return _offset(_scale(ctx.radius(r),2.0),-d[:,None])
+
+class _EqualLength(_Constraint):
+    _args = ('l1', 'l2')
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.dirRows(items,'l1'),ctx.dirRows(items,'l2'),
+                ctx.planeRows(items,'wrkpln'),
+                np.array([float(cls.getValue(o)) for o in items]))
+
+    @classmethod
+    def getValue(cls,_o):
+        return 0.0
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        l1,l2,w,v = data
+        d1 = _norm(ctx.project(ctx.direction(l1),w))
+        d2 = _norm(ctx.project(ctx.direction(l2),w))
+        return _offset(_sub(d1,d2),-v[:,None])
+
+class _LengthDifference(_EqualLength):
+    _args = ('diff', 'l1', 'l2')
+
+    @classmethod
+    def getValue(cls,o):
+        return o.diff
+
+class _LengthRatio(_EqualLength):
+    _args = ('ratio', 'l1', 'l2')
+
+    @classmethod
+    def getValue(cls,o):
+        return o.ratio
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        l1,l2,w,v = data
+        d1 = _norm(ctx.project(ctx.direction(l1),w))
+        d2 = _norm(ctx.project(ctx.direction(l2),w))
+        return _offset(_div(d1,d2),-v[:,None])
+
+class _PointsHorizontal(_Constraint):
+    _args = ('p1', 'p2')
+    _axis = 0
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'p1'),ctx.pointRows(items,'p2'),
+                ctx.planeRows(items,'wrkpln'))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        p1,p2,w = data
+        v = _sub(ctx.point(p1),ctx.point(p2))
+        if w:
+            return _dot(v,ctx.axis(w[1],cls._axis))
+        return _take(v,_Cols[[cls._axis]*len(v.V)])
+
+class _PointsVertical(_PointsHorizontal):
+    _axis = 1
+
+class _LineHorizontal(_PointsHorizontal):
+    _args = ('line',)
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'line.p1'),
+                ctx.pointRows(items,'line.p2'),
+                ctx.planeRows(items,'wrkpln'))
+
+class _LineVertical(_LineHorizontal):
+    _axis = 1
+
+class _Symmetric(_Constraint):
+    _args = ('p1', 'p2', 'pln')
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'p1'),ctx.pointRows(items,'p2'),
+                ctx.planeRows(items,'pln'))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        p1,p2,(o,n) = data
+        a,b = ctx.point(p1),ctx.point(p2)
+        # the projection of both points to the plane coincide, and the middle
+        # point lies in the plane
+        m = _sub(_scale(_add(a,b),0.5),ctx.point(o))
+        return _stack(ctx.project(_sub(a,b),(o,n)),_dot(m,ctx.axis(n,2)))
+
+class _MidPoint(_Constraint):
+    _args = ('pt', 'line')
+
+    @classmethod
+    def prepare(cls,ctx,items):
+        return (ctx.pointRows(items,'pt'),ctx.pointRows(items,'line.p1'),
+                ctx.pointRows(items,'line.p2'),ctx.planeRows(items,'wrkpln'))
+
+    @classmethod
+    def evaluate(cls,ctx,data):
+        pt,p1,p2,w = data
+        m = _scale(_add(ctx.point(p1),ctx.point(p2)),0.5)
+        return ctx.project(_sub(ctx.point(pt),m),w)
+
+
+class _SystemNumPy(SystemExtension):
+    def __init__(self,parent,tolerance=0,maxIterations=0):
+        super(_SystemNumPy,self).__init__()
+        self.GroupHandle = 1
+        self.NameTag = '?'
+        self.Dof = -1
+        self.Failed = []
+        self.Iterations = 0
+        self.Params = []
+        self.Entities = []
+        self.Constraints = []
+        # entities and constraints with equations
+        self.Equations = []
+        self.Literals = []
+        self._literals = {}
+        self.Identity = tuple(self.ref(v) for v in (1.0,0.0,0.0,0.0))
+        self.Zero = (self.ref(0.0),)*3
+        self.tolerance = tolerance if tolerance else 1e-9
+        self.maxIterations = maxIterations if maxIterations else 100
+        self.log = parent.log
+        self.verbose = parent.verbose
+
+    def getName(self):
+        return SystemNumPy.getName()
+
+    def ref(self,v):
+        'Return a reference of a parameter or a constant literal'
+        if isinstance(v,_Param):
+            return v._index
+        v = float(v)
+        ret = self._literals.get(v,None)
+        if ret is None:
+            self.Literals.append(v)
+            ret = -len(self.Literals)
+            self._literals[v] = ret
+        return ret
+
+    def getStatistics(self):
+        return (len(self.Params),len(self.Entities),len(self.Equations))
+
+    def solve(self, group=0, reportFailed=False):
+        if not group:
+            group = self.GroupHandle
+        self.Failed = []
+
+        ctx = _Context(self,group)
+        if not ctx.nvar:
+            self.log('no parameter')
+            return
+        if not ctx.batches:
+            logger.error('no constraint')
+            return
+        self.log('solving {} equations, {} parameters',
+                ctx.countEquations(),ctx.nvar)
+
+        tol = self.tolerance
+        maxIter = self.maxIterations
+        dragging = self.dragging
+        if dragging:
+            if dragging.Params:
+                ctx.setDragging(set(dragging.Params),dragging.Weight)
+            if dragging.MaxIterations:
+                maxIter = dragging.MaxIterations
+            if dragging.Tolerance:
+                tol = dragging.Tolerance
+
+        x0 = ctx.x0
+        nit = 0
+        if ctx.dragged:
+            # First find the closest configuration to the dragging position,
+            # and then refine it without the dragging residuals.
+            ret = _levenbergMarquardt(ctx.evaluate,x0,tol,maxIter,True)
+            ctx.dragged = None
+            x0 = ret.x
+            nit = ret.nit
+        ret = _levenbergMarquardt(ctx.evaluate,x0,tol,max(1,maxIter-nit))
+
+        self.Iterations = nit + ret.nit
+        if not ret.success and dragging and dragging.MaxIterations \
+                and np.all(np.isfinite(ret.x)):
+            # accept the partial result for interactive dragging, which will
+            # be refined by the next solve
+            self.log('solver partial result: {}',ret.message)
+        elif ret.success:
+            self.log('solver success: {}, {} iterations',ret.message,ret.nit)
+        else:
+            if reportFailed:
+                self.Failed = [o for o in ctx.getFailed(ret.x,tol)
+                                if isinstance(o,_Constraint)]
+            raise RuntimeError(ret.message)
+
+        for p,v in zip(ctx.Params,ret.x):
+            p.val = float(v)
+
+    def getParamValues(self,handles):
+        return np.array([ h.val for h in handles ],dtype=float)
+
+    def getJacobian(self,group):
+        ctx = _Context(self,group)
+        _,J = ctx.evaluate(ctx.x0)
+        return J,ctx.Params,ctx.getOwners()
+
+    def getParam(self, h):
+        if not isinstance(h,_Param) or h._index<0 or \
+                h._index>=len(self.Params) or self.Params[h._index] is not h:
+            raise KeyError('parameter not found')
+        return h
+
+    def addParam(self, v, overwrite=False):
+        _ = overwrite
+        v._index = len(self.Params)
+        self.Params.append(v)
+        return v
+
+    def addParamV(self, val, group=0):
+        if not group:
+            group = self.GroupHandle
+        return self.addParam(_Param(self.Tag,val,group))
+
+    def removeParam(self, _h):
+        pass
+
+    def getConstraint(self, h):
+        if not isinstance(h,_Constraint):
+            raise KeyError('constraint not found')
+        return h
+
+    def addConstraint(self, v, overwrite=False):
+        _ = overwrite
+        self.Constraints.append(v)
+        self.Equations.append(v)
+        return v
+
+    def removeConstraint(self, _h):
+        pass
+
+    def patchConstraint(self,h,values,newValues):
+        if not isinstance(h,_Constraint):
+            return False
+        names = h.__class__._args[:len(values)]
+        if len(names)!=len(values) or len(values)!=len(newValues):
+            return False
+        for k,v in zip(names,values):
+            if getattr(h,k) != v:
+                return False
+        for k,v in zip(names,newValues):
+            setattr(h,k,v)
+        return True
+
+    def getEntity(self, h):
+        if not isinstance(h,_Entity):
+            raise KeyError('entity not found')
+        return h
+
+    def addEntity(self, v, overwrite=False):
+        _ = overwrite
+        self.Entities.append(v)
+        if v.evaluate:
+            self.Equations.append(v)
+        return v
+
+    def removeEntity(self, _h):
+        pass
+
+    @property
+    def Tag(self):
+        return self.NameTag
+
+def _makeAdder(cls):
+    if issubclass(cls,_Constraint):
+        def add(self,*args,**kargs):
+            return self.addConstraint(cls(self,args,kargs))
+    else:
+        def add(self,*args,**kargs):
+            return self.addEntity(cls(self,args,kargs))
+    return add
+
+for _cls in _MetaType._types:
+    setattr(_SystemNumPy,'add'+_cls.__name__[1:],_makeAdder(_cls))
@@ -1,4 +1,5 @@
-from collections import namedtuple
+from collections import namedtuple, OrderedDict, deque
+import math, threading
 import pprint
 try:
     from six import with_metaclass
@@ -10,6 +11,7 @@ from .utils import syslogger as logger, objName
 import sympy as sp
 import sympy.vector as spv
 import scipy.optimize as sopt
+import scipy.sparse as ssparse
 import numpy as np
 
 class _AlgoType(ProxyType):
@@ -23,7 +25,7 @@ class _AlgoType(ProxyType):
     @classmethod
     def setDefaultTypeID(mcs,obj,name=None):
         if not name:
-            name = _AlgoPowell.getName()
+            name = _AlgoLeastSquares.getName()
         super(_AlgoType,mcs).setDefaultTypeID(obj,name)
 
 def _makeProp(name,doc='',tp='App::PropertyFloat',group=None):
@@ -34,6 +36,10 @@ def _makeProp(name,doc='',tp='App::PropertyFloat',group=None):
 
 _makeProp('Tolerance','','App::PropertyPrecision','Solver')
 
+# Plain copy of the settings of an algorithm, see _AlgoBase.getSettings()
+_AlgoSettings = namedtuple('SymPyAlgoSettings',('Name','Options','Tolerance',
+    'NeedHessian','NeedJacobian','LeastSquares','Sparse'))
+
 class _AlgoBase(with_metaclass(_AlgoType, object)):
     _id = -2
     _common_options = [_makeProp('maxiter',
@@ -41,6 +47,8 @@ class _AlgoBase(with_metaclass(_AlgoType, object)):
     _options = []
     NeedHessian = False
     NeedJacobian = True
+    LeastSquares = False
+    Sparse = False
 
     def __init__(self,obj):
         self.Object = obj
@@ -68,6 +76,17 @@ class _AlgoBase(with_metaclass(_AlgoType, object)):
     def getPropertyInfoList(cls):
         return ['Tolerance'] + cls._common_options + cls._options
 
+    def getSettings(self):
+        '''Return a copy of the algorithm settings, which can be used without
+        reading the document object, e.g. in a solver worker thread'''
+        return _AlgoSettings(Name=self.getName(),
+                Options=self.Options,
+                Tolerance=self.Tolerance,
+                NeedHessian=self.NeedHessian,
+                NeedJacobian=self.NeedJacobian,
+                LeastSquares=self.LeastSquares,
+                Sparse=self.Sparse)
+
 class _AlgoNoJacobian(_AlgoBase):
     NeedJacobian = False
 
@@ -210,8 +229,46 @@ class _Algodogleg(_AlgoNeedHessian):
 class _Algotrust_ncg(_Algodogleg):
     _id = 10
 
+class _AlgoLeastSquares(_AlgoBase):
+    '''
+    Solve the residual vector of all equations as a non-linear least square
+    problem using scipy.optimize.least_squares, instead of minimizing the
+    scalar sum of squares
+    '''
+    _id = 11
+    _common_options = [_makeProp('max_nfev',
+        'Maximum number of function evaluations','App::PropertyInteger')]
+    _options = [
+        _makeProp('ftol','Tolerance for termination by the change of the cost\n'
+            'function.'),
+        _makeProp('xtol','Tolerance for termination by the change of the\n'
+            'independent variables.'),
+        _makeProp('gtol','Tolerance for termination by the norm of the '
+            'gradient.'),
+    ]
+    LeastSquares = True
+
+    @property
+    def Options(self):
+        ret = super(_AlgoLeastSquares,self).Options
+        tol = self.Tolerance
+        if tol:
+            for name in ('ftol','xtol','gtol'):
+                ret.setdefault(name,tol)
+        return ret
+
+class _AlgoLeastSquaresSparse(_AlgoLeastSquares):
+    '''
+    Same as LeastSquares, but with a sparse Jacobian matrix that only contains
+    the derivatives of each equation against its own free symbols, which
+    scales much better for large assemblies
+    '''
+    _id = 12
+    Sparse = True
+
 class SystemSymPy(with_metaclass(System, SystemBase)):
     _id = 2
+    ParallelSolve = True
 
     def __init__(self,obj):
         super(SystemSymPy,self).__init__(obj)
@@ -229,7 +286,7 @@ class SystemSymPy(with_metaclass(System, SystemBase)):
                 getattr(_SystemSymPy,'add'+cstrName)
 
     def getSystem(self,obj):
-        return _SystemSymPy(self,_AlgoType.getProxy(obj))
+        return _SystemSymPy(self,_AlgoType.getProxy(obj).getSettings())
 
     def isDisabled(self,_obj):
         return False
@@ -1056,6 +1113,88 @@ class _EqualRadius(_Constraint):
 #  class _WhereDragged(_ProjectingConstraint):
 #      _args = ('pt',)
 
+def _lambdify(params,expr):
+    '''Lambdify an expression (or matrix) taking a single array of params'''
+    try:
+        # eliminate common sub-expressions shared by the matrix elements
+        return sp.lambdify([params],expr,modules='numpy',cse=True)
+    except TypeError:
+        # 'cse' is only supported since SymPy 1.9
+        return sp.lambdify([params],expr,modules='numpy')
+
+# Compiled equations of a system
+#
+# Params: index of the parameters to be solved
+# Solved: list of (index, value) of the parameters solved before compilation
+# Subs: list of (index, index, func) of the parameters represented by another
+#       parameter
+# Funcs: compiled functions passed to the solver
+_CompiledInfo = namedtuple('SymPyCompiledInfo',
+        ('Params','Solved','Subs','Funcs'))
+
+# LRU cache of the compiled equations keyed by system fingerprint
+_CompiledCache = OrderedDict()
+_CompiledCacheSize = 16
+_CompiledCacheLock = threading.Lock()
+
+def _getCompiled(key):
+    with _CompiledCacheLock:
+        info = _CompiledCache.pop(key,None)
+        if info:
+            _CompiledCache[key] = info
+        return info
+
+def _addCompiled(key,info):
+    with _CompiledCacheLock:
+        _CompiledCache[key] = info
+        while len(_CompiledCache) > _CompiledCacheSize:
+            _CompiledCache.popitem(False)
+
+def _dragResidual(fun,jac,x0,dragged,weight):
+    '''Append weighted residuals of the dragged parameters to keep them close
+    to their current values'''
+    if not dragged or not weight:
+        return fun,jac
+    idx = np.array(dragged,dtype=int)
+    target = x0[idx].copy()
+    jw = np.zeros((len(idx),len(x0)))
+    jw[np.arange(len(idx)),idx] = weight
+    jws = ssparse.csr_matrix(jw)
+
+    def _jac(x):
+        j = jac(x)
+        if ssparse.issparse(j):
+            return ssparse.vstack((j,jws),format='csr')
+        return np.vstack((j,jw))
+
+    return (lambda x: np.concatenate((fun(x),weight*(x[idx]-target))),_jac)
+
+def _dragObjective(funcs,x0,dragged,weight):
+    '''Add the weighted squared distance of the dragged parameters to the
+    objective function, and its gradient and Hessian'''
+    eq,jeq,heq = funcs
+    if not dragged or not weight:
+        return funcs
+    idx = np.array(dragged,dtype=int)
+    target = x0[idx].copy()
+    w2 = weight*weight
+
+    def _eq(x):
+        d = x[idx]-target
+        return eq(x) + w2*np.dot(d,d)
+
+    def _jeq(x):
+        g = np.asarray(jeq(x),dtype=float).ravel().copy()
+        g[idx] += 2.0*w2*(x[idx]-target)
+        return g
+
+    def _heq(x):
+        h = np.asarray(heq(x),dtype=float).copy()
+        h[idx,idx] += 2.0*w2
+        return h
+
+    return (_eq,_jeq if jeq else None,_heq if heq else None)
+
 class _SystemSymPy(SystemExtension):
     def __init__(self,parent,algo):
         super(_SystemSymPy,self).__init__()
@@ -1063,9 +1202,13 @@ class _SystemSymPy(SystemExtension):
         self.NameTag = '?'
         self.Dof = -1
         self.Failed = []
+        # number of iterations of the last solve
+        self.Iterations = 0
         self.Params = set()
         self.Constraints = set()
         self.Entities = set()
+        # all params, entities and constraints in the order of creation
+        self.Objects = []
         self.eqs = []
         self.algo = algo
         self.log = parent.log
@@ -1081,18 +1224,93 @@ class _SystemSymPy(SystemExtension):
     def reset(self):
         self.__init__()
 
-    def F(self,params,eq,jeqs,_heqs):
-        params = tuple(params)
-        res = eq(*params)
-        if not jeqs:
+    def F(self,params,eq,jeq,_heq):
+        res = eq(params)
+        if not jeq:
             return res
-        return (res,np.array([jeq(*params) for jeq in jeqs]))
-
-    def hessF(self,params,_eqs,_jeqs,heqs):
-        params = tuple(params)
-        return np.array([[eq(*params) for eq in eqs] for eqs in heqs])
-
-    EquationInfo = namedtuple('EquationInfo',('Name','Expr'))
+        return (res,np.asarray(jeq(params),dtype=float).ravel())
+
+    def hessF(self,params,_eq,_jeq,heq):
+        return np.asarray(heq(params),dtype=float)
+
+    def compileResidual(self,params,eqs,sparse=False):
+        '''Compile the equations into vectorized functions
+
+        Return a tuple of two functions, taking an array of parameter values,
+        and return the residual vector and the Jacobian matrix, which is a
+        scipy sparse matrix if 'sparse' is True, or else a dense array.
+        '''
+        exprs = sp.Matrix([eq.Expr for eq in eqs])
+        feq = _lambdify(params,exprs)
+        fun = lambda x: np.asarray(feq(x),dtype=float).ravel()
+        if not sparse:
+            jeq = _lambdify(params,exprs.jacobian(params))
+            self.log('compiled {} residuals, {} parameters'.format(
+                len(eqs),len(params)))
+            return (fun, lambda x: np.asarray(jeq(x),dtype=float))
+
+        # The sparsity pattern comes from the free symbols of each equation,
+        # so only the non-zero derivatives are generated and evaluated
+        index = dict((x,i) for i,x in enumerate(params))
+        rows = []
+        cols = []
+        derivs = []
+        for i,eq in enumerate(eqs):
+            for x in eq.Expr.free_symbols:
+                j = index.get(x,None)
+                if j is not None:
+                    rows.append(i)
+                    cols.append(j)
+                    derivs.append(sp.diff(eq.Expr,x))
+        shape = (len(eqs),len(params))
+        rows = np.array(rows,dtype=int)
+        cols = np.array(cols,dtype=int)
+        jeq = _lambdify(params,derivs)
+        self.log('compiled {} residuals, {} parameters, {} non-zeros'.format(
+            len(eqs),len(params),len(derivs)))
+        return (fun, lambda x: ssparse.csr_matrix(
+            (np.asarray(jeq(x),dtype=float).ravel(),(rows,cols)),shape=shape))
+
+    def getFingerprint(self,group):
+        '''Return a structural fingerprint of the system for solving a group
+
+        It includes the type and argument wiring of all entities and
+        constraints, their group membership, and the value of the parameters
+        that are not solved but referenced by the equations of the group,
+        i.e. everything that affects the generated equations, except the
+        initial values of the solving parameters. The values of the other
+        parameters, e.g. those of the other clusters moved while dragging,
+        are left out so that they do not change the fingerprint.
+        '''
+        ret = []
+        used = set()
+        # walk backwards, as an object is always created after its arguments
+        for o in reversed(self.Objects):
+            if isinstance(o,_Param):
+                if o.group == group:
+                    ret.append(True)
+                else:
+                    ret.append(o._val if o._index in used else None)
+                continue
+            cls = o.__class__
+            active = o.group==group or o._index in used
+            key = [cls.__name__, o.group==group]
+            for k in cls._args + cls._opts:
+                v = getattr(o,k[0] if isinstance(k,tuple) else k)
+                if isinstance(v,_Base):
+                    if active:
+                        used.add(v._index)
+                    v = v._index
+                key.append(v)
+            ret.append(tuple(key))
+        ret.append(self.algo.Name)
+        return tuple(ret)
+
+    def _addObject(self,v):
+        v._index = len(self.Objects)
+        self.Objects.append(v)
+
+    EquationInfo = namedtuple('EquationInfo',('Name','Expr','Owner'))
 
     def solve(self, group=0, reportFailed=False):
         _ = reportFailed
@@ -1139,113 +1357,312 @@ class _SystemSymPy(SystemExtension):
 
         algo = self.algo
 
-        # for params that can be represent by another single param
-        param_subs = {}
-
-        # restart equation generation if any equation can be solved earlier
-        restart = False
-        while True:
-            params = {} # symbol -> value
-            param_table = {} # symbol -> _Param object
-            for e in self.Params:
-                e.reset(group)
-                if e.group == group:
-                    params[e._sym] = e.val
-                    param_table[e._sym] = e
-            if not params:
-                self.log('no parameter')
+        key = self.getFingerprint(group)
+        compiled = _getCompiled(key)
+        if compiled:
+            self.log('reuse compiled equations')
+            for i,v in compiled.Solved:
+                self.setParamValue(self.Objects[i],v)
+            params = [self.Objects[i] for i in compiled.Params]
+            subs = [(self.Objects[i],self.Objects[j],f)
+                        for i,j,f in compiled.Subs]
+        else:
+            compiled = self._compile(group)
+            if not compiled:
                 return
-            for e in self.Constraints:
-                e.reset(group)
-            for e in self.Entities:
-                e.reset(group)
+            params = [self.Objects[i] for i in compiled.Params]
+            subs = [(self.Objects[i],self.Objects[j],f)
+                        for i,j,f in compiled.Subs]
+            _addCompiled(key,compiled)
+
+        if not params:
+            self.Iterations = 0
+            for y,x,f in subs:
+                self.setParamValue(y,float(f(x.val)))
+            return
 
-            self.log('generating equations...')
+        # initial values
+        x0 = np.array([p.val for p in params],dtype=float)
+
+        dragging = self.dragging
+        if dragging:
+            dragged = set(dragging.Params or ())
+            dragged = [i for i,p in enumerate(params) if p in dragged]
+        if algo.LeastSquares:
+            fun,jac = compiled.Funcs
+            options = dict(algo.Options)
+            if dragging:
+                fun,jac = _dragResidual(fun,jac,x0,dragged,dragging.Weight)
+                if dragging.MaxIterations:
+                    options['max_nfev'] = dragging.MaxIterations
+                if dragging.Tolerance:
+                    for key in ('ftol','xtol','gtol'):
+                        options[key] = dragging.Tolerance
+            ret = sopt.least_squares(fun,x0,jac=jac,**options)
+        else:
+            funcs = compiled.Funcs
+            if dragging:
+                funcs = _dragObjective(funcs,x0,dragged,dragging.Weight)
+            ret = self._minimize(algo,x0,funcs,dragging)
+
+        self.Iterations = getattr(ret,'nit',None) or getattr(ret,'nfev',0)
+        if not ret.success and dragging and dragging.MaxIterations \
+                and np.all(np.isfinite(ret.x)):
+            # accept the partial result for interactive dragging, which will
+            # be refined by the next solve
+            self.log('solver partial result: {}'.format(ret.message))
+        elif ret.success:
+            self.log('solver success: {}'.format(ret.message))
+        else:
+            raise RuntimeError('failed to solve: {}'.format(ret.message))
 
-            eqs = []
-            active_params = {}
-            for objs in (self.Entities,self.Constraints):
-                for o in objs:
-                    if o.group != group:
-                        continue
-                    eq = o.getEqWithParams(params)
-                    if not eq:
+        for p,v in zip(params,ret.x):
+            self.setParamValue(p,v)
+        for y,x,f in subs:
+            self.setParamValue(y,float(f(x.val)))
+
+    def _generate(self,group):
+        '''Generate the equations of a solving group
+
+        Return a tuple of the parameter value table (symbol -> value), the
+        parameter table (symbol -> _Param) and the list of EquationInfo, or
+        None if there is no parameter to solve.
+        '''
+        params = {} # symbol -> value
+        param_table = {} # symbol -> _Param object
+        for e in self.Params:
+            e.reset(group)
+            if e.group == group:
+                params[e._sym] = e.val
+                param_table[e._sym] = e
+        if not params:
+            self.log('no parameter')
+            return
+        for e in self.Constraints:
+            e.reset(group)
+        for e in self.Entities:
+            e.reset(group)
+
+        self.log('generating equations...')
+
+        eqs = []
+        for objs in (self.Entities,self.Constraints):
+            for o in objs:
+                if o.group != group:
+                    continue
+                eq = o.getEqWithParams(params)
+                if not eq:
+                    continue
+                for e in eq if isinstance(eq,(list,tuple)) else [eq]:
+                    if self.verbose:
+                        self.log('\n\nequation {}: {}\n\n'.format(o.Name,e))
+                    if not e.free_symbols:
+                        self.log('skip equation without free symbol')
                         continue
-                    for e in eq if isinstance(eq,(list,tuple)) else [eq]:
-                        symbols = e.free_symbols
-                        if self.verbose:
-                            self.log('\n\nequation {}: {}\n\n'.format(o.Name,e))
-                        if not symbols:
-                            self.log('skip equation without free symbol')
-                            continue
-                        if len(symbols)==1:
-                            self.log('single solve')
-                            x = symbols.pop()
-                            if x not in param_table:
-                                logger.warn('skip equation with unknown symbol')
-                                continue
-                            f = sp.lambdify(x,e,modules='numpy')
-                            ret = sopt.minimize_scalar(f,tol=algo.Tolerance)
-                            if not ret.success:
-                                msg = getattr(ret,'message',None)
-                                logger.warn('failed to solve {}: '
-                                    '{}',o.Name,msg if msg else ret)
-                            else:
-                                self.log('single solve done: '
-                                            '{}'.format(ret.x[0]))
-                                restart = True
-                                param = param_table[x]
-                                param.group = -1
-                                param.val = ret.x[0]
-                                param._val = sp.Float(ret.x[0])
-                                param_table.pop(x)
-                                continue
-                        if len(symbols)==2:
-                            x = symbols.pop()
-                            y = symbols.pop()
-                            self.log('simple solve2')
-                            try:
-                                ret = sp.solve(eq,y)
-                                if not ret:
-                                    logger.warn('simple solve failed')
-                                elif len(ret)!=1:
-                                    self.log('simple solve returns {} '
-                                        'solutions'.format(len(ret)))
-                                else:
-                                    param_subs[y] = param_table[x]
-                                    param = param_table[y]
-                                    param.group = -2
-                                    param._val = ret[0]
-                                    param_table.pop(y)
-                                    self.log('simple solve done: {}'.format(
-                                        param))
-                                    continue
-                            except Exception as excp:
-                                logger.warn('simple solve exception: '
-                                        '{}',excp.message)
-
-                        if not restart:
-                            if len(active_params)!=len(params):
-                                for x in symbols:
-                                    if x not in active_params:
-                                        active_params[x] = params[x]
-                            self.log('add equation')
-                            eqs.append(self.EquationInfo(Name=o.Name, Expr=e))
-            if not restart:
-                break
-
+                    eqs.append(self.EquationInfo(
+                        Name=o.Name, Expr=e, Owner=o))
+        return params,param_table,eqs
+
+    def getParamValues(self,handles):
+        return np.array([ h.val for h in handles ],dtype=float)
+
+    def getJacobian(self,group):
+        ret = self._generate(group)
+        if not ret:
+            return np.zeros((0,0)),[],[]
+        _,param_table,eqs = ret
+        syms = list(param_table.keys())
+        params = [param_table[x] for x in syms]
         if not eqs:
-            logger.error('no constraint')
+            return np.zeros((0,len(params))),params,[]
+        exprs = sp.Matrix([eq.Expr for eq in eqs])
+        jeq = _lambdify(syms,exprs.jacobian(syms))
+        J = np.asarray(jeq(np.array([p.val for p in params],dtype=float)),
+                dtype=float).reshape(len(eqs),len(params))
+        return J,params,[eq.Owner for eq in eqs]
+
+    def _compile(self,group):
+        '''Generate and compile the equations of a solving group'''
+
+        algo = self.algo
+
+        ret = self._generate(group)
+        if not ret:
             return
+        params,param_table,eqs = ret
 
-        self.log('parameters {}, {}, {}'.format(len(self.Params),
-            len(params),len(active_params)))
+        eqs,solved,subs = self._presolve(eqs,param_table)
 
-        # all parameters to be solved
-        params = active_params.keys()
-        # initial values
-        x0 = active_params.values()
+        if not eqs:
+            if not solved and not subs:
+                logger.error('no constraint')
+                return
+            # everything is presolved, nothing left for the solver
+            self.log('all parameters presolved')
+            params = []
+            funcs = None
+        else:
+            # all parameters to be solved, in the order of appearance
+            active_params = OrderedDict()
+            for eq in eqs:
+                for x in eq.Expr.free_symbols:
+                    if x in param_table:
+                        active_params[x] = None
+
+            self.log('parameters {}, {}, {}'.format(len(self.Params),
+                len(params),len(active_params)))
 
+            params = list(active_params.keys())
+
+            if algo.LeastSquares:
+                funcs = self.compileResidual(params,eqs,algo.Sparse)
+            else:
+                funcs = self.compileMinimize(params,eqs)
+
+        return _CompiledInfo(
+                Params = [param_table[x]._index for x in params],
+                Solved = [(p._index,p.val) for p in solved],
+                Subs = [(y._index,x._index,sp.lambdify(x._sym,expr))
+                            for y,x,expr in subs],
+                Funcs = funcs)
+
+    def _presolve(self,eqs,param_table):
+        '''Solve the trivial equations in one pass before compilation
+
+        Equations with a single free symbol are solved numerically, and those
+        with two free symbols are solved symbolically if one symbol can be
+        uniquely represented by the other. The result is substituted into the
+        other equations using the symbol, which may in turn become trivial.
+        The solved symbols are removed from param_table. The parameters keep
+        their group, so that the system can be solved again with new values.
+
+        Return a tuple of the remaining equations, the list of solved _Param,
+        and the list of (y,x,expr) with parameter y represented by expression
+        of parameter x, ordered for evaluation.
+        '''
+        exprs = [eq.Expr for eq in eqs]
+        users = {} # symbol -> indices of equations using it
+        for i,e in enumerate(exprs):
+            for x in e.free_symbols:
+                users.setdefault(x,set()).add(i)
+        pending = deque(i for i,e in enumerate(exprs)
+                if len(e.free_symbols)<=2)
+        removed = set()
+        solved = []
+        subs = []
+        while pending:
+            i = pending.popleft()
+            if i in removed:
+                continue
+            e = exprs[i]
+            symbols = e.free_symbols
+            if not all(x in param_table for x in symbols):
+                continue
+            if len(symbols)==1:
+                x = next(iter(symbols))
+                v = self._solveScalar(eqs[i].Name,e,param_table[x])
+                if v is None:
+                    continue
+                param = param_table.pop(x)
+                self.setParamValue(param,v)
+                solved.append(param)
+                value = param._val
+            elif len(symbols)==2:
+                ret = self._solveSymbol(eqs[i].Name,e,*symbols)
+                if not ret:
+                    continue
+                x,value = ret
+                param = param_table.pop(x)
+                subs.append((param,param_table[
+                    next(iter(value.free_symbols))],value))
+            else:
+                continue
+
+            removed.add(i)
+            for j in users.pop(x,()):
+                if j in removed:
+                    continue
+                e = exprs[j].subs(x,value)
+                exprs[j] = e
+                symbols = e.free_symbols
+                for y in symbols:
+                    users.setdefault(y,set()).add(j)
+                if symbols:
+                    if len(symbols)<=2:
+                        pending.append(j)
+                    continue
+                removed.add(j)
+                try:
+                    if abs(float(e)) > (self.algo.Tolerance or 1e-8):
+                        logger.warn('inconsistent equation {}',eqs[j].Name)
+                except TypeError:
+                    pass
+
+        if solved or subs:
+            self.log('presolved {} parameters, substituted {}'.format(
+                len(solved),len(subs)))
+
+        # parameters represented by a later substituted parameter must be
+        # evaluated after that one
+        subs.reverse()
+        return ([eqs[i]._replace(Expr=e)
+                    for i,e in enumerate(exprs) if i not in removed],
+                solved, subs)
+
+    def _solveScalar(self,name,e,param):
+        '''Numerically solve an equation of a single parameter'''
+        self.log('single solve')
+        f = sp.lambdify(param._sym,e**2,modules='numpy')
+        v = param.val
+        tol = self.algo.Tolerance
+        try:
+            ret = sopt.minimize_scalar(f,bracket=(v,v+1.0),tol=tol)
+        except Exception as excp:
+            logger.warn('failed to solve {}: {}',name,excp)
+            return
+        if not ret.success or \
+                math.sqrt(abs(float(ret.fun))) > (tol or 1e-8):
+            msg = getattr(ret,'message',None)
+            logger.warn('failed to solve {}: {}',name,msg if msg else ret)
+            return
+        self.log('single solve done: {}'.format(ret.x))
+        return float(ret.x)
+
+    def _solveSymbol(self,name,e,x,y):
+        '''Try to represent one symbol of the equation by the other one
+
+        Return a tuple (symbol, expression), or None if there is no unique
+        solution.
+        '''
+        self.log('simple solve2')
+        for x,y in ((x,y),(y,x)):
+            try:
+                ret = sp.solve(e,y)
+            except Exception as excp:
+                logger.warn('simple solve exception {}: {}',name,excp)
+                continue
+            if len(ret)==1 and ret[0].free_symbols=={x}:
+                self.log('simple solve done: {} = {}'.format(y,ret[0]))
+                return y,ret[0]
+            self.log('simple solve returns {} solutions'.format(len(ret)))
+
+    def _minimize(self,algo,x0,funcs,dragging=None):
+        eq,jeq,heq = funcs
+        tol = algo.Tolerance
+        options = dict(algo.Options)
+        if dragging:
+            if dragging.Tolerance:
+                tol = dragging.Tolerance
+            if dragging.MaxIterations:
+                options['maxiter'] = dragging.MaxIterations
+        return sopt.minimize(self.F,x0,(eq,jeq,heq),
+            jac=True if jeq else None, hess=self.hessF if heq else None,
+            tol=tol,method=algo.Name,options=options)
+
+    def compileMinimize(self,params,eqs):
+        '''Compile the sum of square of all equations, and optionally its
+        gradient and Hessian matrix if required by the algorithm'''
+        algo = self.algo
         # For holding the sum of square of all equations, which is the one we
         # are trying to minimize
         f = None
@@ -1254,56 +1671,42 @@ class _SystemSymPy(SystemExtension):
             e = eq.Expr**2
             f = e if f is None else f+e
 
-        eq = sp.lambdify(params,f,modules='numpy')
+        eq = _lambdify(params,f)
 
         self.log('generated {} equations, with {} parameters'.format(
             len(eqs),len(params)))
 
-        jac = None
-        jeqs = None
-        heqs = None
-        hessF = None
-        if self.algo.NeedJacobian or self.algo.NeedHessian:
-            # Jacobian matrix in sympy expressions
-            jexprs = [f.diff(x) for x in params]
-
-            if self.algo.NeedJacobian:
-                # Lambdified Jacobian matrix
-                jeqs = [sp.lambdify(params,je,modules='numpy') for je in jexprs]
-                self.log('generated jacobian matrix')
-                jac = True
-
-            if self.algo.NeedHessian:
-                # Lambdified Hessian matrix
-                heqs = [[sp.lambdify(params,je.diff(x),modules='numpy')
-                            for x in params] for je in jexprs ]
-                self.log('generated hessian matrix')
-                hessF = self.hessF
-
-        ret = sopt.minimize(self.F,x0,(eq,jeqs,heqs), jac=jac,hess=hessF,
-            tol=algo.Tolerance,method=algo.getName(),options=algo.Options)
-        #  ret = sopt.minimize(self.F,x0,(eq,None,None),method=algo.getName())
-        if ret.success:
-            for x,v in zip(params,ret.x):
-                param_table[x].val = v
-                y = param_subs.get(x,None)
-                if y:
-                    y.val = y._val.evalf(x,v)
-            self.log('solver success: {}'.format(ret.message))
-        else:
-            raise RuntimeError('failed to solve: {}'.format(ret.message))
+        jeq = None
+        heq = None
+        if algo.NeedJacobian:
+            # Lambdified gradient vector
+            jeq = _lambdify(params,sp.Matrix([f]).jacobian(params))
+            self.log('generated jacobian matrix')
+
+        if algo.NeedHessian:
+            # Lambdified Hessian matrix
+            heq = _lambdify(params,sp.hessian(f,params))
+            self.log('generated hessian matrix')
+
+        return (eq,jeq,heq)
 
     def getParam(self, h):
         if h not in self.Params:
             raise KeyError('parameter not found')
         return h
 
+    def setParamValue(self, h, v):
+        param = self.getParam(h)
+        param.val = v
+        param._val = sp.Float(v)
+
     def removeParam(self, h):
         self.Params.pop(h)
 
     def addParam(self, v, overwrite=False):
         _ = overwrite
         self.Params.add(v)
+        self._addObject(v)
         return v
 
     def getConstraint(self, h):
@@ -1317,6 +1720,7 @@ class _SystemSymPy(SystemExtension):
     def addConstraint(self, v, overwrite=False):
         _ = overwrite
         self.Constraints.add(v)
+        self._addObject(v)
         return v
 
     def getEntity(self, h):
@@ -1330,6 +1734,7 @@ class _SystemSymPy(SystemExtension):
     def addEntity(self, v, overwrite=False):
         _ = overwrite
         self.Entities.add(v)
+        self._addObject(v)
         return v
 
     def addParamV(self, val, group=0):
@@ -1,4 +1,5 @@
 import os, sys
+from collections import namedtuple, OrderedDict
 import FreeCAD
 try:
     from six import with_metaclass
@@ -85,6 +86,11 @@ class System(ProxyType):
                 system.relax = obj.AutoRelax
             return system
 
+    @classmethod
+    def isParallelSolve(mcs,obj):
+        proxy = mcs.getProxy(obj)
+        return proxy and proxy.ParallelSolve
+
     @classmethod
     def isConstraintSupported(mcs,obj,name):
         if name == 'Locked':
@@ -102,6 +108,9 @@ _makePropInfo('AutoRelax','App::PropertyBool',default=True)
 class SystemBase(with_metaclass(System, object)):
     _id = 0
     _props = ['Verbose','AutoRelax']
+    # Whether the backend releases the GIL for most of the solving, so that
+    # solving in a worker thread actually runs in parallel
+    ParallelSolve = False
 
     def __init__(self,obj):
         self._touched = True
@@ -143,9 +152,17 @@ def _cstrKey(cstrType, firstPart, secondPart):
 # For skipping invalid constraints
 _DummyCstrList = [None] * 6
 
+# Params: parameter handles of the dragged part
+# Weight: weight for keeping the dragged parameters at their current values
+# MaxIterations: maximum solver iterations, 0 for unlimited
+# Tolerance: solver tolerance, 0 for the default
+DragOptions = namedtuple('AsmDragOptions',
+        ('Params','Weight','MaxIterations','Tolerance'))
+
 class SystemExtension(object):
     def __init__(self):
         super(SystemExtension,self).__init__()
+        self.dragging = None
         self.NameTag = ''
         self.sketchPlane = None
         self.cstrObj = None
@@ -155,6 +172,7 @@ class SystemExtension(object):
         self.coincidences = {}
         self.cstrMap = {}
         self.elementCstrMap = {}
+        self.cstrComponents = {}
         self.elementMap = {}
         self.firstElement = None
         self.secondElement = None
@@ -164,6 +182,59 @@ class SystemExtension(object):
         self.firstElement = firstElement
         self.secondElement = secondElement
 
+    def getStatistics(self):
+        '''Return the number of parameters, entities and constraints in the
+        system, or None if not supported by the backend'''
+        try:
+            return (len(self.Params),len(self.Entities),len(self.Constraints))
+        except Exception:
+            return None
+
+    def setDragging(self,options=None):
+        '''Setup interactive solving for part dragging
+
+        options: a DragOptions, or None to restore full accuracy solving.
+                 Backends that do not support some of the options simply
+                 ignore them.
+        '''
+        self.dragging = options
+
+    def getParamValues(self,handles):
+        '''Return the values of a list of parameters'''
+        return [ self.getParam(h).val for h in handles ]
+
+    def getJacobian(self,group):
+        '''Evaluate the Jacobian matrix of the equations of a solving group
+
+        Return a tuple (J,params,handles), where J is an array of the
+        derivatives of each equation (row) against each parameter (column) at
+        the current parameter values, params is the list of parameter handles
+        of the columns, and handles is the list of the entity or constraint
+        handle owning the equation of each row.
+
+        Raise NotImplementedError if not supported by the backend.
+        '''
+        raise NotImplementedError('{} does not support Jacobian '
+                'evaluation'.format(self.getName()))
+
+    def patchConstraint(self,h,values,newValues):
+        '''Change the leading argument values of an existing constraint
+
+        Used for re-solving a built system after changing some constraint
+        property values. The arguments are only changed if they currently
+        start with 'values'.
+
+        Return True if patched, or False if not supported by the backend.
+        '''
+        return False
+
+    def setParamValue(self,h,v):
+        '''Change the value of an existing parameter
+
+        Used for patching a built system before re-solving it
+        '''
+        self.getParam(h).val = v
+
     def addSketchPlane(self,*args,**kargs):
         _ = kargs
         self.sketchPlane = args[0] if args else None
@@ -205,11 +276,9 @@ class SystemExtension(object):
                     count,
                     frame=1)
 
-    def _populateConstraintMap(
-            self,cstrType,firstElement,secondElement,increment,limit,item,implicit):
+    def _populateConstraintMap(self,cstrType,firstPart,secondPart,
+            increment,multiplier,limit,item,implicit):
 
-        firstPart = self.elementMap[firstElement]
-        secondPart = self.elementMap[secondElement]
         if firstPart == secondPart:
             return _DummyCstrList
 
@@ -229,6 +298,11 @@ class SystemExtension(object):
         # relaxing) , the length of this list is use as the constraint count to
         # be used later to decide how to auto relax the constraint.
         #
+        # 'multiplier' is the number of element pairs connected between the
+        # two parts by this constraint, which are counted in one go. The
+        # redundancy is still reported once for each of those pairs reaching
+        # the limit, as if they were counted one by one.
+        #
         # See the following link for difficulties on auto relaxing with implicit
         # constraints. Right now there is no search performed. So the auto relax
         # may fail. And the user is required to manually reorder constraints and
@@ -238,12 +312,28 @@ class SystemExtension(object):
 
         key = _cstrKey(cstrType,firstPart,secondPart)
         cstrs = self.cstrMap.setdefault(key, [])
-        cstrs += [item]*increment
-        count = len(cstrs)
-        if increment and count>=limit:
-            self.reportRedundancy(firstPart, secondPart, count, limit, implicit)
+        start = len(cstrs)
+        cstrs += [item]*(increment*multiplier)
+        if increment > 0:
+            # index of the first pair reaching the limit
+            i = max(1, (limit-start+increment-1)//increment)
+            for count in range(start+i*increment,len(cstrs)+1,increment):
+                self.reportRedundancy(
+                        firstPart, secondPart, count, limit, implicit)
         return cstrs
 
+    def _findElement(self,key):
+        # Union-find lookup with path halving. self.elementCstrMap maps
+        # tuple(cstrType, elementName) to its parent key, with the root
+        # mapping to itself.
+        parents = self.elementCstrMap
+        parent = parents.setdefault(key,key)
+        while parent != key:
+            grand = parents[parent]
+            parents[key] = grand
+            key,parent = grand,parents[grand]
+        return key
+
     def _countConstraints(self,increment,limit,cstrType,item=None):
         first, second = self.firstInfo, self.secondInfo
         if not first or not second:
@@ -264,44 +354,61 @@ class SystemExtension(object):
         # those constraints are expanded by us, but may not be so if the user
         # created them.
         #
-        # self.elementCstrMap is a map keyed using tuple(cstrType, elementName),
-        # with value of a set of all element names that is involved with the the
-        # same type of constraint. This set is shared by all element entries in
-        # the map.
-
-        firstSet = self.elementCstrMap.setdefault((cstrType, firstElement), set())
-        if not firstSet:
-            firstSet.add(firstElement)
-        secondSet = self.elementCstrMap.setdefault((cstrType, secondElement),firstSet)
-
+        # Elements involved with the same type of constraint are grouped using
+        # a union-find structure (see _findElement()). Each group keeps in
+        # self.cstrComponents a map of part name to the number of its elements
+        # in that group, so that merging two groups only needs to visit the
+        # pairs of parts instead of all pairs of elements.
+
+        firstKey = (cstrType, firstElement)
+        secondKey = (cstrType, secondElement)
+        newSecond = secondKey not in self.elementCstrMap
+        firstRoot = self._findElement(firstKey)
+        components = self.cstrComponents
+        firstParts = components.get(firstRoot)
+        if firstParts is None:
+            firstParts = OrderedDict(((first.PartName,1),))
+            components[firstRoot] = firstParts
+
+        if newSecond:
+            self.elementCstrMap[secondKey] = firstRoot
+            secondRoot = None
+            secondParts = {second.PartName:1}
+        else:
+            secondRoot = self._findElement(secondKey)
+            if secondRoot == firstRoot:
+                self.reportRedundancy(count=len(_DummyCstrList), limit=limit)
+                return _DummyCstrList
+            secondParts = components.pop(secondRoot)
+
+        # count the explicit and implicit constraints between the elements of
+        # the first and second group, and then merge the groups
         res = _DummyCstrList
-
-        if firstSet is not secondSet:
-            # If the secondSet is different, we shall merge them, and count the
-            # implicit constraints between the elements of first and second set.
-            for element in secondSet:
-                self.elementCstrMap[(cstrType, element)] = firstSet
-                is_second = element == secondElement
-                for e in firstSet:
-                    implicit = not is_second or e != firstElement
-                    cstrs = self._populateConstraintMap(
-                        cstrType,e,element,increment,limit,item,implicit)
-                    if not implicit:
-                        # save the result (i.e. the explicit constraint pair of
-                        # the give first and second element) for return
-                        res = cstrs
-            firstSet |= secondSet
-        elif secondElement not in firstSet:
-            # Here means the entry of the secondElement is newly created, count
-            # the implicit constraints between all elements in the set to the
-            # secondElement.
-            for e in firstSet:
-                implicit = e != firstElement
-                cstrs = self._populateConstraintMap(
-                    cstrType,e,secondElement,increment,limit,item,implicit)
-                if not implicit:
-                    res = cstrs
-            firstSet.add(secondElement)
+        for part,n in secondParts.items():
+            for e,m in firstParts.items():
+                if part != second.PartName or e != first.PartName:
+                    self._populateConstraintMap(cstrType,e,part,
+                            increment,n*m,limit,item,True)
+                    continue
+                # count the implicit constraints between the other elements of
+                # the two parts first, and then the explicit one
+                if n*m > 1:
+                    self._populateConstraintMap(cstrType,e,part,
+                            increment,n*m-1,limit,item,True)
+                # save the result (i.e. the explicit constraint pair of the
+                # give first and second element) for return
+                res = self._populateConstraintMap(cstrType,e,part,
+                        increment,1,limit,item,False)
+
+        if secondRoot is not None:
+            if len(secondParts) > len(firstParts):
+                firstRoot,secondRoot = secondRoot,firstRoot
+                firstParts,secondParts = secondParts,firstParts
+            self.elementCstrMap[secondRoot] = firstRoot
+            components.pop(secondRoot,None)
+            components[firstRoot] = firstParts
+        for part,n in secondParts.items():
+            firstParts[part] = firstParts.get(part,0) + n
 
         if res is _DummyCstrList:
             self.reportRedundancy(count=len(res), limit=limit)
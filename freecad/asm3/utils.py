@@ -5,8 +5,8 @@ Most of the functions are borrowed directly from assembly2lib.py or lib3D.py in
 assembly2
 '''
 
-import math
-from collections import namedtuple, defaultdict
+import math, threading
+from collections import namedtuple, defaultdict, OrderedDict
 import FreeCAD, FreeCADGui, Part, Draft
 import numpy as np
 from .FCADLogger import FCADLogger
@@ -249,7 +249,131 @@ def getElement(shape, element):
     if res and not res.isNull():
         return res
 
+# Kind: 'Vertex', 'Edge' or 'Face', the type of the element used for geometry
+#       deduction, or None if the shape is not a single element
+# Shape: the resolved shape of the element
+# Values: memo of the deduced geometry properties, e.g. position, rotation,
+#         radius and planarity, keyed by the property name and arguments
+ElementFeature = namedtuple('ElementFeature',('Kind','Shape','Values'))
+
+_ElementFeatures = OrderedDict()
+_ElementFeatureCacheSize = 4096
+# temporary lower bound of the cache size, set for the latest prefetched batch
+_ElementFeatureCacheFloor = 0
+_ElementFeatureLock = threading.Lock()
+
+def clearElementFeatureCache():
+    '''Release the cached features and shapes, called on document close and
+    undo/redo along with assembly.clearElementShapeCache()'''
+    with _ElementFeatureLock:
+        _ElementFeatures.clear()
+
+def getElementFeature(obj):
+    '''Return the cached ElementFeature of an element
+
+       obj: either a shape or a tuple(obj,subname)
+
+    The feature is keyed by the hash code and orientation of the resolved
+    shape, so that it is invalidated once the element geometry changes.
+    '''
+    shape = getElementShape(obj)
+    if not shape:
+        return
+    key = (shape.hashCode(),shape.Orientation)
+    with _ElementFeatureLock:
+        entry = _ElementFeatures.pop(key,None)
+        if entry and entry.Shape.isEqual(shape):
+            _ElementFeatures[key] = entry
+            return entry
+    if getElementShape(shape,Part.Vertex):
+        kind = 'Vertex'
+    elif getElementShape(shape,Part.Face):
+        kind = 'Face'
+    elif getElementShape(shape,Part.Edge):
+        kind = 'Edge'
+    else:
+        kind = None
+    entry = ElementFeature(kind,shape,{})
+    with _ElementFeatureLock:
+        _ElementFeatures[key] = entry
+        limit = max(_ElementFeatureCacheSize,_ElementFeatureCacheFloor)
+        while len(_ElementFeatures) > limit:
+            _ElementFeatures.popitem(False)
+    return entry
+
+def _prefetchElementFeature(feature):
+    try:
+        getElementPos(feature.Shape)
+        getElementRotation(feature.Shape)
+        if feature.Kind == 'Face':
+            isPlanar(feature.Shape)
+        elif feature.Kind == 'Edge':
+            isLinearEdge(feature.Shape)
+    except Exception:
+        # leave it to the caller to report the error when queried again
+        pass
+
+def prefetchElementFeatures(shapes,threads=None):
+    '''Classify a batch of element shapes ahead of time
+
+       shapes: list of element shapes, e.g. ElementInfo.Shape
+       threads: number of worker threads, default to parameter SolverThreads
+
+    The position, rotation and type predicates of each distinct shape are
+    computed in a thread pool and stored in the element feature cache, so
+    that the following serial queries become cache lookups.
+    '''
+    features = OrderedDict()
+    for shape in shapes:
+        feature = getElementFeature(shape)
+        if feature and feature.Kind:
+            features[id(feature)] = feature
+    features = list(features.values())
+
+    # Make sure the batch is not evicted by itself before the serial queries
+    # following this call. The floor only lasts until the next batch, so the
+    # cache shrinks back once a smaller assembly is processed.
+    global _ElementFeatureCacheFloor
+    _ElementFeatureCacheFloor = 2*len(features)
+
+    if threads is None:
+        threads = FreeCAD.ParamGet('User parameter:BaseApp/Preferences/'
+                'Mod/Assembly3').GetInt('SolverThreads',0)
+    if threads <= 1 or len(features) < 2:
+        for feature in features:
+            _prefetchElementFeature(feature)
+        return
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(threads,len(features)))
+    try:
+        pool.map(_prefetchElementFeature,features)
+    finally:
+        pool.close()
+        pool.join()
+
+def _copyFeatureValue(v):
+    if isinstance(v,FreeCAD.Vector):
+        return FreeCAD.Vector(v)
+    if isinstance(v,FreeCAD.Rotation):
+        return FreeCAD.Rotation(v)
+    if isinstance(v,list):
+        return [ _copyFeatureValue(o) for o in v ]
+    return v
+
+def _getFeatureValue(obj,key,func,*args):
+    feature = getElementFeature(obj)
+    if not feature:
+        return func(obj,*args)
+    try:
+        v = feature.Values[key]
+    except KeyError:
+        v = feature.Values[key] = func(feature.Shape,*args)
+    return _copyFeatureValue(v)
+
 def isPlanar(obj):
+    return _getFeatureValue(obj,'Planar',_isPlanar)
+
+def _isPlanar(obj):
     if isCircularEdge(obj):
         return True
     shape = getElementShape(obj,Part.Face)
@@ -258,6 +382,9 @@ def isPlanar(obj):
     return not isCylindricalPlane(shape)
 
 def isCylindricalPlane(obj):
+    return _getFeatureValue(obj,'Cylindrical',_isCylindricalPlane)
+
+def _isCylindricalPlane(obj):
     face = getElementShape(obj,Part.Face)
     if not face:
         return False
@@ -273,6 +400,9 @@ def isCylindricalPlane(obj):
         return error_normalized < 10**-6
 
 def isAxisOfPlane(obj):
+    return _getFeatureValue(obj,'AxisOfPlane',_isAxisOfPlane)
+
+def _isAxisOfPlane(obj):
     face = getElementShape(obj,Part.Face)
     if not face:
         return False
@@ -284,6 +414,9 @@ def isAxisOfPlane(obj):
         return error_normalized < 10**-6
 
 def isCircularEdge(obj):
+    return _getFeatureValue(obj,'Circular',_isCircularEdge)
+
+def _isCircularEdge(obj):
     edge = getElementShape(obj,Part.Edge)
     if not edge:
         return False
@@ -306,6 +439,9 @@ def isCircularEdge(obj):
         return False
 
 def isLinearEdge(obj):
+    return _getFeatureValue(obj,'Linear',_isLinearEdge)
+
+def _isLinearEdge(obj):
     edge = getElementShape(obj,Part.Edge)
     if not edge:
         return False
@@ -328,7 +464,8 @@ def isLinearEdge(obj):
         return False
 
 def isVertex(obj):
-    return getElementShape(obj,Part.Vertex) is not None
+    feature = getElementFeature(obj)
+    return feature is not None and feature.Kind == 'Vertex'
 
 def hasCenter(_obj):
     # Any shape has no center?
@@ -360,6 +497,9 @@ def getElementLinePoints(obj):
     return (p0, p1)
 
 def getElementPos(obj):
+    return _getFeatureValue(obj,'Pos',_getElementPos)
+
+def _getElementPos(obj):
     vertex = getElementShape(obj,Part.Vertex)
     if vertex:
         return vertex.Point
@@ -420,26 +560,29 @@ def getEdgeRotation(edge, reverse=False):
 
     pla = edge.Placement
     edge.Placement = FreeCAD.Placement()
-    curve = edge.Curve
-    if isLine(curve):
-        axis = curve.tangent(0)[0]
-    elif hasattr(curve, 'Axis'): #circular curve
-        axis =  curve.Axis
-    else:
-        axis = None
-        BSpline = curve.toBSpline()
-        arcs = BSpline.toBiArcs(10**-6)
-        if all( hasattr(a,'Center') for a in arcs ):
-            centers = np.array([a.Center for a in arcs])
-            sigma = np.std( centers, axis=0 )
-            if max(sigma) < 10**-6: #then circular curve
-                axis = arcs[0].Axis
-        elif all(isLine(a) for a in arcs):
-            lines = arcs
-            D = np.array(
-                    [L.tangent(0)[0] for L in lines]) #D(irections)
-            if np.std( D, axis=0 ).max() < 10**-9: #then linear curve
-                axis = FreeCAD.Vector(*D[0])
+    try:
+        curve = edge.Curve
+        if isLine(curve):
+            axis = curve.tangent(0)[0]
+        elif hasattr(curve, 'Axis'): #circular curve
+            axis =  curve.Axis
+        else:
+            axis = None
+            BSpline = curve.toBSpline()
+            arcs = BSpline.toBiArcs(10**-6)
+            if all( hasattr(a,'Center') for a in arcs ):
+                centers = np.array([a.Center for a in arcs])
+                sigma = np.std( centers, axis=0 )
+                if max(sigma) < 10**-6: #then circular curve
+                    axis = arcs[0].Axis
+            elif all(isLine(a) for a in arcs):
+                lines = arcs
+                D = np.array(
+                        [L.tangent(0)[0] for L in lines]) #D(irections)
+                if np.std( D, axis=0 ).max() < 10**-9: #then linear curve
+                    axis = FreeCAD.Vector(*D[0])
+    finally:
+        edge.Placement = pla
     if not axis:
         rot = FreeCAD.Rotation()
     else:
@@ -447,6 +590,10 @@ def getEdgeRotation(edge, reverse=False):
     return pla.Rotation * rot
 
 def getElementRotation(obj,reverse=False):
+    return _getFeatureValue(obj,('Rotation',reverse),
+            _getElementRotation,reverse)
+
+def _getElementRotation(obj,reverse=False):
     axis = None
     face = getElementShape(obj,Part.Face)
     if not face:
@@ -481,24 +628,27 @@ def getElementRotation(obj,reverse=False):
 
         pla = face.Placement
         face.Placement = FreeCAD.Placement()
-        surface = face.Surface
-        if hasattr(surface,'Axis'):
-            axis = surface.Axis
-        else:
-            pln = face.findPlane()
-            if pln:
-                axis = pln.Axis
-        if not axis:
-            # numerically approximating surface
-            axis_fitted, _center, error = \
-                    fit_rotation_axis_to_surface1(face.Surface)
-            error_normalized = error / face.BoundBox.DiagonalLength
-            if error_normalized < 10**-6: #then good rotation_axis fix
-                axis = FreeCAD.Vector(axis_fitted)
+        try:
+            surface = face.Surface
+            if hasattr(surface,'Axis'):
+                axis = surface.Axis
+            else:
+                pln = face.findPlane()
+                if pln:
+                    axis = pln.Axis
             if not axis:
-                # use the normal direction of the projected bound center
-                param = surface.parameter(face.BoundBox.Center)
-                axis = surface.normal(*param)
+                # numerically approximating surface
+                axis_fitted, _center, error = \
+                        fit_rotation_axis_to_surface1(face.Surface)
+                error_normalized = error / face.BoundBox.DiagonalLength
+                if error_normalized < 10**-6: #then good rotation_axis fix
+                    axis = FreeCAD.Vector(axis_fitted)
+                if not axis:
+                    # use the normal direction of the projected bound center
+                    param = surface.parameter(face.BoundBox.Center)
+                    axis = surface.normal(*param)
+        finally:
+            face.Placement = pla
         rot = FreeCAD.Rotation(FreeCAD.Vector(0,0,-1 if reverse else 1),axis)
         return pla.Rotation * rot
 
@@ -549,6 +699,9 @@ def getElementsAngle(o1,o2,pla1=None,pla2=None,proj=None):
 
 def getElementCircular(obj,radius=False):
     'return radius if it is closed, or a list of two endpoints'
+    return _getFeatureValue(obj,('Radius',radius),_getElementCircular,radius)
+
+def _getElementCircular(obj,radius=False):
     edge = getElementShape(obj,Part.Edge)
     if not edge:
         return
@@ -570,76 +723,127 @@ def getElementCircular(obj,radius=False):
             return arc[0].Radius
     return [v.Point for v in edge.Vertexes]
 
+def _surfaceRange(surface):
+    'return the finite parameter range (u0,u1,v0,v1) of a surface'
+    try:
+        bounds = list(surface.bounds())
+    except Exception:
+        return 0.,1.,0.,1.
+    for i in (0,2):
+        if max(abs(bounds[i]),abs(bounds[i+1])) > 1e99:
+            bounds[i],bounds[i+1] = 0.,1.
+    return bounds
+
+def _sampleSurface(surface,n_u,n_v,samples=None):
+    '''Sample positions and unit normals on a n_u x n_v parameter grid
+
+    samples: optional dictionary (u,v) -> (position,normal) for reusing the
+             samples of a coarser grid
+
+    Return two (n,3) arrays of the positions and normals. Samples at
+    degenerated points are skipped.
+    '''
+    u0,u1,v0,v1 = _surfaceRange(surface)
+    if samples is None:
+        samples = {}
+    P = []
+    N = []
+    for v in np.linspace(v0,v1,n_v):
+        for u in np.linspace(u0,u1,n_u):
+            key = (u,v)
+            sample = samples.get(key,None)
+            if sample is None:
+                try:
+                    sample = (tuple(surface.value(u,v)),
+                              np.cross(*surface.tangent(u,v)))
+                except Exception:
+                    sample = ()
+                samples[key] = sample
+            if sample:
+                P.append(sample[0])
+                N.append(sample[1])
+    P = np.array(P,dtype=float).reshape(-1,3)
+    N = np.array(N,dtype=float).reshape(-1,3)
+    norm = np.linalg.norm(N,axis=1)
+    valid = norm > 1e-12
+    return P[valid],N[valid]/norm[valid,None]
+
 def fit_plane_to_surface1( surface, n_u=3, n_v=3 ):
     'borrowed from assembly2 lib3D.py'
-    uv = sum( [ [ (u,v) for u in np.linspace(0,1,n_u)]
-        for v in np.linspace(0,1,n_v) ], [] )
-    # positions at u,v points
-    P = [ surface.value(u,v) for u,v in uv ]
-    N = [ np.cross( *surface.tangent(u,v) ) for u,v in uv ]
+    P,N = _sampleSurface(surface,n_u,n_v)
+    if not len(P):
+        return 0, 0, np.inf
     # plane's normal, averaging done to reduce error
-    plane_norm = sum(N) / len(N)
+    plane_norm = N.mean(axis=0)
     plane_pos = P[0]
-    error = sum([ abs( np.dot(p - plane_pos, plane_norm) ) for p in P ])
+    error = np.abs(np.dot(P-plane_pos,plane_norm)).sum()
     return plane_norm, plane_pos, error
 
-def fit_rotation_axis_to_surface1( surface, n_u=3, n_v=3 ):
+def _fit_rotation_axis(P,N):
+    '''Fit an axis to the closest points of all pairs of surface normals
+
+    P, N: (n,3) arrays of the positions and unit normals
+
+    Return (axis_dir,axis_pos,error,count) or None if there is not enough
+    non parallel normals, where count is the number of intersection points.
+    '''
+    i,j = np.triu_indices(len(P),1)
+    dot = np.einsum('ij,ij->i',N[i],N[j])
+    # ignore parallel case
+    mask = 1 - np.abs(dot) >= 10**-6
+    if not mask.any():
+        return
+    i,j,dot = i[mask],j[mask],dot[mask]
+    # closest points of the lines p1 + t1*u1 and p2 + t2*u2, solved for all
+    # pairs at once using the closed form of the 2x2 linear system
+    d = P[i] - P[j]
+    du1 = np.einsum('ij,ij->i',d,N[i])
+    du2 = np.einsum('ij,ij->i',d,N[j])
+    det = 1 - dot*dot
+    t1 = (dot*du2 - du1)/det
+    t2 = (du2 - dot*du1)/det
+    X = np.concatenate((P[i]+N[i]*t1[:,None], P[j]+N[j]*t2[:,None]))
+    # fit vector to intersection points;
+    # http://mathforum.org/library/drmath/view/69103.html
+    centroid = X.mean(axis=0)
+    M = X - centroid
+    # np docs: s : (..., K) The singular values for every matrix,
+    # sorted in descending order.
+    _U,s,V = np.linalg.svd(np.dot(M.T,M))
+    return V[0], centroid, s[1], len(X)
+
+def fit_rotation_axis_to_surface1( surface, n_u=3, n_v=3, max_level=3 ):
     '''
     should work for cylinders and pssibly cones (depending on the u,v mapping)
 
+    The sample grid is refined (n -> 2n-1) up to max_level times until the
+    fitting error stabilises. The error is the second singular value of the
+    scattering of the normal intersection points, scaled to the number of
+    intersections of the initial grid.
+
     borrowed from assembly2 lib3D.py
     '''
-    uv = sum( [ [ (u,v) for u in np.linspace(0,1,n_u)]
-        for v in np.linspace(0,1,n_v) ], [] )
-    # positions at u,v points
-    P = [ np.array(surface.value(u,v)) for u,v in uv ]
-    N = [ np.cross( *surface.tangent(u,v) ) for u,v in uv ]
-    intersections = []
-    for i in range(len(N)-1):
-        for j in range(i+1,len(N)):
-            # based on the distance_between_axes( p1, u1, p2, u2) function,
-            if 1 - abs(np.dot( N[i], N[j])) < 10**-6:
-                continue #ignore parallel case
-            p1_x, p1_y, p1_z = P[i]
-            u1_x, u1_y, u1_z = N[i]
-            p2_x, p2_y, p2_z = P[j]
-            u2_x, u2_y, u2_z = N[j]
-            t1_t1_coef = u1_x**2 + u1_y**2 + u1_z**2 #should equal 1
-            # collect( expand(d_sqrd), [t1*t2] )
-            t1_t2_coef = -2*u1_x*u2_x - 2*u1_y*u2_y - 2*u1_z*u2_z
-            t2_t2_coef = u2_x**2 + u2_y**2 + u2_z**2 #should equal 1 too
-            t1_coef    = 2*p1_x*u1_x + 2*p1_y*u1_y + 2*p1_z*u1_z - \
-                    2*p2_x*u1_x - 2*p2_y*u1_y - 2*p2_z*u1_z
-            t2_coef    =-2*p1_x*u2_x - 2*p1_y*u2_y - 2*p1_z*u2_z + \
-                    2*p2_x*u2_x + 2*p2_y*u2_y + 2*p2_z*u2_z
-            A = np.array([ [ 2*t1_t1_coef , t1_t2_coef ],
-                [ t1_t2_coef, 2*t2_t2_coef ] ])
-            b = np.array([ t1_coef, t2_coef])
-            try:
-                t1, t2 = np.linalg.solve(A,-b)
-            except np.linalg.LinAlgError:
-                continue
-            pos_t1 = P[i] + np.array(N[i])*t1
-            pos_t2 = P[j] + N[j]*t2
-            intersections.append( pos_t1 )
-            intersections.append( pos_t2 )
-    if len(intersections) < 2:
-        error = np.inf
-        return 0, 0, error
-    else: 
-        # fit vector to intersection points; 
-        # http://mathforum.org/library/drmath/view/69103.html
-        X = np.array(intersections)
-        centroid = np.mean(X,axis=0)
-        M = np.array([i - centroid for i in intersections ])
-        A = np.dot(M.transpose(), M)
-        # np docs: s : (..., K) The singular values for every matrix, 
-        # sorted in descending order.
-        _U,s,V = np.linalg.svd(A)
-        axis_pos = centroid
-        axis_dir = V[0]
-        error = s[1] #don't know if this will work
-        return axis_dir, axis_pos, error
+    samples = {}
+    ret = None
+    count0 = None
+    for _level in range(max_level):
+        P,N = _sampleSurface(surface,n_u,n_v,samples)
+        res = _fit_rotation_axis(P,N) if len(P) > 1 else None
+        if res:
+            axis_dir,axis_pos,error,count = res
+            if count0 is None:
+                count0 = count
+            error *= float(count0)/count
+            scale = max(np.ptp(P,axis=0).max(),1.0)
+            if error <= 1e-12*scale*scale or \
+                    (ret and abs(error-ret[2]) <= 0.1*ret[2]):
+                return axis_dir, axis_pos, error
+            ret = (axis_dir,axis_pos,error)
+        n_u = 2*n_u - 1
+        n_v = 2*n_v - 1
+    if not ret:
+        return 0, 0, np.inf
+    return ret
 
 _tol = 10e-7
 
@@ -0,0 +1,13 @@
+'''
+Regression tests of Assembly3
+
+The tests require FreeCAD, and are skipped if it cannot be imported. Run them
+from the repository root with the FreeCAD lib directory in PYTHONPATH,
+
+    python -m unittest discover -s tests -t .
+
+or with FreeCADCmd,
+
+    FreeCADCmd -c "import unittest; unittest.main(module=None, \\
+        argv=['asm3','discover','-s','tests','-t','.'])"
+'''
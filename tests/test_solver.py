@@ -0,0 +1,124 @@
+import random, unittest
+try:
+    import FreeCAD
+except ImportError:
+    raise unittest.SkipTest('FreeCAD is not available')
+from freecad.asm3 import benchmark
+
+def setUpModule():
+    benchmark.setup()
+
+class AssemblyTestCase(unittest.TestCase):
+    '''Base class of the tests running on a new document with an assembly'''
+
+    def setUp(self):
+        from freecad.asm3.assembly import Assembly
+        from freecad.asm3.system import System
+        backends = benchmark.getBackends()
+        if not backends:
+            self.skipTest('no solver backend')
+        self.doc = FreeCAD.newDocument('Asm3Test')
+        self.assembly = Assembly.make(self.doc,undo=False)
+        System.setTypeName(self.assembly,backends[0])
+        self.partGroup = self.assembly.Proxy.getPartGroup()
+
+    def tearDown(self):
+        FreeCAD.closeDocument(self.doc.Name)
+
+    def addBoxes(self,count):
+        return [ benchmark._addBox(self.partGroup) for _ in range(count) ]
+
+    def stack(self,lower,upper,**props):
+        return benchmark._addConstraint(self.assembly,'PlaneCoincident',
+                [(lower,'Face6'),(upper,'Face5')],**props)
+
+    def chain(self,count,**props):
+        boxes = self.addBoxes(count)
+        benchmark._lock(self.assembly,boxes[0])
+        for lower,upper in zip(boxes,boxes[1:]):
+            self.stack(lower,upper,**props)
+        return boxes
+
+    def makeSolver(self):
+        from freecad.asm3 import solver
+        self.doc.recompute()
+        return solver.Solver(self.assembly,False,None,False,None,deferred=True)
+
+    def assertStacked(self,lower,upper,places=6):
+        f1 = lower.Shape.Faces[5]
+        f2 = upper.Shape.Faces[4]
+        n = f1.normalAt(0,0)
+        self.assertAlmostEqual(n.cross(f2.normalAt(0,0)).Length,0,places)
+        self.assertAlmostEqual((f2.CenterOfMass-f1.CenterOfMass).dot(n),
+                0,places)
+
+class TestClusters(AssemblyTestCase):
+    def testIndependentChains(self):
+        a = self.chain(3)
+        b = self.chain(4)
+        solver = self.makeSolver()
+        self.assertEqual(len(solver._groups),2)
+        groups = solver._partGroups
+        self.assertNotIn(a[0],groups)
+        self.assertNotIn(b[0],groups)
+        self.assertEqual(set(groups[p] for p in a[1:]),set([groups[a[1]]]))
+        self.assertEqual(set(groups[p] for p in b[1:]),set([groups[b[1]]]))
+        self.assertNotEqual(groups[a[1]],groups[b[1]])
+
+    def testJoinedChains(self):
+        a = self.chain(3)
+        b = self.chain(3)
+        benchmark._addConstraint(self.assembly,'PlaneCoincident',
+                [(a[-1],'Face2'),(b[-1],'Face1')])
+        solver = self.makeSolver()
+        self.assertEqual(len(solver._groups),1)
+
+    def testFixedPartSplits(self):
+        # a fixed part in the middle of a chain separates the two ends
+        boxes = self.chain(5)
+        benchmark._lock(self.assembly,boxes[2])
+        solver = self.makeSolver()
+        groups = solver._partGroups
+        self.assertEqual(len(solver._groups),2)
+        self.assertIn(boxes[1],groups)
+        self.assertEqual(groups[boxes[3]],groups[boxes[4]])
+        self.assertNotEqual(groups[boxes[1]],groups[boxes[3]])
+
+    def testSolve(self):
+        from freecad.asm3 import solver
+        chains = [ self.chain(3), self.chain(4) ]
+        for boxes in chains:
+            benchmark._perturb(boxes[1:],random.Random(0),5.0)
+        self.doc.recompute()
+        solver.solve(self.assembly)
+        for boxes in chains:
+            for lower,upper in zip(boxes,boxes[1:]):
+                self.assertStacked(lower,upper,4)
+
+class TestRigidPropagation(AssemblyTestCase):
+    def testChain(self):
+        from freecad.asm3.constraint import Constraint
+        boxes = self.addBoxes(6)
+        benchmark._lock(self.assembly,boxes[0])
+        # add the constraints from the free end, so that each pass of the
+        # propagation can only fix one more part
+        pairs = list(zip(boxes,boxes[1:]))
+        for lower,upper in reversed(pairs):
+            self.stack(lower,upper,LockAngle=True)
+        benchmark._perturb(boxes[1:],random.Random(0),5.0)
+
+        solver = self.makeSolver()
+        self.assertTrue(set(boxes) <= solver._fixedParts)
+        self.assertEqual([Constraint.getType(c).__name__
+                            for c in solver._cstrs],['Locked'])
+        for lower,upper in pairs:
+            self.assertStacked(lower,upper)
+
+    def testUnlockedAngle(self):
+        boxes = self.chain(3)
+        solver = self.makeSolver()
+        self.assertEqual(solver._fixedParts & set(boxes),set([boxes[0]]))
+        self.assertEqual(len(solver._cstrs),3)
+
+if __name__ == '__main__':
+    unittest.main()
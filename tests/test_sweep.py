@@ -0,0 +1,73 @@
+import os, json, shutil, tempfile, unittest
+try:
+    import FreeCAD
+except ImportError:
+    raise unittest.SkipTest('FreeCAD is not available')
+import numpy as np
+from freecad.asm3 import sweep
+
+class _Quantity(object):
+    def __init__(self,value):
+        self.Value = value
+
+class TestMakeRange(unittest.TestCase):
+    def testEnds(self):
+        values = sweep.makeRange(0,360,361)
+        self.assertEqual(len(values),361)
+        self.assertEqual(values[0],0)
+        self.assertAlmostEqual(values[-1],360)
+        self.assertAlmostEqual(values[1],1)
+
+    def testReversed(self):
+        self.assertEqual(sweep.makeRange(1,-1,3),[1,0,-1])
+
+    def testSingleStep(self):
+        self.assertEqual(sweep.makeRange(2,5,1),[2.0])
+        self.assertEqual(sweep.makeRange(2,5,0),[2.0])
+
+class TestExportTrajectory(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.names = ['Box','Box001']
+        self.values = [_Quantity(0.0),_Quantity(0.5),1.0]
+        rng = np.random.RandomState(0)
+        self.placements = rng.uniform(-1,1,(3,2,7))
+        self.placements[1,1] = np.nan
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def export(self,ext):
+        path = os.path.join(self.dir,'poses'+ext)
+        sweep.exportTrajectory(path,self.names,self.values,self.placements)
+        return path
+
+    def testNpz(self):
+        data = np.load(self.export('.npz'))
+        self.assertEqual(list(data['names']),self.names)
+        self.assertEqual(list(data['values']),[0.0,0.5,1.0])
+        np.testing.assert_array_equal(data['placements'],self.placements)
+
+    def testCsv(self):
+        with open(self.export('.csv')) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0],'step,value,part,x,y,z,qw,qx,qy,qz')
+        self.assertEqual(len(lines),1+3*2)
+        row = lines[1+1*2+1].split(',')
+        self.assertEqual(row[:3],['1','0.5','Box001'])
+        self.assertTrue(all(np.isnan(float(v)) for v in row[3:]))
+        row = lines[1].split(',')
+        np.testing.assert_array_equal([float(v) for v in row[3:]],
+                self.placements[0,0])
+
+    def testJson(self):
+        with open(self.export('.json')) as f:
+            data = json.load(f)
+        self.assertEqual(list(data),['names','values','placements'])
+        self.assertEqual(data['names'],self.names)
+        self.assertEqual(data['values'],[0.0,0.5,1.0])
+        np.testing.assert_array_equal(np.array(data['placements'],
+            dtype=float),self.placements)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from collections import namedtuple
+try:
+    import FreeCAD
+except ImportError:
+    raise unittest.SkipTest('FreeCAD is not available')
+import numpy as np
+from freecad.asm3 import sys_numpy
+
+_Parent = namedtuple('Parent',('log','verbose'))
+
+class TestJacobian(unittest.TestCase):
+    '''Check the analytic Jacobian of the batched kernels against central
+    finite differences'''
+
+    def setUp(self):
+        self.rng = np.random.RandomState(1)
+        s = sys_numpy._SystemNumPy(_Parent(lambda *_args: None,False))
+        # the handles of the transformed entities are created in a group
+        # other than the solving group 1 and the fixed group 2
+        s.GroupHandle = 5
+        self.system = s
+
+    def quaternion(self):
+        q = self.rng.normal(size=4)
+        return q/np.linalg.norm(q)
+
+    def part(self,group):
+        return [ self.system.addParamV(v,group) for v in
+                    list(self.rng.normal(size=3))+list(self.quaternion()) ]
+
+    def point(self,params):
+        s = self.system
+        return s.addTransform(s.addPoint3dV(*self.rng.normal(size=3)),
+                *params,group=2)
+
+    def normal(self,params):
+        s = self.system
+        return s.addTransform(s.addNormal3dV(*self.quaternion()),
+                *params,group=2)
+
+    def checkJacobian(self,group=1):
+        ctx = sys_numpy._Context(self.system,group)
+        x = ctx.x0 + self.rng.normal(size=ctx.nvar)*0.1
+        r,J = ctx.evaluate(x)
+        self.assertEqual(J.shape,(len(r),ctx.nvar))
+        h = 1e-6
+        Jn = np.zeros_like(J)
+        for i in range(ctx.nvar):
+            d = np.zeros_like(x)
+            d[i] = h
+            Jn[:,i] = (ctx.evaluate(x+d)[0]-ctx.evaluate(x-d)[0])/(2*h)
+        offset = 0
+        for (cls,_,_),e in zip(ctx.batches,ctx.residuals(x)):
+            n = e.V.size
+            np.testing.assert_allclose(J[offset:offset+n],Jn[offset:offset+n],
+                    rtol=1e-5,atol=1e-6,err_msg=cls.__name__)
+            offset += n
+        self.assertEqual(offset,len(r))
+
+    def testPlacements(self):
+        s = self.system
+        a = self.part(1)
+        s.addNormal3d(*a[3:],group=1)
+        b = self.part(1)
+        f = self.part(2)
+        s.addPointsCoincident(self.point(a),self.point(f),group=1)
+        s.addSameOrientation(self.normal(a),self.normal(b),group=1)
+        s.addPointsDistance(1.2,self.point(a),self.point(b),group=1)
+        self.checkJacobian()
+
+    def testConstraints(self):
+        s = self.system
+        A = self.part(1)
+        B = self.part(1)
+        F = self.part(2)
+        a1,a2,a3 = [ self.point(A) for _ in range(3) ]
+        b1,b2,b3 = [ self.point(B) for _ in range(3) ]
+        f1,f2 = [ self.point(F) for _ in range(2) ]
+        na,nb,nf = self.normal(A),self.normal(B),self.normal(F)
+        la = s.addLineSegment(a1,a2)
+        lf = s.addLineSegment(f1,f2)
+        wf = s.addWorkplane(f1,nf)
+        wa = s.addWorkplane(a1,na)
+        circle = s.addCircle(b1,nb,s.addDistanceV(0.7))
+        arc = s.addArcOfCircle(wa,a1,a2,a3)
+        s.addNormal3d(*A[3:],group=1)
+        s.addPointsCoincident(a1,b1,group=1)
+        s.addPointsCoincident(a2,f1,wf,group=1)
+        s.addPointInPlane(a3,wf,group=1)
+        s.addPointPlaneDistance(0.3,b2,wf,group=1)
+        s.addPointOnLine(b3,la,group=1)
+        s.addPointOnLine(b3,lf,wf,group=1)
+        s.addPointLineDistance(0.5,b2,lf,group=1)
+        s.addPointLineDistance(0.5,b2,lf,wf,group=1)
+        s.addPointsDistance(1.2,a1,b3,group=1)
+        s.addPointsDistance(1.2,a1,b3,wf,group=1)
+        s.addParallel(na,nb,group=1)
+        s.addParallel(la,nf,wf,group=1)
+        s.addPerpendicular(la,nb,group=1)
+        s.addAngle(30,True,nb,lf,group=1)
+        s.addAngle(30,False,nb,lf,wf,group=1)
+        s.addSameOrientation(na,nb,group=1)
+        s.addPointOnCircle(a3,circle,group=1)
+        s.addSymmetric(a1,b1,wf,group=1)
+        s.addPointsHorizontal(a1,b1,wf,group=1)
+        s.addPointsVertical(a1,b1,group=1)
+        s.addMidPoint(a1,la,wf,group=1)
+        s.addEqualLength(la,lf,group=1)
+        s.addEqualRadius(circle,arc,group=1)
+        s.addDiameter(2,arc,group=1)
+        s.addPointsProjectDistance(0.2,a1,b1,lf,group=1)
+        s.addLengthRatio(2,la,lf,group=1)
+        self.checkJacobian()
+
+    def testSolve(self):
+        s = self.system
+        b = self.part(1)
+        f = [ s.addParamV(v,2) for v in (0,0,0,1,0,0,0) ]
+        s.addNormal3d(*b[3:],group=1)
+        pb,pf = self.point(b),self.point(f)
+        nb,nf = self.normal(b),self.normal(f)
+        s.addPointsCoincident(pb,pf,group=1)
+        s.addSameOrientation(nb,nf,group=1)
+        s.solve(1)
+        ctx = sys_numpy._Context(s,1)
+        r,_ = ctx.evaluate(ctx.x0)
+        self.assertLess(np.abs(r).max(),1e-6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+try:
+    import FreeCAD
+except ImportError:
+    raise unittest.SkipTest('FreeCAD is not available')
+import Part
+import numpy as np
+from freecad.asm3 import utils
+
+class TestAxisFit(unittest.TestCase):
+    '''Check the vectorized rotation axis fitting against analytic
+    cylinders'''
+
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+    def randomAxis(self):
+        d = self.rng.normal(size=3)
+        return self.rng.uniform(-50,50,3), d/np.linalg.norm(d)
+
+    def checkAxis(self,res,pos,axis,tol=1e-6):
+        axis_dir,axis_pos,error = res
+        axis_dir = np.asarray(axis_dir,dtype=float)
+        self.assertAlmostEqual(np.linalg.norm(axis_dir),1.0)
+        self.assertLess(np.linalg.norm(np.cross(axis_dir,axis)),tol)
+        self.assertLess(np.linalg.norm(np.cross(axis_pos-pos,axis)),tol)
+        self.assertLess(error,tol)
+
+    def testAnalyticSamples(self):
+        for radius in (0.5,3.0,200.0):
+            pos,axis = self.randomAxis()
+            x = np.cross(axis,[1,0,0])
+            if np.linalg.norm(x) < 0.1:
+                x = np.cross(axis,[0,1,0])
+            x /= np.linalg.norm(x)
+            y = np.cross(axis,x)
+            angles = np.linspace(0,np.pi,7)
+            heights = np.linspace(-10,10,3)
+            a,h = [ v.ravel() for v in np.meshgrid(angles,heights) ]
+            N = np.outer(np.cos(a),x) + np.outer(np.sin(a),y)
+            P = pos + radius*N + np.outer(h,axis)
+            axis_dir,axis_pos,error,count = utils._fit_rotation_axis(P,N)
+            self.assertEqual(count%2,0)
+            self.checkAxis((axis_dir,axis_pos,error),pos,axis)
+
+    def testParallelNormals(self):
+        P = self.rng.normal(size=(5,3))
+        N = np.tile([0.,0.,1.],(5,1))
+        self.assertIsNone(utils._fit_rotation_axis(P,N))
+
+    def testCylinder(self):
+        for radius in (1.0,25.0):
+            pos,axis = self.randomAxis()
+            face = Part.makeCylinder(radius,40,FreeCAD.Vector(*pos),
+                    FreeCAD.Vector(*axis)).Faces[0]
+            self.checkAxis(utils.fit_rotation_axis_to_surface1(face.Surface),
+                    pos,axis)
+
+    def testSplineCylinder(self):
+        pos,axis = self.randomAxis()
+        face = Part.makeCylinder(5,40,FreeCAD.Vector(*pos),
+                FreeCAD.Vector(*axis)).Faces[0]
+        surface = face.toNurbs().Faces[0].Surface
+        self.checkAxis(utils.fit_rotation_axis_to_surface1(surface),pos,axis)
+
+    def testPlane(self):
+        face = Part.makePlane(10,10)
+        self.assertEqual(utils.fit_rotation_axis_to_surface1(face.Surface)[2],
+                np.inf)
+
+if __name__ == '__main__':
+    unittest.main()